@@ -0,0 +1,184 @@
+import os
+import sys
+import random
+import cPickle
+from time import time
+
+import numpy.random
+
+from simulator.Event import Event
+from simulator.EventQueue import EventQueue
+
+MAGIC = "PR-SIM checkpoint 1\n"
+# event types generated by the units(not added by the handler), the
+# openers(failures) and their closers(recoveries).
+GENERATED_TYPES = (Event.EventType.Failure.value,
+                   Event.EventType.Recovered.value,
+                   Event.EventType.EagerRecoveryStart.value,
+                   Event.EventType.LatentDefect.value,
+                   Event.EventType.LatentRecovered.value)
+CLOSERS = {Event.EventType.Failure.value: Event.EventType.Recovered.value,
+           Event.EventType.LatentDefect.value:
+           Event.EventType.LatentRecovered.value}
+
+
+class Checkpoint(object):
+    """
+    State of one Test iteration during the simulation: the units, the events
+    left in the queue, the handler with its slice state and counters, the
+    results summed up so far and the runner position(iteration, results of
+    the iterations before). save() pickles it to a binary file together with
+    the states of the random and numpy.random modules and the class level
+    event count, load() restores all of them, and the iteration goes on as
+    if it was never stopped.
+    """
+
+    def __init__(self, root, xml, stream_seed=None):
+        self.root = root
+        self.xml = xml
+        self.stream_seed = stream_seed
+        # layer being simulated, its queue and handler. handler is None
+        # before the layer starts.
+        self.layer = 1
+        self.events = None
+        self.handler = None
+        # simulated time of the next checkpoint, None if there is none.
+        self.next_time = None
+
+        self.events_handled = 0
+        self.un_available_count = 0
+        self.un_durable_count = 0
+        self.undur_unavail = []
+
+        self.iteration = 0
+        self.iteration_count = 1
+        self.results = []
+        # seeds of the forks the run went through, see fork().
+        self.fork_seeds = []
+        # simulated time of the last save() and the file it went to.
+        self.time = 0
+        self.file_name = None
+
+    def save(self, file_name, current_time):
+        self.time = current_time
+        self.file_name = file_name
+        tables = {"random": random.getstate(),
+                  "numpy.random": numpy.random.get_state(),
+                  "event_count": Event.event_count}
+        # written aside first, a crash while saving keeps the last checkpoint.
+        tmp_file = file_name + ".tmp"
+        with open(tmp_file, "wb") as fp:
+            fp.write(MAGIC)
+            cPickle.dump((self, tables), fp, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, file_name)
+
+    # Forks a new continuation, random numbers drawn after the checkpoint
+    # come from seed: those of the handler and, with random_streams, those of
+    # the units. The events of the running layer after the checkpoint are
+    # generated anew with them by Test.forkEvents(), see forkEvents().
+    def fork(self, seed):
+        random.seed(seed)
+        numpy.random.seed(seed)
+        if self.stream_seed is not None:
+            self.handler.setRandomStreams(seed)
+            self.root.setRandomStreams(seed)
+            for population in self.xml.getPopulations():
+                population.setRandomStreams(seed)
+        self.fork_seeds = self.fork_seeds + [seed]
+
+    # Replaces the events left by events, generated anew from the time of the
+    # checkpoint. Events going on with what was handled are kept: recoveries
+    # of failures handled(latent recoveries of latent defects), the events of
+    # a unit before the end of such an outage of it or of a unit above it
+    # and those added by the handler. New events of a unit before that end
+    # are dropped, with the recoveries of dropped failures.
+    def forkEvents(self, events):
+        units = self.root.getUnits()
+        left = list(self.events.iterEvents())
+
+        # closers of openers handled before the checkpoint, by position.
+        continued = set()
+        opened = {}
+        outage_ends = {}
+        for i, e in enumerate(left):
+            if e.type in CLOSERS:
+                key = (e.unit_id, CLOSERS[e.type])
+                opened[key] = opened.get(key, 0) + 1
+            elif e.type in CLOSERS.values():
+                key = (e.unit_id, e.type)
+                if opened.get(key, 0) > 0:
+                    opened[key] -= 1
+                    continue
+                continued.add(i)
+                if e.type == Event.EventType.Recovered.value and \
+                        e.unit_id not in outage_ends:
+                    outage_ends[e.unit_id] = e.time
+
+        # end of the outages of every unit and the units above it.
+        shadows = []
+        for u in units:
+            shadow = self.time
+            while u is not None:
+                shadow = max(shadow, outage_ends.get(u.getID(), shadow))
+                u = u.getParent()
+            shadows.append(shadow)
+
+        queue = EventQueue(units)
+        for i, e in enumerate(left):
+            if i in continued or e.type not in GENERATED_TYPES or \
+                    e.time < shadows[e.unit_id]:
+                queue.addEvent(e)
+
+        failed = set()
+        latent = {}
+        for e in events.iterEvents():
+            unit_id = e.unit_id
+            if unit_id in failed:
+                if e.type == Event.EventType.Recovered.value:
+                    failed.remove(unit_id)
+                continue
+            if e.type == Event.EventType.LatentRecovered.value and \
+                    latent.get(unit_id, 0) > 0:
+                latent[unit_id] -= 1
+                continue
+            if e.time < shadows[unit_id]:
+                if e.type == Event.EventType.Failure.value:
+                    failed.add(unit_id)
+                elif e.type == Event.EventType.LatentDefect.value:
+                    latent[unit_id] = latent.get(unit_id, 0) + 1
+                continue
+            queue.addEvent(e)
+        self.events = queue
+
+    @staticmethod
+    def load(file_name):
+        with open(file_name, "rb") as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise Exception(file_name + " is not a checkpoint!")
+            checkpoint, tables = cPickle.load(fp)
+        random.setstate(tables["random"])
+        numpy.random.set_state(tables["numpy.random"])
+        Event.event_count = tables["event_count"]
+        # the loaded file is never removed by the checkpoints after it.
+        checkpoint.file_name = None
+        return checkpoint
+
+    def toString(self):
+        return "iteration " + str(self.iteration + 1) + "/" + \
+            str(self.iteration_count) + ", layer " + str(self.layer) + \
+            ", time " + str(self.time) + ", events left " + \
+            str(self.events.size()) + ", events handled " + \
+            str(self.events_handled)
+
+
+# Prints what a checkpoint holds and how long it takes to load.
+def main():
+    st_time = time()
+    checkpoint = Checkpoint.load(sys.argv[1])
+    print checkpoint.toString()
+    print "loaded in %.2f seconds, %d bytes" % \
+        (time() - st_time, os.path.getsize(sys.argv[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,17 +15,22 @@ def getConfParser(conf_file_path):
 
 
 class Configuration(object):
-    # two variables are calculated by users.
+    # two variables are calculated by users, who set them on their own
+    # instance. The class values are only defaults.
     rack_count = 3
     total_slices = 0
 
-    def __init__(self):
+    # overrides are options of the default section replacing those of the
+    # conf file, i.e. {"recovery_threshold": "12"}, see simulator.test.Sweep.
+    def __init__(self, overrides=None):
         self.conf = getConfParser(CONF_PATH + os.sep + "pr-sim.conf")
+        self.overrides = {} if overrides is None else overrides
 
         try:
             d = self.conf.defaults()
         except ConfigParser.NoSectionError:
             raise Exception("No Default Section!")
+        d.update(self.overrides)
 
         self.total_time = int(d["total_time"])
         # total active storage in PBs
@@ -38,9 +43,60 @@ class Configuration(object):
         self.datacenters = int(d.pop("datacenters", 1))
 
         self.event_file = d.pop("event_file", None)
+        # 'true' means events are generated on demand during the simulation,
+        # instead of generating all of them before it starts.
+        self.stream_events = self._bool(d.pop("stream_events", "false"))
+        # 'true' means disks of one component are generated as a population,
+        # see simulator.unit.DiskPopulation.
+        self.unit_population = self._bool(d.pop("unit_population", "false"))
+        if self.stream_events and self.unit_population:
+            raise Exception("unit_population can't be used with stream_events")
+        # 'true' means every unit draws its events from random streams of its
+        # own, see simulator.utils.RandomStream.
+        self.random_streams = self._bool(d.pop("random_streams", "false"))
 
         # If n <= 15 in each stripe, no two chunks are on the same rack.
         self.num_chunks_diff_racks = 15
+        # seed of the slice placement, the same layout is used by all
+        # iterations if given, else each iteration places the slices anew.
+        self.placement_seed = d.pop("placement_seed", None)
+        if self.placement_seed is not None:
+            self.placement_seed = int(self.placement_seed)
+        # directory of the saved slice layouts, used with placement_seed.
+        self.placement_cache = d.pop("placement_cache", None)
+        # the simulation is saved to checkpoint_file every checkpoint_interval
+        # hours(of simulated time), see simulator.Checkpoint. Only the last
+        # checkpoint is kept unless checkpoint_keep is 'true'.
+        self.checkpoint_file = d.pop("checkpoint_file", None)
+        self.checkpoint_interval = float(d.pop("checkpoint_interval", 0))
+        self.checkpoint_keep = self._bool(d.pop("checkpoint_keep", "false"))
+        if self.checkpoint_file is not None and \
+                self.checkpoint_interval > 0 and self.stream_events:
+            raise Exception("Checkpoints can't be taken with stream_events")
+        # events are handled by handler_shards processes if more than 1, see
+        # simulator.eventHandler.ShardedEventHandler.
+        self.handler_shards = int(d.pop("handler_shards", 1))
+        if self.handler_shards > 1 and not self.random_streams:
+            raise Exception("handler_shards needs random_streams")
+        if self.handler_shards > 1 and self.checkpoint_file is not None and \
+                self.checkpoint_interval > 0:
+            raise Exception("Checkpoints can't be taken with handler_shards")
+        # a json summary of every iteration(times of its phases and of its
+        # events by type) is appended to profile_file if given, with the
+        # first events of every type and then every profile_sample-th one of
+        # the type timed, see simulator.utils.Profiler.
+        # Iteration profile_iteration is also traced as a whole, in
+        # profile_format('cprofile' or 'folded' stacks for flame graphs).
+        self.profile_file = d.pop("profile_file", None)
+        self.profile_sample = int(d.pop("profile_sample", 64))
+        self.profile_iteration = int(d.pop("profile_iteration", -1))
+        self.profile_format = d.pop("profile_format", "cprofile")
+        if self.profile_sample < 1:
+            raise Exception("profile_sample must be at least 1")
+        if self.profile_format not in ("cprofile", "folded"):
+            raise Exception("Unknown profile_format: " + self.profile_format)
+        if self.profile_iteration >= 0 and self.profile_file is None:
+            raise Exception("profile_iteration needs profile_file")
 
         self.tiered_storage = self._bool(d["tiered_storage"])
         self.heterogeneous_redundancy = self._bool(d[
@@ -87,48 +143,66 @@ class Configuration(object):
             raise Exception("Redundancies is not sufficient!")
 
         if self.layer_num == 1 and not self.heterogeneous_redundancy:
-            self.n = self.redundancies_dict.values()[0][0][1]
-            self.k = self.redundancies_dict.values()[0][0][2]
-            params = {'k':self.k}
-            redun_name = self.redundancies_dict.values()[0][0][0]
-            if redun_name.upper() == "MSR" or redun_name.upper() == "MBR":
-                self.d = self.redundancies_dict.values()[0][0][3]
-                self.is_msr = True
-                params['d'] = self.d
-                params['m'] = self.n - self.k
-            elif redun_name.upper() == "XORBAS":
-                self.l = self.redundancies_dict.values()[0][0][3]
-                params['l'] = self.l
-                params['m1'] = self.n - self.l
-            elif redun_name.upper() == "LRC":
-                self.l = self.redundancies_dict.values()[0][0][3]
-                self.m0 = self.redundancies_dict.values()[0][0][4]
-                params['l'] = self.l
-                params['m0'] = self.m0
-                params['m1'] = self.n - self.l * self.m0
-            elif redun_name.upper() == "RS":
-                params['m'] = self.n - self.k
-            else:
-                raise Exception("Unsupport Redundancy Scheme!")
-            self.redun_handler = getRedunHandler(redun_name, params)
+            self.setRedundancy(self.redundancies_dict.values()[0][0])
+
+        # schemes compared by simulator.test.ReplayTest on the same events,
+        # i.e. 'RS_14_10, RS_14_10 lazy_recovery=true recovery_threshold=12',
+        # given as codingParams() tuples. replay_options holds the settings
+        # changed for every scheme, see setOption().
+        self.replay_redundancies = []
+        self.replay_options = []
+        replay_redundancies = d.pop("replay_redundancies", None)
+        if replay_redundancies is not None:
+            for item in replay_redundancies.split(","):
+                words = item.split()
+                self.replay_redundancies.append(self.codingParams(words[0]))
+                self.replay_options.append(
+                    [tuple(word.split("=", 1)) for word in words[1:]])
+        # 'true' means ReplayTest updates the handlers of all schemes from
+        # each event, in one pass over the events.
+        self.replay_single_pass = self._bool(
+            d.pop("replay_single_pass", "false"))
 
         # check recovery settings.
         if self.lazy_recovery:
-            if not self.conf.has_section("Lazy Recovery"):
-                raise Exception("Lack of Lazy Recovery Settings!")
-            ava_to_dt = self.conf.get(
-                "Lazy Recovery", "availability_to_durability_threshold")
-
-            self.availability_to_durability_threshold = \
-                self._commaParser(ava_to_dt.strip())
-            recov_prob = self.conf.get("Lazy Recovery", "recovery_probability")
-            self.recovery_probability = self._commaParser(recov_prob.strip())
+            self.readLazyRecovery()
 
         if self.rafi_recovery:
             if not self.conf.has_section("RAFI Recovery"):
                 raise Exception("Lack of RAFI Recovery Settings!")
             pass
 
+    def readLazyRecovery(self):
+        if not self.conf.has_section("Lazy Recovery"):
+            raise Exception("Lack of Lazy Recovery Settings!")
+        ava_to_dt = self.conf.get(
+            "Lazy Recovery", "availability_to_durability_threshold")
+
+        self.availability_to_durability_threshold = \
+            self._commaParser(ava_to_dt.strip())
+        recov_prob = self.conf.get("Lazy Recovery", "recovery_probability")
+        self.recovery_probability = self._commaParser(recov_prob.strip())
+
+    # Changes one recovery setting of the conf file, i.e. for one of the
+    # schemes of replay_redundancies.
+    def setOption(self, key, value):
+        if key == "recovery_threshold":
+            self.recovery_threshold = int(value)
+        elif key == "lazy_recovery":
+            self.lazy_recovery = self._bool(value)
+            if self.lazy_recovery:
+                self.readLazyRecovery()
+        elif key == "bandwidth_efficient_scheme":
+            self.bandwidth_efficient_scheme = self._bool(value)
+        elif key == "availability_counts_for_recovery":
+            self.availability_counts_for_recovery = self._bool(value)
+        elif key == "recovery_bandwidth_gap":
+            self.recovery_bandwidth_gap = int(value)
+        elif key == "installment_size":
+            self.installment_size = int(value)
+        else:
+            raise Exception("Unknown option: " + key)
+
     def _bool(self, string):
         if string.lower() == "true":
             return True
@@ -146,11 +220,41 @@ class Configuration(object):
         params = string.split("_")
         return tuple([params[0]] + [int(item) for item in params[1:]])
 
+    # Sets n, k and the redundancy handler of a single layer system from a
+    # codingParams() tuple, i.e. ('RS', 14, 10).
+    def setRedundancy(self, scheme):
+        self.n = scheme[1]
+        self.k = scheme[2]
+        self.is_msr = False
+        params = {'k':self.k}
+        redun_name = scheme[0]
+        if redun_name.upper() == "MSR" or redun_name.upper() == "MBR":
+            self.d = scheme[3]
+            self.is_msr = True
+            params['d'] = self.d
+            params['m'] = self.n - self.k
+        elif redun_name.upper() == "XORBAS":
+            self.l = scheme[3]
+            params['l'] = self.l
+            params['m1'] = self.n - self.l
+        elif redun_name.upper() == "LRC":
+            self.l = scheme[3]
+            self.m0 = scheme[4]
+            params['l'] = self.l
+            params['m0'] = self.m0
+            params['m1'] = self.n - self.l * self.m0
+        elif redun_name.upper() == "RS":
+            params['m'] = self.n - self.k
+        else:
+            raise Exception("Unsupport Redundancy Scheme!")
+        self.redun_handler = getRedunHandler(redun_name, params)
+
     # "True" means events record to file, and vice versa.
     def eventToFile(self):
         return self.event_file is not None
 
-    def getAvailableLazyThreshold(self, time_since_failed):
+    # rand is the uniform random number generator used.
+    def getAvailableLazyThreshold(self, time_since_failed, rand=random):
         threshold_gap = self.n - 1 - self.recovery_threshold
         length = len(self.availability_to_durability_threshold)
         index = 0
@@ -163,7 +267,7 @@ class Configuration(object):
                     index = i
                 break
         threshold_increment = threshold_gap * \
-            (1 if random() < self.recovery_probability[i] else 0)
+            (1 if rand() < self.recovery_probability[i] else 0)
         return self.recovery_threshold + threshold_increment
 
     def returnLayerNum(self):
@@ -175,13 +279,29 @@ class Configuration(object):
              "chunk_size": self.chunk_size,
              "chunks_per_disk": self.chunks_per_disk,
              "disks_per_machine": self.disks_per_machine,
-             "machines_per_rack": self.racks,
+             "machines_per_rack": self.machines_per_rack,
              "datacenters": self.datacenters,
              "event_file": self.event_file,
+             "stream_events": self.stream_events,
+             "unit_population": self.unit_population,
+             "random_streams": self.random_streams,
+             "placement_seed": self.placement_seed,
+             "placement_cache": self.placement_cache,
+             "checkpoint_file": self.checkpoint_file,
+             "checkpoint_interval": self.checkpoint_interval,
+             "checkpoint_keep": self.checkpoint_keep,
+             "handler_shards": self.handler_shards,
+             "profile_file": self.profile_file,
+             "profile_sample": self.profile_sample,
+             "profile_iteration": self.profile_iteration,
+             "profile_format": self.profile_format,
              "tiered_storage": self.tiered_storage,
              "heterogeneous_redundancy": self.heterogeneous_redundancy,
              "heterogeneous_each_layer": self.heterogeneous_each_layer,
              "redundances": self.redundancies,
+             "replay_redundancies": self.replay_redundancies,
+             "replay_options": self.replay_options,
+             "replay_single_pass": self.replay_single_pass,
              "lazy_recovery": self.lazy_recovery,
              "rafi_recovery": self.rafi_recovery,
              "recovery_threshold": self.recovery_threshold,
@@ -224,7 +344,7 @@ class Configuration(object):
                          + ", chunk size: " + str(self.chunk_size) + "MB"
                          + ", total_active_storage: "
                          + str(self.total_active_storage)
-                         + ", rack count: " + str(Configuration.rack_count)
+                         + ", rack count: " + str(self.rack_count)
                          + ", disks per machine: "
                          + str(self.disks_per_machine)
                          + ", bandwidth efficient reconstruction: "
@@ -233,12 +353,32 @@ class Configuration(object):
                          + str(self.machines_per_rack)
                          + ", datacenters:" + str(self.datacenters)
                          + ", event file:" + str(self.event_file)
+                         + ", stream events:" + str(self.stream_events)
+                         + ", unit population:" + str(self.unit_population)
+                         + ", random streams:" + str(self.random_streams)
+                         + ", placement seed:" + str(self.placement_seed)
+                         + ", placement cache:" + str(self.placement_cache)
+                         + ", checkpoint file:" + str(self.checkpoint_file)
+                         + ", checkpoint interval:"
+                         + str(self.checkpoint_interval)
+                         + ", checkpoint keep:" + str(self.checkpoint_keep)
+                         + ", handler shards:" + str(self.handler_shards)
+                         + ", profile file:" + str(self.profile_file)
+                         + ", profile sample:" + str(self.profile_sample)
+                         + ", profile iteration:"
+                         + str(self.profile_iteration)
+                         + ", profile format:" + str(self.profile_format)
                          + ", tiered storage:" + str(self.tiered_storage)
                          + ", heterogeneous redundancy:"
                          + str(self.heterogeneous_redundancy)
                          + ", heterogeneous each layer:"
                          + str(self.heterogeneous_each_layer)
                          + ", redundances:" + str(self.redundancies)
+                         + ", replay redundances:"
+                         + str(self.replay_redundancies)
+                         + ", replay options:" + str(self.replay_options)
+                         + ", replay single pass:"
+                         + str(self.replay_single_pass)
                          + ", rafi recovery:" + str(self.rafi_recovery)
                          + ", availability_counts_for_recovery:"
                          + str(self.availability_counts_for_recovery) + "\n")
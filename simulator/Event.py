@@ -1,8 +1,16 @@
+import sys
 from enum import Enum
+from random import random
+from time import time
+
+from numpy import asarray, lexsort, zeros, full, float64, int8, int16, \
+    int32
 
 
 class Event(object):
-    event_id = 0
+    # Events keep the id of their unit only, units are looked up in the unit
+    # table of their topology, see Unit.getUnits().
+    event_count = 0
 
     class EventType(Enum):
         Start = 0
@@ -16,40 +24,196 @@ class Event(object):
         LatentRecovered = 8
         End = 9
 
+    # event types indexed by their value.
+    types = tuple(EventType)
+
+    # type is stored as the small int value of the EventType.
+    __slots__ = ("type", "time", "unit_id", "info", "ignore",
+                 "next_recovery_time", "attributes", "event_id")
+
     def __init__(self, e_type, time, unit, info=-100, ignore=False,
                  next_recovery_time=0):
-        self.type = e_type
+        self.type = e_type.value
         self.time = time
-        self.unit = unit
+        self.unit_id = -1 if unit is None else unit.getID()
         self.info = info
         self.ignore = ignore
         self.next_recovery_time = next_recovery_time
-        self.attributes = {}
-        Event.event_id += 1
-        self.event_id = Event.event_id
+        self.attributes = None
+        Event.event_count += 1
+        self.event_id = Event.event_count
+
+    @classmethod
+    def fromIDs(cls, type_id, time, unit_id, info=-100, ignore=False,
+                next_recovery_time=0):
+        e = cls.__new__(cls)
+        e.type = type_id
+        e.time = time
+        e.unit_id = unit_id
+        e.info = info
+        e.ignore = ignore
+        e.next_recovery_time = next_recovery_time
+        e.attributes = None
+        Event.event_count += 1
+        e.event_id = Event.event_count
+        return e
 
     def getType(self):
-        return self.type
+        return Event.types[self.type]
 
     def getTime(self):
         return self.time
 
-    def getUnit(self):
-        return self.unit
+    # unit of the event in units, the unit table of its topology.
+    def getUnit(self, units):
+        return units[self.unit_id]
+
+    def getUnitID(self):
+        return self.unit_id
 
     def getAttributes(self, key):
-        if self.attributes == {}:
+        if not self.attributes:
             return None
         return self.attributes[key]
 
     def setAttributes(self, key, value):
+        if self.attributes is None:
+            self.attributes = {}
         self.attributes[key] = value
 
     # time + " " + next_recovery + " " + unit + " " + type + " " + info + " "
-    # + ignore
-    def toString(self):
+    # + ignore, units is the unit table of the event.
+    def toString(self, units):
         format_string = str(self.time) + "  " + str(self.next_recovery_time) \
-            + "  " + self.unit.getFullName() + "  " + str(self.type) + "  " \
-            + str(self.info) + "  " + str(self.ignore) + "  " \
-            + str(self.event_id) + "\n"
+            + "  " + self.getUnit(units).getFullName() + "  " \
+            + str(self.getType()) + "  " + str(self.info) + "  " \
+            + str(self.ignore) + "  " + str(self.event_id) + "\n"
         return format_string
+
+
+class EventBatch(object):
+    """
+    Events stored as parallel arrays, one item per event. Events are only
+    created when the batch is iterated, see EventQueue.addEventBatch().
+    """
+    def __init__(self, times, types, unit_ids, infos=None,
+                 next_recovery_times=None, ignores=None):
+        size = len(times)
+        self.times = asarray(times, dtype=float64)
+        self.types = asarray(types, dtype=int8)
+        self.unit_ids = asarray(unit_ids, dtype=int32)
+        if infos is None:
+            infos = full(size, -100, dtype=int16)
+        self.infos = asarray(infos, dtype=int16)
+        if next_recovery_times is None:
+            next_recovery_times = zeros(size, dtype=float64)
+        self.next_recovery_times = asarray(next_recovery_times,
+                                           dtype=float64)
+        if ignores is None:
+            ignores = zeros(size, dtype=bool)
+        self.ignores = asarray(ignores, dtype=bool)
+
+    @classmethod
+    def fromEvents(cls, events):
+        return cls([e.time for e in events], [e.type for e in events],
+                   [e.unit_id for e in events], [e.info for e in events],
+                   [e.next_recovery_time for e in events],
+                   [e.ignore for e in events])
+
+    def __len__(self):
+        return len(self.times)
+
+    def nbytes(self):
+        return self.times.nbytes + self.types.nbytes + \
+            self.unit_ids.nbytes + self.infos.nbytes + \
+            self.next_recovery_times.nbytes + self.ignores.nbytes
+
+    # stable sort in the order of EventQueue, by time, unit id, type and
+    # info.
+    def sort(self):
+        order = lexsort((self.infos, self.types, self.unit_ids, self.times))
+        self.times = self.times[order]
+        self.types = self.types[order]
+        self.unit_ids = self.unit_ids[order]
+        self.infos = self.infos[order]
+        self.next_recovery_times = self.next_recovery_times[order]
+        self.ignores = self.ignores[order]
+
+    def getEvent(self, i):
+        return Event.fromIDs(int(self.types[i]), float(self.times[i]),
+                             int(self.unit_ids[i]), int(self.infos[i]),
+                             bool(self.ignores[i]),
+                             float(self.next_recovery_times[i]))
+
+    # events in time order.
+    def iterEvents(self):
+        return EventBatchIterator(self)
+
+
+class EventBatchIterator(object):
+    """
+    Iterator of the events of a batch in time order. Unlike a generator, it
+    can be pickled with the EventQueue it feeds, see simulator.Checkpoint.
+    """
+    def __init__(self, batch):
+        batch.sort()
+        self.batch = batch
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.position >= len(self.batch):
+            raise StopIteration
+        e = self.batch.getEvent(self.position)
+        self.position += 1
+        return e
+
+
+# Memory and creation rate of events, compared with a dict based event class
+# (the layout events had before __slots__). Event count is given on the
+# command line.
+def main():
+    class DictEvent(object):
+        def __init__(self, e_type, time, unit, info=-100, ignore=False,
+                     next_recovery_time=0):
+            self.type = e_type
+            self.time = time
+            self.unit = unit
+            self.info = info
+            self.ignore = ignore
+            self.next_recovery_time = next_recovery_time
+            self.attributes = {}
+
+    def objectSize(e):
+        size = sys.getsizeof(e)
+        if hasattr(e, "__dict__"):
+            size += sys.getsizeof(e.__dict__) + sys.getsizeof(e.attributes)
+        return size
+
+    size = 1000000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    times = [random()*87600 for i in xrange(size)]
+
+    for event_class in (DictEvent, Event):
+        st_time = time()
+        events = [event_class(Event.EventType.Failure, t, None)
+                  for t in times]
+        create_time = time() - st_time
+        print "%s: %d bytes/event, %.0f events/s" % \
+            (event_class.__name__, objectSize(events[0]),
+             size/create_time)
+        del events
+
+    st_time = time()
+    batch = EventBatch(times, full(size, Event.EventType.Failure.value),
+                       zeros(size))
+    create_time = time() - st_time
+    print "EventBatch: %.1f bytes/event, %.0f events/s" % \
+        (float(batch.nbytes())/size, size/create_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 from abc import ABCMeta, abstractmethod
+from numpy import array
 
 
 class EventGenerator:
     __metaclass__ = ABCMeta
+    # RandomStream the generator draws from, the random and numpy.random
+    # modules if None. See setRandomStream().
+    stream = None
+    # log likelihood ratios of the last call of generateNextEvent(a float)
+    # or generateNextEvents(an array, one per item), None for generators
+    # that sample the true distribution.
+    last_log_likelihood_ratios = None
 
     @abstractmethod
     def __init__(self, name, parameters):
@@ -12,6 +20,35 @@ class EventGenerator:
     def generateNextEvent(self, current_time):
         raise NotImplementedError
 
+    def setRandomStream(self, stream):
+        self.stream = stream
+
+    # Batch version of generateNextEvent(), returns an array with the next
+    # event after each of current_times. start_times(same length) replaces the
+    # start time given by reset(), one per item, so a single generator can
+    # serve a whole population of units. streams(a RandomStreams, same
+    # length), if given, replaces the stream of the generator, one per item.
+    # Generators with a vectorized implementation override this.
+    def generateNextEvents(self, current_times, start_times=None,
+                           streams=None):
+        results = []
+        stream = self.stream
+        for i in xrange(len(current_times)):
+            if start_times is not None:
+                self.reset(start_times[i])
+            if streams is not None:
+                self.stream = streams.getStream(i)
+            results.append(self.generateNextEvent(current_times[i]))
+            if streams is not None:
+                streams.setStream(i, self.stream)
+        self.stream = stream
+        return array(results, dtype=float)
+
+    # log likelihood ratio(true over sampled density) of all the times
+    # generated so far, 0 for generators that sample the true distribution.
+    def getLogLikelihoodRatio(self):
+        return 0.0
+
     @abstractmethod
     def reset(self, current_time):
         raise NotImplementedError
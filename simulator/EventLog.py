@@ -0,0 +1,199 @@
+import os
+import sys
+from random import random
+from time import time
+
+from numpy import dtype, array, empty, memmap, lexsort
+
+from simulator.Event import Event, EventBatch
+
+
+# one fixed width record per event, 32 bytes.
+RECORD = dtype([("time", "<f8"), ("next_recovery_time", "<f8"),
+                ("event_id", "<i8"), ("unit_id", "<i4"), ("info", "<i2"),
+                ("type", "<i1"), ("ignore", "?")])
+MAGIC = "PR-SIM event log 1\n"
+
+
+class EventLogWriter(object):
+    """
+    Writes events as a stream of fixed width binary records, buffer_size
+    events at a time. The file starts with a magic line and the message line,
+    then come the records. Units are written by id only, their full names are
+    saved once, in file_name + ".units"(one name per line, line i is unit i),
+    when the writer is closed. units is the unit table of the events, see
+    Unit.getUnits().
+    """
+
+    def __init__(self, file_name, msg, units, buffer_size=65536):
+        self.file_name = file_name
+        self.units = units
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.count = 0
+        self.fp = open(file_name, "wb")
+        self.fp.write(MAGIC)
+        self.fp.write(msg.replace("\n", " ") + "\n")
+
+    @staticmethod
+    def toRecord(e):
+        return (e.time, e.next_recovery_time, e.event_id, e.unit_id, e.info,
+                e.type, e.ignore)
+
+    def write(self, e):
+        self.buffer.append(EventLogWriter.toRecord(e))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def writeEvents(self, events):
+        for e in events:
+            self.write(e)
+
+    # events in any order(e.g. a heap), written in the order of EventQueue:
+    # sorted by time, unit id, type, info, then by seq.
+    def writeSorted(self, events, seqs):
+        self.flush()
+        records = array([EventLogWriter.toRecord(e) for e in events],
+                        dtype=RECORD)
+        records[lexsort((seqs, records["info"], records["type"],
+                         records["unit_id"], records["time"]))].tofile(self.fp)
+        self.count += len(records)
+
+    # events of the batch have no ids yet, their event_id is -1.
+    def writeBatch(self, batch):
+        self.flush()
+        records = empty(len(batch), dtype=RECORD)
+        records["time"] = batch.times
+        records["next_recovery_time"] = batch.next_recovery_times
+        records["event_id"] = -1
+        records["unit_id"] = batch.unit_ids
+        records["info"] = batch.infos
+        records["type"] = batch.types
+        records["ignore"] = batch.ignores
+        records.tofile(self.fp)
+        self.count += len(records)
+
+    def flush(self):
+        if self.buffer:
+            array(self.buffer, dtype=RECORD).tofile(self.fp)
+            self.count += len(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.fp.close()
+        with open(self.file_name + ".units", "w") as out:
+            for unit in self.units:
+                out.write(unit.getFullName() + "\n")
+
+
+class EventLogReader(object):
+    """
+    Reads a log of EventLogWriter. The records are memory mapped, a numpy
+    structured array with the fields of RECORD.
+    """
+
+    def __init__(self, file_name):
+        with open(file_name, "rb") as fp:
+            if fp.readline() != MAGIC:
+                raise Exception("Not an event log: " + file_name)
+            self.msg = fp.readline().rstrip("\n")
+            offset = fp.tell()
+        size = (os.path.getsize(file_name) - offset)/RECORD.itemsize
+        if size == 0:
+            self.records = empty(0, dtype=RECORD)
+        else:
+            self.records = memmap(file_name, dtype=RECORD, mode="r",
+                                  offset=offset, shape=(size,))
+
+        self.units = []
+        if os.path.exists(file_name + ".units"):
+            with open(file_name + ".units") as fp:
+                self.units = [line.rstrip("\n") for line in fp]
+
+    def __len__(self):
+        return len(self.records)
+
+    def getUnitName(self, unit_id):
+        if 0 <= unit_id < len(self.units):
+            return self.units[unit_id]
+        return str(unit_id)
+
+    def getBatch(self, start=0, end=None):
+        records = self.records[start:end]
+        return EventBatch(records["time"], records["type"],
+                          records["unit_id"], records["info"],
+                          records["next_recovery_time"], records["ignore"])
+
+    # lines of Event.toString(), times are printed as python floats.
+    def iterText(self, chunk_size=65536):
+        for start in xrange(0, len(self.records), chunk_size):
+            records = self.records[start:start+chunk_size]
+            for r in records.tolist():
+                yield str(r[0]) + "  " + str(r[1]) + "  " \
+                    + self.getUnitName(r[3]) + "  " \
+                    + str(Event.types[r[5]]) + "  " + str(r[4]) + "  " \
+                    + str(r[6]) + "  " + str(r[2]) + "\n"
+
+    # converts the log to the text of EventQueue.printAll().
+    def toText(self, file_name):
+        with open(file_name, "w") as out:
+            out.write(self.msg + "\n")
+            for line in self.iterText():
+                out.write(line)
+
+
+# Time and size of the text dump and of the binary log for a number of events
+# (given on the command line), on 1000 disks of 100 racks. With two file
+# names, converts the log in the first one to text, in the second one.
+# usage: EventLog.py [events] | EventLog.py log_file text_file
+def main():
+    if len(sys.argv) == 3:
+        EventLogReader(sys.argv[1]).toText(sys.argv[2])
+        return
+
+    from simulator.EventQueue import EventQueue
+    from simulator.Unit import Unit
+
+    size = 1000000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    root = Unit("root", None, {})
+    disks = []
+    for r in xrange(100):
+        rack = Unit("rack" + str(r), root, {})
+        disks += [Unit("disk" + str(d), rack, {}) for d in xrange(10)]
+    events = EventQueue(root.getUnits())
+    for i in xrange(size):
+        events.addEvent(Event(Event.EventType.Failure, random()*87600,
+                              disks[i % len(disks)]))
+
+    base = "/tmp/event-log-" + str(os.getpid())
+    st_time = time()
+    events.printAll(base + ".txt", "benchmark")
+    text_time = time() - st_time
+    st_time = time()
+    events.writeLog(base, "benchmark")
+    log_time = time() - st_time
+    st_time = time()
+    reader = EventLogReader(base)
+    reader.toText(base + ".converted")
+    convert_time = time() - st_time
+
+    print "%d events: text %.2fs %dMB, binary %.2fs %dMB, to text %.2fs" % \
+        (size, text_time, os.path.getsize(base + ".txt")/2**20, log_time,
+         os.path.getsize(base)/2**20, convert_time)
+    st_time = time()
+    batch = EventBatch(reader.records["time"], reader.records["type"],
+                       reader.records["unit_id"])
+    writer = EventLogWriter(base + ".batch", "benchmark", root.getUnits())
+    writer.writeBatch(batch)
+    writer.close()
+    print "EventBatch of %d events: %.2fs" % (len(batch), time() - st_time)
+    for suffix in ("", ".units", ".txt", ".converted", ".batch",
+                   ".batch.units"):
+        os.remove(base + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,171 @@
-from collections import OrderedDict
-from simulator.Event import Event
-
-
-class EventQueue(object):
-    events = OrderedDict()
-
-    def addEvent(self, e):
-        if e.getTime() in EventQueue.events.keys():
-            EventQueue.events.get(e.getTime()).append(e)
-        else:
-            event_list = []
-            event_list.append(e)
-            EventQueue.events.setdefault(e.getTime(), event_list)
-
-    def addEventQueue(self, queue):
-        all_events = queue.getAllEvents()
-        for e in all_events:
-            self.addEvent(e)
-
-    def removeFirst(self):
-        if EventQueue.events.keys() == []:
-            return None
-
-        # pop and deal with event based on the timestamp, so we need to
-        # sort at first.
-        keys = EventQueue.events.keys()
-        keys.sort()
-        first_key = keys[0]
-
-        first_value = EventQueue.events[first_key]
-        first_event = first_value.pop(0)
-        if len(first_value) == 0:
-            EventQueue.events.pop(first_key)
-
-        return first_event
-
-    def getAllEvents(self):
-        res = []
-        for e in EventQueue.events.values():
-            res.append(e)
-        return res
-
-    def convertToArray(self):
-        event_list = []
-        # check if we can operate OrderedDict like this?
-        # Yes, we can. This is normal operation for Dict.
-        iterator = EventQueue.events.itervalues()
-        for l in iterator:
-            for e in l:
-                event_list.append(e)
-
-        return event_list
-
-    # override?
-    def clone(self):
-        ret = EventQueue()
-        keys = EventQueue.events.keys()
-        keys.sort()
-        # this place will be self.events or EventQueue.events?
-        for ts in keys:
-            list1 = EventQueue.events.get(ts)
-            list2 = []
-            for e in list1:
-                list2.append(e)
-            ret.events.setdefault(ts, list2)
-
-        return ret
-
-    def size(self):
-        size = 0
-        for item in EventQueue.events.values():
-            size += len(item)
-        return size
-
-    def printAll(self, file_name, msg):
-        with open(file_name, 'w+') as out:
-            out.write(msg + "\n")
-            keys = EventQueue.events.keys()
-            keys.sort()
-            for t in keys:
-                res = EventQueue.events[t]
-                for e in res:
-                    if e.ignore is False:
-                        out.write(e.toString())
-
-    def printEvents(self, file_name, msg, event_type=Event.EventType.Failure, sort = True):
-        with open(file_name, 'w') as fp:
-            fp.write(msg + "\n")
-            keys = EventQueue.events.keys()
-            if sort:
-                keys.sort()
-            for t in keys:
-                res = EventQueue.events[t]
-                for e in res:
-                    if (e.ignore is False) and \
-                            e.getType() == event_type:
-                        fp.write(e.toString())
-
+import sys
+from heapq import heappush, heappop
+from itertools import count
+from random import random
+from time import time
+
+from simulator.Event import Event
+from simulator.EventLog import EventLogWriter
+
+
+class EventQueue(object):
+    """
+    Binary-heap priority queue of events.
+
+    Each heap entry is (time, unit id, type, info, seq, event). Events with
+    equal timestamps are popped by unit id, type and info, so the order
+    doesn't depend on the order the events were generated in(i.e. one unit
+    at a time or as a population). seq grows with every insertion and only
+    breaks the ties left, FIFO, so the events themselves are never
+    compared. Entries of event sources carry the source
+    as a seventh item, see addEventSource().
+
+    units is the unit table of the events(see Unit.getUnits()), only needed
+    to print them.
+    """
+
+    def __init__(self, units=None):
+        self.events = []
+        self.seq = count()
+        self.units = units
+
+    # itertools.count can't be pickled, its next value is saved instead.
+    # Event sources must be picklable too(i.e. those of addEventBatch()).
+    def __getstate__(self):
+        return {"events": self.events, "seq": next(self.seq),
+                "units": self.units}
+
+    def __setstate__(self, state):
+        self.events = state["events"]
+        self.seq = count(state["seq"])
+        self.units = state["units"]
+
+    def addEvent(self, e):
+        heappush(self.events, (e.time, e.unit_id, e.type, e.info,
+                               next(self.seq), e))
+
+    def addEventQueue(self, queue):
+        all_events = queue.getAllEvents()
+        for e in all_events:
+            self.addEvent(e)
+
+    # source is an iterator of events in time order. Only its next event is
+    # kept in the queue, the following one is pulled when that is removed.
+    def addEventSource(self, source):
+        for e in source:
+            heappush(self.events, (e.time, e.unit_id, e.type, e.info,
+                                   next(self.seq), e, source))
+            break
+
+    # events of the batch are created one at a time, when they reach the
+    # head of the queue.
+    def addEventBatch(self, batch):
+        self.addEventSource(batch.iterEvents())
+
+    def removeFirst(self):
+        if not self.events:
+            return None
+        entry = heappop(self.events)
+        if len(entry) == 7:
+            self.addEventSource(entry[6])
+        return entry[5]
+
+    # pop events in order until the queue is empty.
+    def iterEvents(self):
+        e = self.removeFirst()
+        while e is not None:
+            yield e
+            e = self.removeFirst()
+
+    # all events, in the order they are popped.
+    def getAllEvents(self):
+        return [entry[5] for entry in sorted(self.events)]
+
+    def convertToArray(self):
+        return [entry[5] for entry in self.events]
+
+    def clone(self):
+        ret = EventQueue(self.units)
+        ret.events = list(self.events)
+        ret.seq = count(next(self.seq))
+        return ret
+
+    def size(self):
+        return len(self.events)
+
+    def printAll(self, file_name, msg):
+        with open(file_name, 'w+') as out:
+            out.write(msg + "\n")
+            for e in self.getAllEvents():
+                if e.ignore is False:
+                    out.write(e.toString(self.units))
+
+    # printAll() as a binary log, see EventLogWriter. The heap is sorted by
+    # the writer, with numpy.
+    def writeLog(self, file_name, msg):
+        entries = [entry for entry in self.events if entry[5].ignore is False]
+        writer = EventLogWriter(file_name, msg, self.units)
+        writer.writeSorted([entry[5] for entry in entries],
+                           [entry[4] for entry in entries])
+        writer.close()
+
+    def printEvents(self, file_name, msg, event_type=Event.EventType.Failure, sort = True):
+        with open(file_name, 'w') as fp:
+            fp.write(msg + "\n")
+            if sort:
+                res = self.getAllEvents()
+            else:
+                res = self.convertToArray()
+            for e in res:
+                if (e.ignore is False) and \
+                        e.getType() == event_type:
+                    fp.write(e.toString(self.units))
+
+
+# k-way merge of event sources, each of them in time order.
+def mergeEvents(sources):
+    queue = EventQueue()
+    for source in sources:
+        queue.addEventSource(source)
+    return queue.iterEvents()
+
+
+# Events of source, which is in time order only, in the order of the queue:
+# events of equal times are held back and put in order by unit id, type and
+# info. Units yield their own events apart from those of their children, see
+# Unit.iterEvents().
+def orderTies(source):
+    ties = EventQueue()
+    for e in source:
+        if ties.events and e.time != ties.events[0][0]:
+            for tie in ties.iterEvents():
+                yield tie
+        ties.addEvent(e)
+    for tie in ties.iterEvents():
+        yield tie
+
+
+# Pop throughput of the queue, sizes(in events) are given on the command line.
+def main():
+    sizes = [int(item) for item in sys.argv[1:]]
+    if sizes == []:
+        sizes = [1000000, 10000000, 50000000]
+
+    for size in sizes:
+        queue = EventQueue()
+        st_time = time()
+        for i in xrange(size):
+            queue.addEvent(Event(Event.EventType.Failure, random()*87600,
+                                 None))
+        add_time = time() - st_time
+
+        st_time = time()
+        while queue.removeFirst() is not None:
+            pass
+        pop_time = time() - st_time
+        print "%d events: add %.0f events/s, pop %.0f events/s" % \
+            (size, size/add_time, size/pop_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import sys
+from math import ceil, log, gamma as gamma_function
+from time import time
+
+from numpy import zeros, ones, identity, dot, abs as np_abs
+from numpy.linalg import solve
+
+from simulator.Configuration import Configuration
+from simulator.utils.XMLParser import XMLParser
+
+HOURS_PER_YEAR = 24*365
+
+
+# matrix exponential of a, by scaling and squaring of its Taylor series.
+def expm(a, terms=20):
+    norm = np_abs(a).sum(axis=1).max()
+    squarings = 0
+    if norm > 0.5:
+        squarings = int(ceil(log(norm/0.5, 2)))
+    a = a/2.0**squarings
+    result = identity(len(a))
+    term = identity(len(a))
+    for i in xrange(1, terms):
+        term = dot(term, a)/i
+        result += term
+    for i in xrange(squarings):
+        result = dot(result, result)
+    return result
+
+
+class MarkovModel(object):
+    """
+    Continuous time Markov chain of the chunks of one slice, estimates the
+    durability of a configuration(pr-sim.conf and the layer xml) in
+    milliseconds, without simulation.
+
+    State (w, r) is the number of lost chunks of the slice whose disk has
+    recovered already(w, waiting for the recovery threshold) and whose disk
+    is still recovering(r). The slice is lost at n - k + 1 lost chunks.
+    Every chunk is lost at rate lamda: disk failures and permanent machine
+    failures. A disk recovers at rate mu, and rebuilds the chunk if the
+    slice has m = n - recovery_threshold lost chunks or more, with lazy
+    recovery all of its lost chunks, else the chunk waits.
+
+    While more than max_degraded_slices of the slices are degraded the
+    handler uses the threshold n - 1 instead(see getRecoveryThreshold()),
+    a fraction theta of the recoveries do, found so that the slices are
+    degraded max_degraded_slices of the time at most.
+
+    Exact for exponential times(Weibull generators with beta 1 and gamma 0)
+    and theta 0, other Weibull times are replaced by exponential ones of the
+    same mean. Latent defects and temporary failures are left out, and
+    slices are taken as independent.
+    """
+
+    def __init__(self, conf=None, xml=None):
+        conf = Configuration() if conf is None else conf
+        xml = XMLParser(1) if xml is None else xml
+        self.n = conf.n
+        self.k = conf.k
+        # as Test.setup() does.
+        recovery_threshold = conf.recovery_threshold
+        if recovery_threshold == self.n:
+            recovery_threshold -= 1
+        self.m = self.n - recovery_threshold
+        self.lazy_recovery = conf.lazy_recovery
+        self.lazy_only_available = conf.lazy_only_available
+        self.max_degraded_slices = conf.max_degraded_slices
+        self.total_time = conf.total_time
+        total_storage_overheads = conf.total_active_storage*1024*1024.0 * \
+            self.n/self.k
+        self.total_slices = int(ceil(total_storage_overheads*1024.0 /
+                                     (conf.chunk_size*self.n)))
+
+        self.exact = True
+        disk_life = self.getMean(xml, "disk/failureGenerator")
+        self.mu = 1.0/self.getMean(xml, "disk/recoveryGenerator")
+        # permanent failures per machine and hour, the fail_fraction of the
+        # machines as scaled by Test.buildSystem().
+        machine = xml.getParameters("machine")
+        fail_fraction = float(machine.get("fail_fraction", 0.008))
+        permanent = 0.0
+        if fail_fraction != 0:
+            generator = xml.getParameters("machine/failureGenerator")
+            permanent = fail_fraction*float(generator["lamda"]) / \
+                (24*30*self.getMean(xml, "machine/failureGenerator"))
+        self.lamda = 1.0/disk_life + permanent
+
+        # (w, r) of the states before the loss, which is the last state.
+        self.states = [(w, i - w) for i in xrange(self.n - self.k + 1)
+                       for w in xrange(i + 1)]
+        self.theta = self.getTheta()
+        if self.theta != 0:
+            self.exact = False
+
+    # mean time of the Weibull generator at path, infinite for NoFailure.
+    def getMean(self, xml, path):
+        parameters = xml.getParameters(path)
+        class_name = parameters["class"].split(".")[-1].lower()
+        if class_name == "nofailure":
+            return float("inf")
+        if class_name != "weibullgenerator":
+            raise Exception("Only Weibull generators can be modelled: " +
+                            path)
+        gamma = float(parameters["gamma"])
+        lamda = float(parameters["lamda"])
+        beta = float(parameters["beta"])
+        if beta != 1 or gamma != 0:
+            self.exact = False
+        return gamma + lamda*gamma_function(1 + 1.0/beta)
+
+    # state a disk recovery leads (w, r) to, with threshold m.
+    def recover(self, w, r, m):
+        if w + r < m:
+            return (w + 1, r - 1)
+        if self.lazy_recovery:
+            return (0, 0)
+        return (w, r - 1)
+
+    # transition rate matrix, theta of the recoveries use the threshold
+    # n - 1. The last state(slice lost) is absorbing, or is replaced by a new
+    # slice(state (0, 0)) if renew.
+    def getGenerator(self, theta, renew=False):
+        size = len(self.states)
+        index = dict([(state, i) for i, state in enumerate(self.states)])
+        q = zeros((size + 1, size + 1))
+        for i, (w, r) in enumerate(self.states):
+            q[i, index.get((w, r + 1), size)] = \
+                (self.n - w - r)*self.lamda
+            if r > 0:
+                q[i, index[self.recover(w, r, self.m)]] += \
+                    (1 - theta)*r*self.mu
+                q[i, index[self.recover(w, r, 1)]] += theta*r*self.mu
+        if renew:
+            q[size, 0] = self.mu
+        for i in xrange(size + 1):
+            q[i, i] -= q[i].sum()
+        return q
+
+    # fraction of the time a slice is degraded, in the long run.
+    def getDegraded(self, theta):
+        q = self.getGenerator(theta, True)
+        # stationary distribution, pi q = 0 and its sum is 1.
+        a = q.T.copy()
+        a[-1] = 1
+        b = zeros(len(a))
+        b[-1] = 1
+        pi = solve(a, b)
+        return 1 - pi[0] - pi[-1]
+
+    # fraction of the recoveries with the threshold n - 1.
+    def getTheta(self):
+        if self.m == 1 or not self.lazy_only_available or \
+                self.getDegraded(0) <= self.max_degraded_slices:
+            return 0.0
+        if self.getDegraded(1) >= self.max_degraded_slices:
+            return 1.0
+        low, high = 0.0, 1.0
+        for i in xrange(50):
+            theta = (low + high)/2
+            if self.getDegraded(theta) > self.max_degraded_slices:
+                low = theta
+            else:
+                high = theta
+        return high
+
+    # mean time to data loss of one slice, in hours.
+    def getSliceMTTDL(self):
+        size = len(self.states)
+        q = self.getGenerator(self.theta)[:size, :size]
+        return solve(q, -ones(size))[0]
+
+    # mean time to the first lost slice of the system, in hours.
+    def getMTTDL(self):
+        return self.getSliceMTTDL()/self.total_slices
+
+    # probability that a slice is lost by time t, all of its chunks are
+    # there at 0.
+    def getLossProbability(self, t):
+        return expm(self.getGenerator(self.theta)*t)[0, -1]
+
+    # expected number of slices lost over total_time, the undurable count of
+    # one iteration of simulator.test.Test.
+    def getUndurable(self):
+        return self.total_slices*self.getLossProbability(self.total_time)
+
+    def toString(self):
+        return "n:%d k:%d m:%d lazy:%s lamda:%g mu:%g theta:%g exact:%s" % \
+            (self.n, self.k, self.m, self.lazy_recovery, self.lamda, self.mu,
+             self.theta, self.exact)
+
+
+# Estimates of the configuration, compared with a simulated mean undurable
+# count if given. usage: MarkovModel.py [simulated_undurable]
+def main():
+    st_time = time()
+    model = MarkovModel()
+    mttdl = model.getMTTDL()
+    undurable = model.getUndurable()
+    elapsed = time() - st_time
+    print model.toString()
+    print "slice MTTDL: %g years, system MTTDL: %g years" % \
+        (model.getSliceMTTDL()/HOURS_PER_YEAR, mttdl/HOURS_PER_YEAR)
+    print "expected undurable slices in %g hours: %g of %d" % \
+        (model.total_time, undurable, model.total_slices)
+    print "computed in %.2f ms" % (elapsed*1000)
+    if len(sys.argv) > 1:
+        simulated = float(sys.argv[1])
+        print "simulated/expected undurable: %.3f" % (simulated/undurable)
+
+
+if __name__ == "__main__":
+    main()
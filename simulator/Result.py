@@ -1,9 +1,26 @@
 
 
 class Result(object):
-    unavailable_count = 0
-    undurable_count = 0
+
+    # unavailable_estimate and undurable_estimate are the counts weighted by
+    # the likelihood ratios of the slices, the unbiased estimates when
+    # failures are biased. They are the counts themselves otherwise.
+    def __init__(self, unavailable_count=0, undurable_count=0,
+                 unavailable_estimate=None, undurable_estimate=None):
+        self.unavailable_count = unavailable_count
+        self.undurable_count = undurable_count
+        self.biased = unavailable_estimate is not None
+        if unavailable_estimate is None:
+            unavailable_estimate = unavailable_count
+        if undurable_estimate is None:
+            undurable_estimate = undurable_count
+        self.unavailable_estimate = unavailable_estimate
+        self.undurable_estimate = undurable_estimate
 
     def toString(self):
-        return "unavailable=" + str(Result.unavailable_count) + \
-            "  undurable=" + str(Result.undurable_count)
+        s = "unavailable=" + str(self.unavailable_count) + \
+            "  undurable=" + str(self.undurable_count)
+        if self.biased:
+            s += "  weighted unavailable=%e  weighted undurable=%e" % \
+                (self.unavailable_estimate, self.undurable_estimate)
+        return s
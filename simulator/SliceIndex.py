@@ -0,0 +1,71 @@
+from numpy import arange, concatenate, cumsum, bincount, argsort, empty, \
+    int32, int64
+
+
+class SliceIndex(object):
+    """
+    Disk to slice inverted index, in CSR layout.
+
+    Disks are numbered by row, the chunks of the disk in row r are at
+    positions offsets[r]:offsets[r+1] (by slice), and slice_ids gives the
+    slice of every chunk. slice_chunks[s, i] is the position of the chunk of
+    slice s on its i-th disk, in the order of the slice locations. Per chunk
+    state is kept by the handler, in arrays aligned with slice_ids. Slice ids
+    and chunk positions are 32 bits.
+
+    locations is the total_slices x n matrix of disk rows, see
+    SlicePlacement.place().
+
+    The slices selected for the last unit are kept, handlers sharing the
+    index(see MultiSchemeEventHandler) select the slices of an event once.
+    """
+
+    def __init__(self, disks, locations):
+        self.disks = disks
+        self.rows = dict([(disk.getID(), row) for row, disk in
+                          enumerate(disks)])
+
+        slice_count, n = locations.shape
+        flat = locations.ravel()
+        # stable, so the chunks of a disk are ordered by slice.
+        order = argsort(flat, kind="mergesort")
+        self.counts = bincount(flat, minlength=len(disks))
+        self.offsets = concatenate([[0], cumsum(self.counts)]).astype(int64)
+        self.slice_ids = (order // n).astype(int32)
+        slice_chunks = empty(len(flat), dtype=int32)
+        slice_chunks[order] = arange(len(flat))
+        self.slice_chunks = slice_chunks.reshape(slice_count, n)
+        # (unit id, slices) of the last getSliceList() and
+        # getMachineSlices().
+        self.last_list = (None, None)
+        self.last_machine = (None, None)
+
+    def getRow(self, disk):
+        return self.rows[disk.getID()]
+
+    def getRange(self, disk):
+        row = self.rows[disk.getID()]
+        return self.offsets[row], self.offsets[row+1]
+
+    # slice ids of the chunks on disk, a view.
+    def getSlices(self, disk):
+        start, end = self.getRange(disk)
+        return self.slice_ids[start:end]
+
+    # slice ids of the chunks on disk, as a list.
+    def getSliceList(self, disk):
+        if self.last_list[0] != disk.getID():
+            self.last_list = (disk.getID(), self.getSlices(disk).tolist())
+        return self.last_list[1]
+
+    # slice ids of the chunks on the disks of machine, disk after disk. A
+    # slice has at most one chunk on a machine.
+    def getMachineSlices(self, machine):
+        if self.last_machine[0] != machine.getID():
+            slices = concatenate([self.getSlices(disk) for disk in
+                                  machine.getChildren()])
+            self.last_machine = (machine.getID(), slices)
+        return self.last_machine[1]
+
+    def getChunkCount(self):
+        return len(self.slice_ids)
@@ -0,0 +1,185 @@
+import os
+import sys
+from hashlib import md5
+from time import time
+
+from numpy import array, arange, zeros, full, cumsum, searchsorted, \
+    bincount, argsort, unique, int32, int64, save, load
+from numpy.random import RandomState
+
+
+class SlicePlacement(object):
+    """
+    Places the n chunks of all slices on disks in bulk, a batch of slices at
+    a time. Chunks are placed one position after another, like
+    distributeSlices() did for one slice: a rack is chosen uniformly among
+    the racks with non full disks, then a disk uniformly among the non full
+    disks of the rack. The first num_chunks_diff_racks chunks of a slice are
+    on different racks, the others on different machines. Candidates that
+    break a rule, or fill a disk beyond chunks_per_disk, are drawn again.
+
+    racks is a list of racks, each a list of disks. The layout only depends
+    on the topology and on the seed, so it can be saved and loaded again, see
+    placeCached().
+    """
+    max_rounds = 1000
+
+    def __init__(self, racks, n, chunks_per_disk, num_chunks_diff_racks):
+        self.n = n
+        self.chunks_per_disk = chunks_per_disk
+        self.diff_racks = min(n, num_chunks_diff_racks)
+
+        self.disks = [disk for rack_disks in racks for disk in rack_disks]
+        self.disk_racks = array([i for i, rack_disks in enumerate(racks)
+                                 for disk in rack_disks], dtype=int64)
+        self.rack_count = len(racks)
+        if self.rack_count < self.diff_racks:
+            raise Exception("No racks left")
+        machines = {}
+        self.disk_machines = array(
+            [machines.setdefault(id(disk.getParent()), len(machines))
+             for disk in self.disks], dtype=int64)
+        # disks of a rack are next to each other, from rack_starts[r].
+        self.rack_starts = searchsorted(self.disk_racks,
+                                        arange(self.rack_count))
+
+    # Returns the disk row(in self.disks) of every chunk, a total_slices x n
+    # int32 matrix.
+    def place(self, total_slices, seed=None, batch_size=4096):
+        rng = RandomState(seed)
+        free = full(len(self.disks), self.chunks_per_disk, dtype=int64)
+        locations = zeros((total_slices, self.n), dtype=int32)
+        for start in xrange(0, total_slices, batch_size):
+            end = min(start + batch_size, total_slices)
+            locations[start:end] = self.placeBatch(end - start, free, rng)
+        return locations
+
+    # name of the layout file, from the topology(rack and machine of every
+    # disk), chunks_per_disk, num_chunks_diff_racks, n, k, total_slices and
+    # seed.
+    def getLayoutName(self, total_slices, seed, k):
+        key = md5()
+        key.update(self.disk_racks.tobytes())
+        key.update(self.disk_machines.tobytes())
+        key.update(str((self.chunks_per_disk, self.diff_racks, self.n, k,
+                        total_slices, seed)))
+        return "layout-%d-%d-%d-%d-%s.npy" % \
+            (len(self.disks), self.n, k, seed, key.hexdigest()[:12])
+
+    # place(), with the layout saved under cache_dir. A layout saved before
+    # is memory mapped(read only) instead of placed again.
+    def placeCached(self, total_slices, seed, k, cache_dir):
+        path = cache_dir + os.sep + self.getLayoutName(total_slices, seed, k)
+        if not os.path.exists(path):
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            locations = self.place(total_slices, seed)
+            # renamed when complete, runs sharing cache_dir never see a
+            # partial file.
+            tmp_path = path + "." + str(os.getpid()) + ".tmp"
+            with open(tmp_path, "wb") as fp:
+                save(fp, locations)
+            os.rename(tmp_path, path)
+        return load(path, mmap_mode="r")
+
+    def placeBatch(self, slice_count, free, rng):
+        disks = full((slice_count, self.n), -1, dtype=int64)
+        for j in xrange(self.n):
+            rows = arange(slice_count)
+            rounds = 0
+            while len(rows):
+                rounds += 1
+                if rounds > SlicePlacement.max_rounds:
+                    raise Exception("Disk distribution failed")
+                candidates = self.drawDisks(len(rows), free, rng)
+
+                if j < self.diff_racks:
+                    taken = self.disk_racks[disks[rows, :j]] == \
+                        self.disk_racks[candidates][:, None]
+                else:
+                    taken = self.disk_machines[disks[rows, :j]] == \
+                        self.disk_machines[candidates][:, None]
+                ok = ~taken.any(axis=1)
+
+                # candidates beyond the free chunks of their disk, in the
+                # order of the slices.
+                order = argsort(candidates, kind="mergesort")
+                sorted_disks = candidates[order]
+                first = searchsorted(sorted_disks, sorted_disks)
+                rank = zeros(len(rows), dtype=int64)
+                rank[order] = arange(len(rows)) - first
+                ok &= rank < free[candidates]
+
+                accepted = candidates[ok]
+                disks[rows[ok], j] = accepted
+                free -= bincount(accepted, minlength=len(free))
+                rows = rows[~ok]
+        return disks
+
+    # draws count disks: a rack with non full disks, then a non full disk of
+    # it, both uniformly.
+    def drawDisks(self, count, free, rng):
+        open_disks = free > 0
+        open_per_rack = bincount(self.disk_racks, open_disks,
+                                 minlength=self.rack_count).astype(int64)
+        open_racks = (open_per_rack > 0).nonzero()[0]
+        if len(open_racks) == 0:
+            raise Exception("No racks left")
+        racks = open_racks[rng.randint(0, len(open_racks), count)]
+
+        # k-th open disk of the rack, found among the open disk counts.
+        open_before = cumsum(open_disks) - open_disks
+        rack_open_before = open_before[self.rack_starts[racks]]
+        nth = rack_open_before + \
+            (rng.random_sample(count)*open_per_rack[racks]).astype(int64)
+        return searchsorted(cumsum(open_disks), nth, side="right")
+
+
+# Time to place the slices of storage(PB, given on the command line) on
+# racks of 5 machines with 10 disks of 200 chunks of 256MB, RS(14, 10), and
+# to save and load the layout if a cache directory is given.
+# usage: SlicePlacement.py [storage] [cache_dir]
+def main():
+    class Node(object):
+        def __init__(self, parent=None):
+            self.parent = parent
+
+        def getParent(self):
+            return self.parent
+
+    storage = 1.0
+    if len(sys.argv) > 1:
+        storage = float(sys.argv[1])
+    n, k = 14, 10
+    chunks_per_disk = 200
+    total_slices = int(storage*1024*1024*1024/(256*k))
+    # disks filled to 75%.
+    disk_count = int(total_slices*n/(chunks_per_disk*0.75))
+    rack_count = disk_count/50 + 1
+    racks = []
+    for r in xrange(rack_count):
+        rack_disks = []
+        for m in xrange(5):
+            machine = Node()
+            rack_disks += [Node(machine) for d in xrange(10)]
+        racks.append(rack_disks)
+
+    st_time = time()
+    placement = SlicePlacement(racks, n, chunks_per_disk, 15)
+    locations = placement.place(total_slices, 1)
+    print "%d slices on %d racks placed in %.2fs" % \
+        (total_slices, rack_count, time() - st_time)
+    if len(sys.argv) > 2:
+        for i in xrange(2):
+            st_time = time()
+            locations = placement.placeCached(total_slices, 1, k, sys.argv[2])
+            print "placeCached(%s): %.2fs" % (sys.argv[2], time() - st_time)
+    counts = bincount(locations.ravel(), minlength=len(placement.disks))
+    print "chunks per disk: max %d, mean %.1f" % (counts.max(), counts.mean())
+    racks_per_slice = [len(unique(row)) for row in
+                       placement.disk_racks[locations[:1000]]]
+    print "distinct racks of a slice: min %d" % min(racks_per_slice)
+
+
+if __name__ == "__main__":
+    main()
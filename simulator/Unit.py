@@ -1,11 +1,12 @@
 from abc import ABCMeta
 from simulator.Metadata import Metadata
 from simulator.Event import Event
+from simulator.EventQueue import mergeEvents, orderTies
+from simulator.utils.RandomStream import RandomStream, streamKey, purposeID
 
 
 class Unit:
     __metaclass__ = ABCMeta
-    unit_count = 0
 
     def __init__(self, name, parent, parameters):
         self.children = []
@@ -15,11 +16,20 @@ class Unit:
         self.recovery_generator = None
         self.meta = Metadata()
 
-        self.id = Unit.unit_count
+        # units of the topology indexed by id, one table owned by the root
+        # and shared by all of its units. Events keep unit ids only, see
+        # getUnits().
+        self.units = [] if parent is None else parent.units
+        self.id = len(self.units)
         self.last_failure_time = 0
         self.last_bandwidth_need = 0
 
-        Unit.unit_count += 1
+        self.units.append(self)
+
+    # table of the units of the topology, indexed by id. Unit ids of events
+    # are resolved with it, i.e. e.getUnit(root.getUnits()).
+    def getUnits(self):
+        return self.units
 
     def setLastFailureTime(self, ts):
         self.last_failure_time = ts
@@ -49,6 +59,34 @@ class Unit:
     def getID(self):
         return self.id
 
+    # generators of the unit, not those of its children.
+    def getEventGenerators(self):
+        return [generator for generator in (self.failure_generator,
+                                            self.recovery_generator)
+                if generator is not None]
+
+    # log likelihood ratio of the event times drawn for the unit, 0 unless
+    # its failures are biased.
+    def getLogLikelihoodRatio(self):
+        return sum([generator.getLogLikelihoodRatio()
+                    for generator in self.getEventGenerators()])
+
+    # Gives every generator of the unit and of its children a RandomStream of
+    # its own, keyed by master_seed, unit id and generator name.
+    def setRandomStreams(self, master_seed):
+        for generator in self.getEventGenerators():
+            generator.setRandomStream(RandomStream(streamKey(
+                master_seed, self.id, purposeID(generator.getName()))))
+        for unit in self.children:
+            unit.setRandomStreams(master_seed)
+
+    # The unit and its children generate their events anew from time, as
+    # they do from time 0, see simulator.Checkpoint.forkEvents(). Only units
+    # keeping generation state between windows need to do anything.
+    def restart(self, time):
+        for unit in self.children:
+            unit.restart(time)
+
     def addEventGenerator(self, generator):
         if generator.getName() == "failureGenerator":
             self.failure_generator = generator
@@ -98,6 +136,58 @@ class Unit:
                                          current_time, self))
             last_recover_time = current_time
 
+    # Streaming counterpart of generateEvents(): yields the events of this
+    # unit and its children in the order of the queue, generating them on
+    # demand. Batch and streamed events are handled alike.
+    def iterEvents(self, start_time, end_time, reset):
+        if self.failure_generator is None:
+            return self.iterChildrenEvents(start_time, end_time)
+        return orderTies(self.iterWindowEvents(start_time, end_time, reset))
+
+    # Events of the unit and of its children between its failures, window by
+    # window. They are in time order, but events of equal times are not in
+    # the order of the queue: the window of the children ends at the failure
+    # of the unit and the next one starts at its recovery.
+    def iterWindowEvents(self, start_time, end_time, reset):
+        current_time = start_time
+        last_recover_time = start_time
+
+        while True:
+            if reset:
+                self.failure_generator.reset(current_time)
+
+            failure_time = self.failure_generator.generateNextEvent(
+                current_time)
+            current_time = failure_time
+            if current_time > end_time:
+                for e in self.iterChildrenEvents(last_recover_time, end_time):
+                    yield e
+                break
+            fail_event = Event(Event.EventType.Failure, current_time, self)
+            own_events = [fail_event]
+
+            self.recovery_generator.reset(current_time)
+            recovery_time = self.recovery_generator.generateNextEvent(
+                current_time)
+            assert (recovery_time > failure_time)
+            current_time = recovery_time
+            fail_event.next_recovery_time = recovery_time
+            if current_time <= end_time:
+                own_events.append(Event(Event.EventType.Recovered,
+                                        current_time, self))
+
+            for e in mergeEvents([iter(own_events), self.iterChildrenEvents(
+                    last_recover_time, failure_time)]):
+                yield e
+            if current_time > end_time:
+                break
+            last_recover_time = current_time
+
+    # children events of the window [start_time, end_time], merged.
+    def iterChildrenEvents(self, start_time, end_time):
+        return mergeEvents([u.iterEvents(start_time, end_time, True)
+                            for u in self.children])
+
     def toString(self):
         if self.parent is None:
             return self.name
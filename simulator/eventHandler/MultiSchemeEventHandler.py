@@ -0,0 +1,115 @@
+import os
+import sys
+from time import time
+
+from simulator.EventHandler import EventHandler
+from simulator.EventQueue import EventQueue
+
+
+class MultiSchemeEventHandler(EventHandler):
+    """
+    Updates several RandomDistributeEventHandler from each event, every
+    handler with its own configuration(redundancy scheme, recovery settings)
+    and its own slice state. An event is dequeued once for all of them, and
+    handlers with the same n, slice count and placement seed share the slice
+    layout and its disk to slice index, so the slices of the disk or machine
+    of an event are selected once for all of them(see SliceIndex).
+
+    Events a handler adds itself(eager recovery) go to a queue of its own.
+    They are handled before the first shared event after them in queue
+    order(time, unit id, type, info), so each handler sees its events in
+    the order a single queue holding the shared events and its own would
+    give.
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.queues = [EventQueue() for handler in handlers]
+        self.events_handled = [0]*len(handlers)
+        # (n, slice count, placement seed) -> (locations, index).
+        self.layouts = {}
+
+    # total_slices is a list, the slice count of every handler.
+    def start(self, root, total_slices, disk_count):
+        for handler, slice_count in zip(self.handlers, total_slices):
+            handler.start(root, slice_count, disk_count, self.layouts)
+
+    def handleEvent(self, e, queue):
+        key = (e.time, e.unit_id, e.type, e.info)
+        for i, handler in enumerate(self.handlers):
+            self.handleOwnEvents(i, key)
+            handler.handleEvent(e, self.queues[i])
+            self.events_handled[i] += 1
+
+    # events of handler i before key, the (time, unit id, type, info) of an
+    # event. All of them if key isn't given.
+    def handleOwnEvents(self, i, key=(float("inf"),)):
+        handler = self.handlers[i]
+        queue = self.queues[i]
+        while queue.events and queue.events[0][:4] < key:
+            handler.handleEvent(queue.removeFirst(), queue)
+            self.events_handled[i] += 1
+
+    # Returns the Result of every handler.
+    def end(self):
+        for i in xrange(len(self.handlers)):
+            self.handleOwnEvents(i)
+        return [handler.end() for handler in self.handlers]
+
+
+# Times the replay of the schemes of replay_redundancies one after another
+# and in a single pass, on the events of one iteration.
+# usage: MultiSchemeEventHandler.py [seed] [repeats]
+def main():
+    from simulator.test.ReplayTest import ReplayTest
+    from simulator.EventLog import EventLogWriter, EventLogReader
+
+    seed = 1
+    if len(sys.argv) > 1:
+        seed = int(sys.argv[1])
+    repeats = 3
+    if len(sys.argv) > 2:
+        repeats = int(sys.argv[2])
+    test = ReplayTest()
+    conf = test.conf
+    test.setup()
+
+    root, xml = test.buildSystem(seed if conf.random_streams else None)
+    events = test.generateEvents(root, xml)
+    log_file = "/tmp/replay-events-" + str(os.getpid())
+    writer = EventLogWriter(log_file, "Iteration seed: " + str(seed),
+                            root.getUnits())
+    for e in events.iterEvents():
+        if e.ignore is False:
+            writer.write(e)
+    writer.close()
+    reader = EventLogReader(log_file)
+    confs = [test.schemeConf(j)
+             for j in xrange(len(conf.replay_redundancies))]
+
+    # best time of the repeats, the timings of one process are noisy.
+    best = {}
+    for r in xrange(repeats):
+        for single_pass in (False, True):
+            st_time = time()
+            if single_pass:
+                results = [item[1] for item in
+                           test.replayAll(confs, seed, root, reader)]
+            else:
+                results = [test.replay(scheme_conf, seed, root, reader)[1]
+                           for scheme_conf in confs]
+            elapsed = time() - st_time
+            best[single_pass] = min(best.get(single_pass, elapsed), elapsed)
+            undurable = [result.undurable_count for result in results]
+    print "%d schemes, %d events: one after another %.2fs, single pass " \
+        "%.2fs(%.1f%% less), undurable %s" % \
+        (len(confs), len(reader), best[False], best[True],
+         100*(1 - best[True]/best[False]), undurable)
+
+    del reader
+    os.remove(log_file)
+    os.remove(log_file + ".units")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,33 @@
-from collections import OrderedDict
+import sys
 from math import sqrt
-from random import randint
-from copy import deepcopy
+import random
+
+from numpy import arange, full, zeros, flatnonzero, int16, int32, int64, \
+    array, maximum, searchsorted, where, ceil, exp, ones, sort, append
+from numpy.random import permutation
 
 from simulator.Event import Event
 from simulator.Result import Result
 from simulator.EventHandler import EventHandler
 from simulator.Configuration import Configuration
+from simulator.SliceIndex import SliceIndex
+from simulator.SlicePlacement import SlicePlacement
 from simulator.unit.Rack import Rack
 from simulator.unit.Machine import Machine
 from simulator.unit.Disk import Disk
 from simulator.unit.DiskWithScrubbing import DiskWithScrubbing
 from simulator.unit.SliceSet import SliceSet
 from simulator.utils.Log import info_logger, error_logger
+from simulator.utils.BandwidthSweep import BandwidthSweep
+from simulator.utils.IntervalLog import IntervalLog
+from simulator.utils.RandomStream import RandomStream, streamKey, \
+    purposeID, timeKey
+
+# per slice chunk counts are at most n, well within 16 bits.
+STATE_DTYPE = int16
+# purposes of the draws keyed by events, see eventStream().
+LATENT_CHUNK = purposeID("latent_chunk")
+LAZY_THRESHOLD = purposeID("lazy_threshold")
 
 
 class Recovery(object):
@@ -29,12 +44,16 @@ class Recovery(object):
 
 class RandomDistributeEventHandler(EventHandler):
 
-    def __init__(self):
-        self.conf = Configuration()
+    # conf defaults to a Configuration read from the conf file, rng(random
+    # number generator, i.e. a random.Random) to the random module.
+    def __init__(self, conf=None, rng=None):
+        self.conf = Configuration() if conf is None else conf
+        self.rng = random if rng is None else rng
+        # master seed of setRandomStreams(), None if not called.
+        self.stream_seed = None
         self.n = self.conf.n
         self.k = self.conf.k
         self.num_chunks_diff_racks = self.conf.num_chunks_diff_racks
-        self.lost_slice = -100
         # how to express Long.MAX_VALUE in python?
         self.min_av_count = 10000000000
 
@@ -65,13 +84,33 @@ class RandomDistributeEventHandler(EventHandler):
         self.availability_counts_for_recovery = \
             self.conf.availability_counts_for_recovery
 
+        # per slice counters and flags, numpy arrays indexed by slice. The
+        # counts of a lost slice are kept as they were when it was lost.
         self.available_count = []
         self.durable_count = []
         self.latent_defect = []
         self.known_latent_defect = []
+        self.lost = []
+
+        # disk to slice index(SliceIndex), and per chunk flags aligned with
+        # its slice_ids: chunks lost in a disk failure, chunks hit by latent
+        # errors, and those of them found by the last scrub.
+        self.index = None
+        self.nonexistent = None
+        self.defective = None
+        self.known_defective = None
+        # per disk row, False while the disk has no defective(or known
+        # defective) list at all, see handleLatentRecovered().
+        self.defective_allocated = None
+        self.known_allocated = None
 
         self.unavailable_slice_count = 0
         self.undurable_slice_count = 0
+        # log likelihood ratio of every slice when failures are biased, None
+        # otherwise, see getSliceLogWeights(). unavailable_slice_count
+        # weighted by the ratios.
+        self.slice_log_weights = None
+        self.weighted_unavailable_count = 0.0
 
         # There is an anomaly (logical bug?) that is possible in the current
         # implementation:
@@ -98,7 +137,7 @@ class RandomDistributeEventHandler(EventHandler):
         self.snapshot_year = 1
 
         self.max_bw = 0
-        self.bandwidth_list = OrderedDict()
+        self.bandwidth_sweep = BandwidthSweep()
 
         self.total_latent_failures = 0
         self.total_scrubs = 0
@@ -116,12 +155,19 @@ class RandomDistributeEventHandler(EventHandler):
         self.total_skipped_latent = 0
         self.total_incomplete_recovery_attempts = 0
 
-        self.slice_locations = []
+        # disk row(in index.disks) of every chunk, total_slices x n.
+        self.locations = None
+        # recovery bandwidth needed by every disk(by row) since its failure.
+        self.bandwidth_need = []
         self.slices_degraded_list = []
         self.slices_degraded_avail_list = []
 
-        # unavailable statistic dict, {slice_index:[[start, end],...]}
-        self.unavailable_durations = {}
+        # unavailable intervals of slices, see IntervalLog.
+        self.unavailable_durations = IntervalLog()
+        # if a list, the updates of unavailable_durations are also recorded
+        # in it, as (slice, time, None) for a start and (slice, time,
+        # unavailable) for an end. See simulator.test.EpochTest.
+        self.unavailable_ops = None
         # degraded slice statistic dict
         self.slices_degraded_durations = {}
 
@@ -142,48 +188,24 @@ class RandomDistributeEventHandler(EventHandler):
                 return (float(d)/(d - self.k + 1))*self.conf.chunk_size
         return self.conf.chunk_size*(self.k+num_missing_blocks-1)
 
-    def putBandwidthList(self, key, r):
-        if key in self.bandwidth_list.keys():
-            ll = self.bandwidth_list[key]
-        else:
-            ll = []
-            self.bandwidth_list[key] = ll
-        ll.append(r)
-
     def addBandwidthStat(self, r):
-        if self.max_bw < r.bandwidht():
-            self.max_bw = r.bandwidht()
+        bandwidth = r.bandwidht()
+        if self.max_bw < bandwidth:
+            self.max_bw = bandwidth
             # logging.info("Max bw now is:"+ self.max_bw)
 
-        self.putBandwidthList(r.start, r)
-        self.putBandwidthList(r.end, r)
+        self.bandwidth_sweep.add(r.start, r.end, bandwidth)
 
     def analyzeBandwidth(self):
-        current_bandwidth = 0
-        tmp_bw_list = []
-        while True:
-            keys = self.bandwidth_list.keys()
-            keys.sort()
-            key = keys[0]
-            rlist = self.bandwidth_list.pop(key)
-            for r in rlist:
-                start = (key == r.start)
-                if start:
-                    current_bandwidth += r.bandwidht()
-                else:
-                    current_bandwidth -= r.bandwidht()
-            if current_bandwidth < 0 and current_bandwidth > -1:
-                current_bandwidth = 0
-            if current_bandwidth < 0:
-                raise Exception("Negative bandwidth count")
-            tmp_bw_list.append((key, current_bandwidth))
-
-            # if bandwidth list is empty, end while
-            if self.bandwidth_list == OrderedDict():
-                break
-
+        tmp_bw_list = self.bandwidth_sweep.getSeries()
         self.printDegradedStat(tmp_bw_list, "Avg_banwidth_", "GBPerday")
 
+        peak, average, levels = self.bandwidth_sweep.getStats(
+            self.conf.total_time)
+        info_logger.info("recovery bandwidth(GBPerday): peak:%f average:%f "
+                         "p50:%f p95:%f p99:%f" %
+                         tuple([peak, average] + levels))
+
     def sliceRecovered(self, slice_index):
         if self.durable_count[slice_index] - \
            (1 if self.latent_defect[slice_index] else 0) == self.n:
@@ -219,33 +241,82 @@ class RandomDistributeEventHandler(EventHandler):
         if undurable == 0 and unavailable == 0:
             self.current_avail_slice_degraded += 1
 
+    # sliceRecovered() of a batch of slices, each slice at most once.
+    def slicesRecovered(self, slices):
+        durable = self.durable_count[slices]
+        latent = self.latent_defect[slices]
+        self.current_slice_degraded -= int(((durable - latent) ==
+                                            self.n).sum())
+        self.slicesRecoveredAvailability(slices)
+
+    def slicesDegraded(self, slices):
+        durable = self.durable_count[slices]
+        latent = self.latent_defect[slices]
+        self.current_slice_degraded += int(((durable - latent) ==
+                                            self.n).sum())
+        self.slicesDegradedAvailability(slices)
+
+    def slicesRecoveredAvailability(self, slices):
+        if self.k == 1:
+            return
+        undurable = self.n - self.durable_count[slices] + \
+            self.latent_defect[slices]
+        unavailable = self.n - self.available_count[slices]
+        recovered = (undurable == 0) & (unavailable == 0)
+        self.current_avail_slice_degraded -= int(recovered.sum())
+        self.total_incomplete_recovery_attempts += \
+            int((~recovered & (unavailable == 0)).sum())
+
+    def slicesDegradedAvailability(self, slices):
+        if self.k == 1:
+            return
+        undurable = self.n - self.durable_count[slices] + \
+            self.latent_defect[slices]
+        unavailable = self.n - self.available_count[slices]
+        self.current_avail_slice_degraded += \
+            int(((undurable == 0) & (unavailable == 0)).sum())
+
+    # number of undurable and unavailable chunks of the slices, and whether
+    # they crossed the recovery threshold.
+    def slicesThresholdCrossed(self, slices, threshold):
+        num_undurable = self.n - self.durable_count[slices] + \
+            self.known_latent_defect[slices]
+        threshold_crossed = num_undurable >= self.n - threshold
+        num_unavailable = zeros(len(slices), dtype=STATE_DTYPE)
+        if self.availability_counts_for_recovery:
+            num_unavailable = self.n - self.available_count[slices]
+            threshold_crossed |= num_unavailable + num_undurable >= \
+                self.n - threshold
+        return num_undurable, num_unavailable, threshold_crossed
+
+    # reconstruction bandwidths of the slices, summed one after another like
+    # the per slice loops did. The bandwidth of every number of missing
+    # blocks(undurable and unavailable, at most 2n+1) is looked up in the
+    # table built by start().
+    def sumReconstructionBandwidth(self, num_missing_blocks):
+        bandwidths = self.reconstruction_bandwidths
+        total = 0.0
+        for num in num_missing_blocks.tolist():
+            total += bandwidths[num]
+        return total
+
     # a slice start Unavailable
     def startUnavailable(self, slice_index, ts):
-        slice_unavail_durations = self.unavailable_durations.pop(slice_index, [])
-        if slice_unavail_durations == []:
-            slice_unavail_durations.append([ts, None])
-        else:
-            if slice_unavail_durations[-1][1] is None:
-                pass
-            else:
-                slice_unavail_durations.append([ts, None])
-        self.unavailable_durations[slice_index] = slice_unavail_durations
+        self.unavailable_durations.start(slice_index, ts)
+        if self.unavailable_ops is not None:
+            self.unavailable_ops.append((slice_index, ts, None))
 
     # a slice end Unavailable, the slice undurable or become available
     def endUnavailable(self, slice_index, ts):
-        slice_unavail_durations = self.unavailable_durations.pop(slice_index, [])
-        if slice_unavail_durations == []:
-            slice_unavail_durations.append([ts, self.end_time])
-        else:
-            if (self.durable_count[slice_index] < self.k) or \
-               (self.durable_count[slice_index] == self.k and self.latent_defect[slice_index]):
-                if slice_unavail_durations[-1][1] is None:
-                    slice_unavail_durations[-1][1] = self.end_time
-                else:
-                    slice_unavail_durations.append([ts, self.end_time])
-            else:
-                slice_unavail_durations[-1][1] = ts
-        self.unavailable_durations[slice_index] = slice_unavail_durations
+        unavailable = bool(
+            self.lost[slice_index] or
+            (self.durable_count[slice_index] < self.k) or
+            (self.durable_count[slice_index] == self.k and
+             self.latent_defect[slice_index]))
+        self.unavailable_durations.end(slice_index, ts, unavailable,
+                                       self.end_time)
+        if self.unavailable_ops is not None:
+            self.unavailable_ops.append((slice_index, ts, unavailable))
 
     def printPerYearStart(self, per_day_start, description):
         d = 0
@@ -260,66 +331,78 @@ class RandomDistributeEventHandler(EventHandler):
         info_logger.info(description + " " + str(len(per_day_start)/year) +
                          " " + str(d/365))
 
-    def printDegradedStat(self, degraded, description, unit):
-        current_sample_average = 0
-        current_time = 0
+    # Samples the step series degraded([(time, value), ...]) every minute of
+    # every day, until the day of its last time, and returns the average of
+    # every day, the number of days sampled and the max sample. A minute
+    # takes the value of the last time before the start of its hour, except
+    # the minute that reaches the end of the series: it takes the mean of
+    # the values of its hour, the rest of its day is 0. Python types are
+    # kept, an int series has int(floor) averages.
+    def sampleDays(self, degraded, samples, sampling_period=24):
+        day_samples = [0] * samples
+        if len(degraded) == 0:
+            return day_samples, 0, 0
+        values = [v for t, v in degraded]
+        is_float = any([isinstance(v, float) for v in values])
+        # the series is read in order, a time is only reached when all times
+        # before it are.
+        times = maximum.accumulate(array([t for t, v in degraded],
+                                         dtype=float))
+        event_values = array(values, dtype=float if is_float else int64)
+
+        last_hour = max(0, int(ceil(times[-1])))
+        last_day = min(last_hour/sampling_period, samples)
+        exhausted = last_hour/sampling_period == last_day
+        consumed = searchsorted(times, arange((last_day + 1)*sampling_period),
+                                side="right")
+        hour_values = where(consumed > 0,
+                            event_values[maximum(consumed - 1, 0)], 0)
+        if exhausted:
+            hour_values[last_hour:] = 0
+            if last_hour > 0:
+                start = consumed[last_hour - 1]
+            else:
+                start = 0
+            last_value = 0
+            for i, v in enumerate(values[start:]):
+                last_value = (last_value*i + v)/(i + 1)
+        max_v = max(0, hour_values.max())
+        if exhausted:
+            max_v = max(max_v, last_value)
+
+        # minute values are added one after another, like floats were.
+        day_hours = hour_values.reshape(last_day + 1, sampling_period)
+        sums = zeros(last_day + 1, dtype=event_values.dtype)
+        for i in xrange(sampling_period*60):
+            sums += day_hours[:, i/60]
+
+        avg_count = 0
+        day_reached = consumed[sampling_period - 1::sampling_period] > 0
+        for d in xrange(min(last_day + 1, samples)):
+            if exhausted and d == last_day:
+                day_sum = sums[d] + last_value
+            elif not day_reached[d]:
+                day_sum = 0
+            else:
+                day_sum = sums[d]
+            if not is_float:
+                day_sum = int(day_sum)
+            day_samples[d] = day_sum/(sampling_period*60)
+            avg_count += 1
+        return day_samples, avg_count, max_v
 
+    def printDegradedStat(self, degraded, description, unit):
         sampling_period = 24
-        # sampling per min, so 24*60 items in below list
-        values_per_sample = []
         samples = int(self.conf.total_time/24)
         if self.conf.total_time % 24 != 0:
             samples += 1
         samples += 1
 
-        day_samples = [0] * samples
-        previous_window_value = 0
+        day_samples, avg_count, max_v = self.sampleDays(degraded, samples,
+                                                        sampling_period)
         avg_of_avgs = 0
-        avg_count = 0
-        max_v = 0
-
-        it = iter(degraded)
-        try:
-            t = it.next()
-        except StopIteration:
-            t = None
-
-        while t is not None:
-            values_per_sample = [0]*(24*60)
-            for i in xrange(sampling_period*60):
-                if t is None:
-                    break
-                per_sample_count = 0
-                while True:
-                    if t[0] > current_time+i/60:
-                        per_sample_count = 0
-                        values_per_sample[i] = previous_window_value
-                        break
-                    else:
-                        values_per_sample[i] = (values_per_sample[i] *
-                                                per_sample_count+t[1]) /\
-                                               (per_sample_count+1)
-                        previous_window_value = t[1]
-                        per_sample_count += 1
-                        try:
-                            t = it.next()
-                        except StopIteration:
-                            t = None
-                            break
-
-            current_sample_average = 0
-            for i in xrange(sampling_period*60):
-                current_sample_average += values_per_sample[i]
-                if max_v < values_per_sample[i]:
-                    max_v = values_per_sample[i]
-            current_sample_average /= (sampling_period*60)
-
-            if int(current_time/24) >= samples:
-                break
-            day_samples[int(current_time/24)] = current_sample_average
-            current_time += sampling_period
-            avg_of_avgs += current_sample_average
-            avg_count += 1
+        for d in xrange(avg_count):
+            avg_of_avgs += day_samples[d]
 
         avg_of_avgs /= avg_count
         stdev = 0.0
@@ -333,9 +416,14 @@ class RandomDistributeEventHandler(EventHandler):
         self.printPerYearStart(day_samples, description)
 
     def end(self):
-        ret = Result()
-        Result.unavailable_count = self.unavailable_slice_count
-        Result.undurable_count = self.undurable_slice_count
+        if self.slice_log_weights is None:
+            ret = Result(self.unavailable_slice_count,
+                         self.undurable_slice_count)
+        else:
+            ret = Result(self.unavailable_slice_count,
+                         self.undurable_slice_count,
+                         self.weighted_unavailable_count,
+                         self.getSliceWeights(flatnonzero(self.lost)).sum())
 
         info_logger.info(
             "anomalous available count: %d, total latent failure: %d,\
@@ -376,31 +464,38 @@ class RandomDistributeEventHandler(EventHandler):
 
         self.analyzeBandwidth()
 
+        if len(self.unavailable_durations) != 0:
+            interval_levels, slice_levels = \
+                self.unavailable_durations.getPercentiles()
+            info_logger.info("unavailable durations(hours): p50:%f p90:%f "
+                             "p99:%f, per slice p50:%f p90:%f p99:%f" %
+                             tuple(interval_levels + slice_levels))
+
         return ret
 
     def handleEvent(self, e, queue):
         # print "********event info********"
         # print "event ID: ", e.event_id
         # print "event type: ", e.getType()
-        # print "event unit: ", e.getUnit().getFullName()
+        # print "event unit: ", e.getUnit(self.units).getFullName()
         # print "event Time: ", e.getTime()
         # print "event next reovery time: ", e.next_recovery_time
         if e.getType() == Event.EventType.Failure:
-            self.handleFailure(e.getUnit(), e.getTime(), e, queue)
+            self.handleFailure(e.getUnit(self.units), e.getTime(), e, queue)
         elif e.getType() == Event.EventType.Recovered:
-            self.handleRecovery(e.getUnit(), e.getTime(), e)
+            self.handleRecovery(e.getUnit(self.units), e.getTime(), e)
         elif e.getType() == Event.EventType.EagerRecoveryStart:
-            self.handleEagerRecoveryStart(e.getUnit(), e.getTime(), e, queue)
+            self.handleEagerRecoveryStart(e.getUnit(self.units), e.getTime(), e, queue)
         elif e.getType() == Event.EventType.EagerRecoveryInstallment:
-            self.handleEagerRecoveryInstallment(e.getUnit(), e.getTime(), e)
+            self.handleEagerRecoveryInstallment(e.getUnit(self.units), e.getTime(), e)
         elif e.getType() == Event.EventType.LatentDefect:
-            self.handleLatentDefect(e.getUnit(), e.getTime(), e)
+            self.handleLatentDefect(e.getUnit(self.units), e.getTime(), e)
         elif e.getType() == Event.EventType.LatentRecovered:
-            self.handleLatentRecovered(e.getUnit(), e.getTime(), e)
+            self.handleLatentRecovered(e.getUnit(self.units), e.getTime(), e)
         elif e.getType() == Event.EventType.ScrubStart:
-            self.handleScrubStart(e.getUnit(), e.getTime(), e)
+            self.handleScrubStart(e.getUnit(self.units), e.getTime(), e)
         elif e.getType() == Event.EventType.ScrubComplete:
-            self.handleScrubComplete(e.getUnit(), e.getTime(), e)
+            self.handleScrubComplete(e.getUnit(self.units), e.getTime(), e)
         else:
             raise Exception("Unknown event: " + e.getType())
 
@@ -458,19 +553,21 @@ class RandomDistributeEventHandler(EventHandler):
                             queue.addEvent(eager_recovery_start_event)
 
                 for child in u.getChildren():
-                    if child.getMetadata().slice_count == 0:
+                    if self.getSliceCount(child) == 0:
                         error_logger.error("lost machine failures")
-                        continue
-                    for i in xrange(child.getMetadata().slice_count):
-                        slice_index = child.getMetadata().slices[i]
-                        if self.durable_count[slice_index] == self.lost_slice:
-                            continue
-                        self.sliceDegradedAvailability(slice_index)
-                        self.available_count[slice_index] -= 1
-                        self._my_assert(self.available_count[slice_index] >= 0)
-                        if self.available_count[slice_index] < self.k:
-                            self.unavailable_slice_count += 1
-                            self.startUnavailable(slice_index, time)
+                # the slices of all disks at once, each slice at most once.
+                slices = self.index.getMachineSlices(u)
+                slices = slices[~self.lost[slices]]
+                self.slicesDegradedAvailability(slices)
+                self.available_count[slices] -= 1
+                self._my_assert((self.available_count[slices] >= 0).all())
+                unavailable = slices[self.available_count[slices] < self.k]
+                self.unavailable_slice_count += len(unavailable)
+                if self.slice_log_weights is not None:
+                    self.weighted_unavailable_count += \
+                        self.getSliceWeights(unavailable).sum()
+                for slice_index in unavailable.tolist():
+                    self.startUnavailable(slice_index, time)
 
                 self.slices_degraded_avail_list.append(
                     (e.getTime(), self.current_avail_slice_degraded))
@@ -479,88 +576,19 @@ class RandomDistributeEventHandler(EventHandler):
             self.total_disk_failures += 1
             u.setLastFailureTime(e.getTime())
             # need to compute projected reovery b/w needed
-            projected_bandwidth_need = 0.0
-
-            slice_count = u.getMetadata().slice_count
-            for i in xrange(slice_count):
-                slice_index = u.getMetadata().slices[i]
-                if self.durable_count[slice_index] == self.lost_slice:
-                    continue
-                if (u.getMetadata().nonexistent_slices is not None) and \
-                   (slice_index in u.getMetadata().nonexistent_slices):
-                    continue
-
-                self.sliceDegraded(slice_index)
-                self.durable_count[slice_index] -= 1
-                if u.getMetadata().nonexistent_slices is None:
-                    u.getMetadata().nonexistent_slices = set()
-                u.getMetadata().nonexistent_slices.add(slice_index)
-
-                self._my_assert(self.durable_count[slice_index] >= 0)
-
-                if (u.getMetadata().defective_slices is not None) and \
-                   slice_index in u.getMetadata().defective_slices:
-                    self.latent_defect[slice_index] = False
-                if (u.getMetadata().known_defective_slices is not None) and \
-                   slice_index in u.getMetadata().known_defective_slices:
-                    self.known_latent_defect[slice_index] = False
-
-                if self.durable_count[slice_index] < self.k:
-                    info_logger.info(
-                        "time: " + str(time) + " slice:" + str(slice_index) +
-                        " durCount:" + str(self.durable_count[slice_index]) +
-                        " latDefect:" + str(self.latent_defect[slice_index]) +
-                        " due to disk " + str(u.getID()))
-                    self.durable_count[slice_index] = self.lost_slice
-                    self.undurable_slice_count += 1
-                    self.endUnavailable(slice_index, time)
-                    continue
-
-                if self.durable_count[slice_index] == self.k and \
-                   self.latent_defect[slice_index]:
-                    info_logger.info(
-                        "time: " + str(time) + " slice:" + str(slice_index) +
-                        " durCount:" + str(self.durable_count[slice_index])
-                        + " latDefect:" + str(self.latent_defect[slice_index])
-                        + " due to latent error and disk " + str(u.getID()))
-                    self.durable_count[slice_index] = self.lost_slice
-                    self.undurable_slice_count += 1
-                    self.endUnavailable(slice_index, time)
-
-                # is this slice one that needs recovering? if so, how much
-                # data to recover?
-                if self.durable_count[slice_index] != self.lost_slice:
-                    threshold_crossed = False
-                    num_undurable = self.n - self.durable_count[slice_index]
-                    if self.known_latent_defect[slice_index]:
-                        num_undurable += 1
-                    if num_undurable >= self.n - self.recovery_threshold:
-                        threshold_crossed = True
-
-                    num_unavailable = 0
-                    if self.availability_counts_for_recovery:
-                        num_unavailable = self.n - \
-                            self.available_count[slice_index]
-                        if num_unavailable + num_undurable >= self.n - \
-                           self.recovery_threshold:
-                            threshold_crossed = True
-                    if threshold_crossed:
-                        projected_bandwidth_need += \
-                            self.computeReconstructionBandwidth(
-                                num_undurable + num_unavailable)
+            projected_bandwidth_need = self.failDiskSlices(u, time)
 
             # current recovery bandwidth goes up by projected bandwidth need
             projected_bandwidth_need /= (e.next_recovery_time -
                                          e.getTime())
-            u.setLastBandwidthNeed(projected_bandwidth_need)
-            self._my_assert(self.current_recovery_bandwidth >= 0)
-            self.current_recovery_bandwidth += projected_bandwidth_need
-            self._my_assert(self.current_recovery_bandwidth >= 0)
-            if self.current_recovery_bandwidth > self.max_recovery_bandwidth:
-                self.max_recovery_bandwidth = self.current_recovery_bandwidth
-            self._my_assert(self.current_recovery_bandwidth >= 0)
-            u.getMetadata().defective_slice = None
-            u.getMetadata().known_defective_slices = None
+            self.bandwidth_need[self.index.getRow(u)] = \
+                projected_bandwidth_need
+            self.addRecoveryBandwidth(projected_bandwidth_need)
+            # known defects of the disk are forgotten, the defective chunks
+            # themselves are kept.
+            start, end = self.index.getRange(u)
+            self.known_defective[start:end] = False
+            self.known_allocated[self.index.getRow(u)] = False
 
             self.slices_degraded_list.append((e.getTime(),
                                               self.current_slice_degraded))
@@ -585,34 +613,29 @@ class RandomDistributeEventHandler(EventHandler):
             # while the latter effect is simulated in disk recoveries
             # generated by this permanent machine recovery
             if e.info != 3:
-                for child in u.getChildren():
-                    slice_count = child.getMetadata().slice_count
-                    for i in xrange(slice_count):
-                        slice_index = child.getMetadata().slices[i]
-                        if self.durable_count[slice_index] == self.lost_slice:
-                            continue
-
-                        # We are going to check, using the 'info' field of the
-                        # event, whether this was a temporary machine failure
-                        # of short duration.
-                        # If so, then all of the availabilityCounts should be
-                        # less than n
-                        # If they are not, then anomalousAvailableCount will
-                        # be incremented
-                        if self.available_count[slice_index] < self.n:
-                            if self.available_count[slice_index] + self.durable_count[slice_index] == self.n + self.k - 1:
-                                self.endUnavailable(slice_index, time)
-                            self.available_count[slice_index] += 1
-                            self.sliceRecoveredAvailability(slice_index)
-                        elif e.info == 1:  # temp & short failure
-                            self.anomalous_available_count += 1
-                            # info_logger.info(
-                            #   "anomalous available count: %d Machine
-                            #    recovery: %s" %
-                            #   (self.anomalous_available_count, e.toString())
-                            # )
-                        else:
-                            pass
+                # the slices of all disks at once, each slice at most once.
+                slices = self.index.getMachineSlices(u)
+                slices = slices[~self.lost[slices]]
+
+                # We are going to check, using the 'info' field of the
+                # event, whether this was a temporary machine failure
+                # of short duration.
+                # If so, then all of the availabilityCounts should be
+                # less than n
+                # If they are not, then anomalousAvailableCount will
+                # be incremented
+                down = self.available_count[slices] < self.n
+                recovered = slices[down]
+                ending = recovered[self.available_count[recovered] +
+                                   self.durable_count[recovered] ==
+                                   self.n + self.k - 1]
+                for slice_index in ending.tolist():
+                    self.endUnavailable(slice_index, time)
+                self.available_count[recovered] += 1
+                self.slicesRecoveredAvailability(recovered)
+                if e.info == 1:  # temp & short failure
+                    self.anomalous_available_count += \
+                        len(slices) - len(recovered)
 
                 self.slices_degraded_avail_list.append(
                     (e.getTime(), self.current_avail_slice_degraded))
@@ -620,68 +643,13 @@ class RandomDistributeEventHandler(EventHandler):
         elif isinstance(u, Disk):
             self.total_disk_repairs += 1
             # this disk finished recovering, so decrement current recov b/w
-            self.current_recovery_bandwidth -= u.getLastBandwidthNeed()
-            if self.current_recovery_bandwidth > -1 and \
-               self.current_recovery_bandwidth < 0:
-                self.current_recovery_bandwidth = 0
-            self._my_assert(self.current_recovery_bandwidth >= 0)
-
-            transfer_required = 0.0
-            slice_count = u.getMetadata().slice_count
-            for i in xrange(slice_count):
-                slice_index = u.getMetadata().slices[i]
-                if self.durable_count[slice_index] == self.lost_slice:
-                    continue
-
-                threshold_crossed = False
-                actual_threshold = self.recovery_threshold
-                if self.conf.lazy_only_available:
-                    actual_threshold = self.n - 1
-                if (self.current_slice_degraded <
-                    (self.conf.max_degraded_slices *
-                     Configuration.total_slices)):
-                    actual_threshold = self.recovery_threshold
+            self.removeRecoveryBandwidth(
+                self.bandwidth_need[self.index.getRow(u)])
 
-                num_undurable = self.n - self.durable_count[slice_index]
-                if self.known_latent_defect[slice_index]:
-                    num_undurable += 1
-                if num_undurable >= self.n - actual_threshold:
-                    threshold_crossed = True
-
-                if self.availability_counts_for_recovery:
-                    num_unavailable = self.n - \
-                        self.available_count[slice_index]
-                    if num_unavailable + num_undurable >= self.n - \
-                       actual_threshold:
-                        threshold_crossed = True
-
-                if threshold_crossed:
-                    if self.lazy_recovery:
-                        # recovery all replicas of this slice.
-                        chunks_recovered = self.handleSliceRecovery(
-                            slice_index, e, True)
-                        if chunks_recovered > 0:
-                            # transfer required for 1 chunk is k,for 2 is k+1,
-                            # etc...
-                            transfer_required += \
-                                self.computeReconstructionBandwidth(
-                                    chunks_recovered)
-                            if self.durable_count[slice_index] + self.available_count[slice_index] >= self.n + self.k - chunks_recovered and self.durable_count[slice_index] + self.available_count[slice_index] <= self.n + self.k - 1:
-                                self.endUnavailable(slice_index, time)
-                    else:
-                        if (u.getMetadata().nonexistent_slices is not None) \
-                           and (slice_index in
-                                u.getMetadata().nonexistent_slices):
-                            u.getMetadata().nonexistent_slices.remove(
-                                slice_index)
-                            if self.durable_count[slice_index] + self.available_count[slice_index] == self.n + self.k - 1:
-                                self.endUnavailable(slice_index, time)
-                            self.durable_count[slice_index] += 1
-                            transfer_required += \
-                                self.computeReconstructionBandwidth(1)
-
-                    # must come after all counters are updated
-                    self.sliceRecovered(slice_index)
+            if not self.lazy_recovery and self.recoveryThresholdFixed():
+                transfer_required = self.recoverDiskSlices(u, time)
+            else:
+                transfer_required = self.recoverDiskSlicesInOrder(u, time, e)
 
             self.slices_degraded_list.append(
                 (e.getTime(), self.current_slice_degraded))
@@ -694,6 +662,176 @@ class RandomDistributeEventHandler(EventHandler):
             for tmp in u.getChildren():
                 self.handleRecovery(tmp, time, e)
 
+    # current recovery bandwidth goes up by the projected need of a failed
+    # disk.
+    def addRecoveryBandwidth(self, need):
+        self._my_assert(self.current_recovery_bandwidth >= 0)
+        self.current_recovery_bandwidth += need
+        self._my_assert(self.current_recovery_bandwidth >= 0)
+        if self.current_recovery_bandwidth > self.max_recovery_bandwidth:
+            self.max_recovery_bandwidth = self.current_recovery_bandwidth
+        self._my_assert(self.current_recovery_bandwidth >= 0)
+
+    def removeRecoveryBandwidth(self, need):
+        self.current_recovery_bandwidth -= need
+        if self.current_recovery_bandwidth > -1 and \
+           self.current_recovery_bandwidth < 0:
+            self.current_recovery_bandwidth = 0
+        self._my_assert(self.current_recovery_bandwidth >= 0)
+
+    # logs the loss of a slice.
+    def logLoss(self, message):
+        info_logger.info(message)
+
+    # recovery threshold of a disk recovery, depends on the number of
+    # degraded slices.
+    def getRecoveryThreshold(self):
+        actual_threshold = self.recovery_threshold
+        if self.conf.lazy_only_available:
+            actual_threshold = self.n - 1
+        if (self.current_slice_degraded <
+            (self.conf.max_degraded_slices *
+             self.total_slices)):
+            actual_threshold = self.recovery_threshold
+        return actual_threshold
+
+    # True if the threshold can't change during a disk recovery. The number
+    # of degraded slices only goes down while slices are recovered, so once
+    # below the limit, it stays there.
+    def recoveryThresholdFixed(self):
+        return self.recovery_threshold == self.n - 1 or \
+            not self.conf.lazy_only_available or \
+            self.getRecoveryThreshold() == self.recovery_threshold
+
+    # Disk failure part of handleFailure() for all slices of disk u at once,
+    # returns the projected recovery bandwidth need.
+    def failDiskSlices(self, u, time):
+        start, end = self.index.getRange(u)
+        slices = self.index.slice_ids[start:end]
+        hit = ~self.lost[slices] & ~self.nonexistent[start:end]
+        chunks = arange(start, end)[hit]
+        slices = slices[hit]
+
+        self.slicesDegraded(slices)
+        self.durable_count[slices] -= 1
+        self.nonexistent[chunks] = True
+        durable = self.durable_count[slices]
+        self._my_assert((durable >= 0).all())
+
+        self.latent_defect[slices[self.defective[chunks]]] = False
+        self.known_latent_defect[slices[self.known_defective[chunks]]] = False
+
+        lost_by_disk = durable < self.k
+        lost = lost_by_disk | ((durable == self.k) &
+                               self.latent_defect[slices])
+        for i in flatnonzero(lost).tolist():
+            slice_index = int(slices[i])
+            if lost_by_disk[i]:
+                self.logLoss(
+                    "time: " + str(time) + " slice:" + str(slice_index) +
+                    " durCount:" + str(durable[i]) +
+                    " latDefect:" + str(self.latent_defect[slice_index]) +
+                    " due to disk " + str(u.getID()))
+            else:
+                self.logLoss(
+                    "time: " + str(time) + " slice:" + str(slice_index) +
+                    " durCount:" + str(durable[i])
+                    + " latDefect:" + str(self.latent_defect[slice_index])
+                    + " due to latent error and disk " + str(u.getID()))
+            self.lost[slice_index] = True
+            self.undurable_slice_count += 1
+            self.endUnavailable(slice_index, time)
+
+        # is this slice one that needs recovering? if so, how much
+        # data to recover?
+        num_undurable, num_unavailable, threshold_crossed = \
+            self.slicesThresholdCrossed(slices[~lost],
+                                        self.recovery_threshold)
+        return self.sumReconstructionBandwidth(
+            (num_undurable + num_unavailable)[threshold_crossed])
+
+    # Disk recovery without lazy recovery and with a fixed threshold, all
+    # slices of disk u at once. Returns the data transfer required.
+    def recoverDiskSlices(self, u, time):
+        actual_threshold = self.getRecoveryThreshold()
+        start, end = self.index.getRange(u)
+        slices = self.index.slice_ids[start:end]
+        live = ~self.lost[slices]
+        chunks = arange(start, end)[live]
+        slices = slices[live]
+
+        threshold_crossed = self.slicesThresholdCrossed(
+            slices, actual_threshold)[2]
+        chunks = chunks[threshold_crossed]
+        slices = slices[threshold_crossed]
+
+        rebuilt = self.nonexistent[chunks]
+        self.nonexistent[chunks[rebuilt]] = False
+        rebuilt_slices = slices[rebuilt]
+        ending = rebuilt_slices[self.durable_count[rebuilt_slices] +
+                                self.available_count[rebuilt_slices] ==
+                                self.n + self.k - 1]
+        for slice_index in ending.tolist():
+            self.endUnavailable(slice_index, time)
+        self.durable_count[rebuilt_slices] += 1
+
+        # must come after all counters are updated
+        self.slicesRecovered(slices)
+        return self.sumReconstructionBandwidth(
+            full(len(rebuilt_slices), 1, dtype=STATE_DTYPE))
+
+    # Disk recovery slice by slice, for lazy recovery and thresholds that
+    # change during the recovery. Returns the data transfer required.
+    def recoverDiskSlicesInOrder(self, u, time, e):
+        transfer_required = 0.0
+        start = int(self.index.getRange(u)[0])
+        for chunk, slice_index in enumerate(self.index.getSliceList(u),
+                                            start):
+            if self.lost[slice_index]:
+                continue
+
+            threshold_crossed = False
+            actual_threshold = self.getRecoveryThreshold()
+
+            num_undurable = self.n - self.durable_count[slice_index]
+            if self.known_latent_defect[slice_index]:
+                num_undurable += 1
+            if num_undurable >= self.n - actual_threshold:
+                threshold_crossed = True
+
+            if self.availability_counts_for_recovery:
+                num_unavailable = self.n - \
+                    self.available_count[slice_index]
+                if num_unavailable + num_undurable >= self.n - \
+                   actual_threshold:
+                    threshold_crossed = True
+
+            if threshold_crossed:
+                if self.lazy_recovery:
+                    # recovery all replicas of this slice.
+                    chunks_recovered = self.handleSliceRecovery(
+                        slice_index, e, True)
+                    if chunks_recovered > 0:
+                        # transfer required for 1 chunk is k,for 2 is k+1,
+                        # etc...
+                        transfer_required += \
+                            self.computeReconstructionBandwidth(
+                                chunks_recovered)
+                        if self.durable_count[slice_index] + self.available_count[slice_index] >= self.n + self.k - chunks_recovered and self.durable_count[slice_index] + self.available_count[slice_index] <= self.n + self.k - 1:
+                            self.endUnavailable(slice_index, time)
+                else:
+                    if self.nonexistent[chunk]:
+                        self.nonexistent[chunk] = False
+                        if self.durable_count[slice_index] + self.available_count[slice_index] == self.n + self.k - 1:
+                            self.endUnavailable(slice_index, time)
+                        self.durable_count[slice_index] += 1
+                        transfer_required += \
+                            self.computeReconstructionBandwidth(1)
+
+                # must come after all counters are updated
+                self.sliceRecovered(slice_index)
+        return transfer_required
+
     def handleEagerRecoveryStart(self, u, time, e, queue):
         self._my_assert(isinstance(u, Machine))
         self.total_eager_machine_repairs += 1
@@ -744,10 +882,9 @@ class RandomDistributeEventHandler(EventHandler):
         total_num_chunks_added_for_repair = 0
         num_chunks_added_to_curr_installment = 0
         curr_time = time
+        rand = self.eventStream(u, time, LAZY_THRESHOLD).random
         for child in u.getChildren():
-            slice_count = child.getMetadata().slice_count
-            for i in xrange(slice_count):
-                slice_index = child.getMetadata().slices[i]
+            for slice_index in self.index.getSlices(child).tolist():
                 # When this machine failed, it decremented the availability
                 # count of all its slices. This eager recovery is the first
                 # point in time that this machine failure has been
@@ -757,7 +894,7 @@ class RandomDistributeEventHandler(EventHandler):
                 # it as an anomaly
                 if self.available_count[slice_index] >= self.n:
                     self.anomalous_available_count += 1
-                if self.durable_count[slice_index] == self.lost_slice:
+                if self.lost[slice_index]:
                     continue
 
                 threshold_crossed = False
@@ -769,7 +906,8 @@ class RandomDistributeEventHandler(EventHandler):
                     self.conf.chunk_size/recovery_rate
                 actual_threshold = self.conf.getAvailableLazyThreshold(
                     expected_recovery_time -
-                    slice_installment.getOriginalFailureTime())
+                    slice_installment.getOriginalFailureTime(),
+                    rand)
 
                 if num_undurable >= self.n - actual_threshold:
                     threshold_crossed = True
@@ -841,6 +979,7 @@ class RandomDistributeEventHandler(EventHandler):
         self._my_assert(isinstance(SliceSet, u))
         transfer_required = 0.0
         if u.getLastBandwidthNeed() != -1:
+            rand = self.eventStream(u, time, LAZY_THRESHOLD).random
             self.current_recovery_bandwidth -= u.getLastBandwidthNeed()
             if self.current_recovery_bandwidth < 0 and \
                self.current_recovery_bandwidth > -1:
@@ -849,7 +988,7 @@ class RandomDistributeEventHandler(EventHandler):
 
             for s in u.slices:
                 slice_index = s.intValue()
-                if self.durable_count[slice_index] == self.lost_slice:
+                if self.lost[slice_index]:
                     continue
 
                 threshold_crossed = False
@@ -859,7 +998,7 @@ class RandomDistributeEventHandler(EventHandler):
                 actual_threshold = self.recovery_threshold
                 # need uc = u?
                 actual_threshold = self.conf.getAvailableLazyThreshold(
-                    e.getTime() - u.getOriginalFailureTime())
+                    e.getTime() - u.getOriginalFailureTime(), rand)
 
                 if num_undurable >= self.n - actual_threshold:
                     threshold_crossed = True
@@ -909,21 +1048,23 @@ class RandomDistributeEventHandler(EventHandler):
 
     def handleLatentDefect(self, u, time, e):
         if isinstance(u, Disk):
-            if u.getMetadata().slice_count == 0:
+            slice_count = self.getSliceCount(u)
+            if slice_count == 0:
                 return
-            self._my_assert(u.getMetadata().slice_count > 10)
+            self._my_assert(slice_count > 10)
 
-            index = randint(0, self.conf.chunks_per_disk-1)
-            if index >= u.getMetadata().slice_count:
+            index = self.eventStream(u, time, LATENT_CHUNK).randint(
+                0, self.conf.chunks_per_disk-1)
+            if index >= slice_count:
                 self.total_skipped_latent += 1
                 return
-            slice_index = u.getMetadata().slices[index]
+            chunk = self.index.getRange(u)[0] + index
+            slice_index = int(self.index.slice_ids[chunk])
 
-            if self.durable_count[slice_index] == self.lost_slice:
+            if self.lost[slice_index]:
                 self.total_skipped_latent += 1
                 return
-            if (u.getMetadata().nonexistent_slices is not None) and \
-               (slice_index in u.getMetadata().nonexistent_slices):
+            if self.nonexistent[chunk]:
                 self.total_skipped_latent += 1
                 return
 
@@ -939,14 +1080,12 @@ class RandomDistributeEventHandler(EventHandler):
             self.latent_defect[slice_index] = True
             self.total_latent_failures += 1
 
-            # Maybe this if can be deleted.
-            if u.getMetadata().defective_slices is None:
-                u.getMetadata().defective_slices = set()
-            u.getMetadata().defective_slices.add(slice_index)
+            self.defective_allocated[self.index.getRow(u)] = True
+            self.defective[chunk] = True
 
             if self.durable_count[slice_index] == self.k and \
                self.latent_defect[slice_index]:
-                info_logger.info(
+                self.logLoss(
                     str(time) + " slice: " + str(slice_index) +
                     " durCount: " + str(self.durable_count[slice_index]) +
                     " latDefect " + str(self.latent_defect[slice_index]) +
@@ -954,8 +1093,8 @@ class RandomDistributeEventHandler(EventHandler):
                     str(u.getID()))
                 self.undurable_slice_count += 1
                 self.endUnavailable(slice_index, time)
-                self.durable_count[slice_index] = self.lost_slice
-                u.getMetadata().defective_slices.remove(slice_index)
+                self.lost[slice_index] = True
+                self.defective[chunk] = False
         else:
             raise Exception("Latent defect should only happen for disk")
 
@@ -968,23 +1107,10 @@ class RandomDistributeEventHandler(EventHandler):
         transfer_required = 0.0
         if isinstance(u, Disk):
             self.total_scrubs += 1
-            if u.getMetadata().defective_slices is None:
+            if not self.defective_allocated[self.index.getRow(u)]:
                 return
-            u.getMetadata().known_defective_slices = \
-                deepcopy(u.getMetadata().defective_slices)
-            for slice_index in u.getMetadata().known_defective_slices:
-                self.known_latent_defect[slice_index] = True
-            if u.getMetadata().known_defective_slices is None:
-                return
-            for slice_index in u.getMetadata().known_defective_slices:
-                self.total_scrub_repairs += 1
-                self.latent_defect[slice_index] = False
-                self.known_latent_defect[slice_index] = False
-                transfer_required += self.computeReconstructionBandwidth(1)
-                self.sliceRecovered(slice_index)
-
-            u.getMetadata().defective_slices = None
-            u.getMetadata().known_defective_slices = None
+            self.scrubDisk(u)
+            transfer_required = self.repairKnownDefects(u)
         else:
             raise Exception("Latent Recovered should only happen for disk")
         self.slices_degraded_list.append(
@@ -998,29 +1124,18 @@ class RandomDistributeEventHandler(EventHandler):
         if isinstance(u, Disk):
             u.setLastScrubStart(time)
             self.total_scrubs += 1
-            if u.getMetadata().defective_slices is None:
+            if not self.defective_allocated[self.index.getRow(u)]:
                 return
-            u.getMetadata().known_defective_slices = \
-                deepcopy(u.getMetadata().defective_slices)
-            for slice_index in u.getMetadata().known_defective_slices:
-                self.known_latent_defect[slice_index] = True
+            self.scrubDisk(u)
         else:
             raise Exception("Scrub start should only happen for disk")
 
     def handleScrubComplete(self, u, time, e):
         transfer_required = 0.0
         if isinstance(u, Disk):
-            if u.getMetadata().known_defective_slices is None:
+            if not self.known_allocated[self.index.getRow(u)]:
                 return
-            for slice_index in u.getMetadata().known_defective_slices:
-                self.total_scrub_repairs += 1
-                self.latent_defect[slice_index] = False
-                self.known_latent_defect[slice_index] = False
-                transfer_required += self.computeReconstructionBandwidth(1)
-                self.sliceRecovered(slice_index)
-
-            u.getMetadata().defective_slices = None
-            u.getMetadata().known_defective_slices = None
+            transfer_required = self.repairKnownDefects(u)
         else:
             raise Exception("Scrub complete should only happen for disk")
         self.slices_degraded_list.append(
@@ -1030,24 +1145,50 @@ class RandomDistributeEventHandler(EventHandler):
         self.addBandwidthStat(
             Recovery(u.getLastScrubStart(), e.getTime(), transfer_required))
 
+    # the scrub finds the latent errors of disk u, the known defects become
+    # those hit by now.
+    def scrubDisk(self, u):
+        start, end = self.index.getRange(u)
+        self.known_allocated[self.index.getRow(u)] = True
+        self.known_defective[start:end] = self.defective[start:end]
+        slices = self.index.slice_ids[start:end]
+        self.known_latent_defect[slices[self.defective[start:end]]] = True
+
+    # repairs the known defects of disk u, returns the data transfer
+    # required.
+    def repairKnownDefects(self, u):
+        start, end = self.index.getRange(u)
+        slices = self.index.slice_ids[start:end][self.known_defective[
+            start:end]]
+        self.total_scrub_repairs += len(slices)
+        self.latent_defect[slices] = False
+        self.known_latent_defect[slices] = False
+        self.slicesRecovered(slices)
+
+        self.defective[start:end] = False
+        self.known_defective[start:end] = False
+        row = self.index.getRow(u)
+        self.defective_allocated[row] = False
+        self.known_allocated[row] = False
+        return self.sumReconstructionBandwidth(
+            full(len(slices), 1, dtype=STATE_DTYPE))
+
     def handleSliceRecovery(self, slice_index, e, is_durable_failure):
-        if self.durable_count[slice_index] == self.lost_slice:
+        if self.lost[slice_index]:
             return 0
 
         recovered = 0
         for i in xrange(self.n):
-            disk = self.slice_locations[slice_index][i]
-            if (disk.getMetadata().known_defective_slices is not None) and \
-               (slice_index in disk.getMetadata().known_defective_slices):
+            chunk = self.index.slice_chunks[slice_index, i]
+            if self.known_defective[chunk]:
                 self.latent_defect[slice_index] = False
                 self.known_latent_defect[slice_index] = False
-                disk.getMetadata().defective_slices.remove(slice_index)
-                disk.getMetadata().known_defective_slices.remove(slice_index)
+                self.defective[chunk] = False
+                self.known_defective[chunk] = False
                 recovered += 1
-            if (disk.getMetadata().nonexistent_slices is not None) and \
-               (slice_index in disk.getMetadata().nonexistent_slices):
+            if self.nonexistent[chunk]:
                 self.durable_count[slice_index] += 1
-                disk.getMetadata().nonexistent_slices.remove(slice_index)
+                self.nonexistent[chunk] = False
                 recovered += 1
         self._my_assert((not self.known_latent_defect[slice_index]) and
                         (self.durable_count[slice_index] == self.n))
@@ -1059,85 +1200,148 @@ class RandomDistributeEventHandler(EventHandler):
 
         return recovered
 
-    def start(self, root, total_slices, disk_count):
-        self.distributeSlices(root, total_slices, disk_count)
-
-    def distributeSlices(self, root, total_slices, disk_count):
+    # Log likelihood ratio of every slice, the sum of those of the units
+    # holding its chunks(the disks and their ancestors, each unit once). The
+    # loss of a slice only depends on the draws of these units, so its
+    # indicator times the ratio of the slice is an unbiased estimate, unlike
+    # with the ratio of all draws, which vanishes as the system grows. None
+    # unless failures are biased. Events must be generated before the
+    # handler starts.
+    def getSliceLogWeights(self):
+        ratios = array([u.getLogLikelihoodRatio() for u in self.units])
+        if not ratios.any():
+            return None
+        if self.conf.stream_events:
+            raise Exception("Biased failures need the events generated "
+                            "before the handling, not stream_events")
+        # ids of the ancestors of the disks(by row) level by level, -1
+        # above the root, which indexes the ratio 0 appended.
+        chains = []
+        for disk in self.index.disks:
+            chain = []
+            u = disk
+            while u is not None:
+                chain.append(u.getID())
+                u = u.getParent()
+            chains.append(chain)
+        depth = max([len(chain) for chain in chains])
+        ancestors = full((len(chains), depth), -1, dtype=int64)
+        for row, chain in enumerate(chains):
+            ancestors[row, :len(chain)] = chain
+        ratios = append(ratios, 0.0)
+
+        weights = zeros(self.total_slices)
+        for level in xrange(depth):
+            ids = sort(ancestors[:, level][self.locations], axis=1)
+            first = ones(ids.shape, dtype=bool)
+            first[:, 1:] = ids[:, 1:] != ids[:, :-1]
+            weights += where(first, ratios[ids], 0.0).sum(axis=1)
+        return weights
+
+    # likelihood ratios of slices, 1 unless failures are biased.
+    def getSliceWeights(self, slices):
+        if self.slice_log_weights is None:
+            return ones(len(slices))
+        return exp(self.slice_log_weights[slices])
+
+    # total unavailable time of the slices, weighted by their likelihood
+    # ratios.
+    def getUnavailableTime(self):
+        if self.slice_log_weights is None or \
+                len(self.unavailable_durations) == 0:
+            return self.unavailable_durations.getTotal()
+        slice_ids, totals = self.unavailable_durations.getSliceTotals()
+        return (totals*self.getSliceWeights(slice_ids)).sum()
+
+    # The random module can't be pickled, its state is saved by
+    # simulator.Checkpoint.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state["rng"] is random:
+            state["rng"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = random
+
+    # Draws from RandomStreams keyed by master_seed instead of rng: one for
+    # the handler, and one for each event that needs random numbers(see
+    # eventStream()), so those don't depend on the events handled before.
+    def setRandomStreams(self, master_seed):
+        self.stream_seed = master_seed
+        self.rng = RandomStream(streamKey(master_seed, purposeID("handler")))
+
+    # random number generator of the draws of purpose for the event of unit
+    # u at time, rng without random streams.
+    def eventStream(self, u, time, purpose):
+        if self.stream_seed is None:
+            return self.rng
+        return RandomStream(streamKey(self.stream_seed, u.getID(),
+                                      timeKey(time), purpose))
+
+    # layouts, see distributeSlices().
+    def start(self, root, total_slices, disk_count, layouts=None):
+        self.root = root
+        # unit ids of the events are resolved with the table of root.
+        self.units = root.getUnits()
+        self.distributeSlices(root, total_slices, disk_count, layouts)
+        self.slice_log_weights = self.getSliceLogWeights()
+        self.reconstruction_bandwidths = [
+            self.computeReconstructionBandwidth(num)
+            for num in xrange(2 * self.n + 2)]
+
+    # number of chunks on the disk. Kept by the handler rather than read from
+    # the disk metadata, which is shared by all handlers of the units.
+    def getSliceCount(self, disk):
+        return int(self.index.counts[self.index.getRow(disk)])
+
+    # layouts is an optional dict shared by handlers of the same system, a
+    # layout placed by one of them is reused by the others with the same n,
+    # slice count and placement seed.
+    def distributeSlices(self, root, total_slices, disk_count, layouts=None):
         disks = []
-        self.slice_locations = []
-        self.available_count = [0] * total_slices
-        self.durable_count = [0] * total_slices
-        self.latent_defect = [None] * total_slices
-        self.known_latent_defect = [None] * total_slices
+        self.total_slices = total_slices
+        self.available_count = full(total_slices, self.n, dtype=STATE_DTYPE)
+        self.durable_count = full(total_slices, self.n, dtype=STATE_DTYPE)
+        self.latent_defect = zeros(total_slices, dtype=bool)
+        self.known_latent_defect = zeros(total_slices, dtype=bool)
+        self.lost = zeros(total_slices, dtype=bool)
 
         self.getAllDisks(root, disks)
-        for i in xrange(total_slices):
-            self.slice_locations.append([])
-            tmp_racks = [item for item in disks]
-            for j in xrange(self.n):
-                if j < self.num_chunks_diff_racks:
-                    self.distributeOneSliceToOneDisk(i, disks, tmp_racks, True)
-                else:
-                    self.distributeOneSliceToOneDisk(i, disks, tmp_racks,
-                                                     False)
-
-            # print "tmp_racks:%d, rack_count:%d, n:%d" % (len(tmp_racks), Configuration.rack_count, self.n)
-            self._my_assert(len(tmp_racks) == (Configuration.rack_count -
-                                               self.n))
-            self._my_assert(len(self.slice_locations[i]) == self.n)
-            self.available_count[i] = self.n
-            self.durable_count[i] = self.n
-
-        self._my_assert(len(self.slice_locations) == total_slices)
-
-    def distributeOneSliceToOneDisk(self, slice_index, disks, available_racks,
-                                    separate_racks):
-        retry_count = 0
-        same_rack_count = 0
-        same_disk_count = 0
-        full_disk_count = 0
-        while True:
-            retry_count += 1
-            # choose disk from the right rack
-            if len(available_racks) == 0:
-                raise Exception("No racks left")
-            prev_racks_index = randint(0, len(available_racks)-1)
-            rack_disks = available_racks[prev_racks_index]
-
-            disk_index_in_rack = randint(0, len(rack_disks)-1)
-            disk = rack_disks[disk_index_in_rack]
-            if disk.getMetadata().slice_count >= self.conf.chunks_per_disk:
-                full_disk_count += 1
-                rack_disks.remove(disk)
-
-                if len(rack_disks) == 0:
-                    error_logger.error(
-                        "One rack is completely full " +
-                        str(disk.getParent().getParent().getID()))
-                    available_racks.remove(rack_disks)
-                    disks.remove(rack_disks)
-                if retry_count > 100:
-                    error_logger.error(
-                        "Unable to distribute slice " +
-                        str(slice_index) + "; picked full disk " +
-                        str(full_disk_count) + " times, same rack " +
-                        str(same_rack_count) + " times, and same disk " +
-                        str(same_disk_count) + " times")
-                    raise Exception("Disk distribution failed")
-
-                continue
-
-            available_racks.remove(rack_disks)
-
-            m = disk.getMetadata()
-            if m.slices == []:
-                m.slices = [-10] * self.conf.chunks_per_disk
+        placement = SlicePlacement(disks, self.n, self.conf.chunks_per_disk,
+                                   self.num_chunks_diff_racks)
+        all_disks = placement.disks
+        seed = self.conf.placement_seed
+        if seed is None:
+            seed = self.rng.randint(0, 2**31 - 2)
+            cache = None
+        else:
+            cache = self.conf.placement_cache
 
-            # LZR
-            self.slice_locations[slice_index].append(disk)
-            m.slices[m.slice_count] = slice_index
-            m.slice_count += 1
-            break
+        key = (self.n, total_slices, seed)
+        if layouts is not None and key in layouts:
+            self.locations, self.index = layouts[key]
+        else:
+            if cache is not None:
+                self.locations = placement.placeCached(total_slices, seed,
+                                                       self.k, cache)
+            else:
+                self.locations = placement.place(total_slices, seed)
+            self.index = SliceIndex(all_disks, self.locations)
+            if layouts is not None:
+                layouts[key] = (self.locations, self.index)
+
+        self.bandwidth_need = [0]*len(all_disks)
+        for disk, count in zip(all_disks, self.index.counts.tolist()):
+            disk.getMetadata().slice_count = count
+        chunk_count = self.index.getChunkCount()
+        self.nonexistent = zeros(chunk_count, dtype=bool)
+        self.defective = zeros(chunk_count, dtype=bool)
+        self.known_defective = zeros(chunk_count, dtype=bool)
+        self.defective_allocated = zeros(len(all_disks), dtype=bool)
+        self.known_allocated = zeros(len(all_disks), dtype=bool)
 
     def getAllDisks(self, u, disks):
         for tmp in u.getChildren():
@@ -1154,5 +1358,48 @@ class RandomDistributeEventHandler(EventHandler):
                 disks.append(m)
 
 
+
+# Bytes per slice of the slice state(counters and flags) and of the disk to
+# slice lists, as Python lists and sets(before SliceIndex) and as numpy
+# arrays. usage: RandomDistributeEventHandler.py [total_slices] [n]
+def main():
+    total_slices = 1000000
+    if len(sys.argv) > 1:
+        total_slices = int(sys.argv[1])
+    n = 14
+    if len(sys.argv) > 2:
+        n = int(sys.argv[2])
+    chunks_per_disk = 200
+
+    # lists of small ints, None and bools point to shared objects.
+    lists = [[n] * total_slices, [n] * total_slices,
+             [None] * total_slices, [None] * total_slices]
+    list_bytes = sum([sys.getsizeof(l) for l in lists])
+    arrays = [zeros(total_slices, dtype=STATE_DTYPE),
+              zeros(total_slices, dtype=STATE_DTYPE),
+              zeros(total_slices, dtype=bool),
+              zeros(total_slices, dtype=bool),
+              zeros(total_slices, dtype=bool)]
+    array_bytes = sum([a.nbytes for a in arrays])
+    print "slice state: lists %.1f bytes/slice, arrays %.1f bytes/slice" % \
+        (float(list_bytes)/total_slices, float(array_bytes)/total_slices)
+
+    # every disk listed its slices, with one boxed int per chunk, and 1% of
+    # the chunks sit in a defective set.
+    chunk_count = total_slices*n
+    slice_ids = permutation(chunk_count) % total_slices
+    disk_lists = [slice_ids[i:i+chunks_per_disk].tolist()
+                  for i in xrange(0, chunk_count, chunks_per_disk)]
+    defective = set(slice_ids[:chunk_count/100].tolist())
+    list_bytes = sum([sys.getsizeof(l) for l in disk_lists]) + \
+        sum([sys.getsizeof(i) for l in disk_lists for i in l]) + \
+        sys.getsizeof(defective)
+    disk_count = len(disk_lists)
+    array_bytes = slice_ids.astype(int32).nbytes*2 + \
+        (disk_count + 1)*8 + chunk_count*3 + disk_count*2
+    print "disk slices: lists %.1f bytes/slice, arrays %.1f bytes/slice" % \
+        (float(list_bytes)/total_slices, float(array_bytes)/total_slices)
+
+
 if __name__ == "__main__":
-    pass
+    main()
@@ -0,0 +1,550 @@
+import sys
+import traceback
+from multiprocessing import Process, Queue, Semaphore, cpu_count
+from multiprocessing.sharedctypes import RawArray
+from time import time, clock
+
+from numpy import array, frombuffer, full, int32, int64
+
+from simulator.Event import Event
+from simulator.unit.Rack import Rack
+from simulator.utils.Log import info_logger
+from simulator.eventHandler.RandomDistributeEventHandler import \
+    RandomDistributeEventHandler, Recovery, LATENT_CHUNK
+
+# slice and chunk state, kept in shared memory and written by all shards.
+SHARED_ARRAYS = ("available_count", "durable_count", "latent_defect",
+                 "known_latent_defect", "lost", "nonexistent", "defective",
+                 "known_defective", "defective_allocated", "known_allocated")
+# counters of the shards, added to those of the handler by end().
+SHARD_COUNTERS = ("anomalous_available_count", "unavailable_slice_count",
+                  "undurable_slice_count", "total_latent_failures",
+                  "total_scrubs", "total_scrub_repairs",
+                  "total_disk_failures", "total_disk_repairs",
+                  "total_machine_failures", "total_machine_repairs",
+                  "total_perm_machine_failures",
+                  "total_short_temp_machine_failures",
+                  "total_long_temp_machine_failures",
+                  "total_machine_failures_due_to_rack_failures",
+                  "total_eager_machine_repairs", "total_eager_slice_repairs",
+                  "total_skipped_latent",
+                  "total_incomplete_recovery_attempts",
+                  "weighted_unavailable_count", "waits")
+RECOVERED = Event.EventType.Recovered.value
+FAILURE = Event.EventType.Failure.value
+LATENT_DEFECT = Event.EventType.LatentDefect.value
+SCRUB_START = Event.EventType.ScrubStart.value
+SCRUB_COMPLETE = Event.EventType.ScrubComplete.value
+LATENT_RECOVERED = Event.EventType.LatentRecovered.value
+# seconds after which a waiting shard checks again if it wasn't woken up.
+WAIT_TIME = 0.01
+
+
+# copy of array a in shared memory, forked processes write to the same one.
+def sharedArray(a):
+    buf = RawArray("b", max(a.nbytes, 1))
+    shared = frombuffer(buf, dtype=a.dtype, count=a.size).reshape(a.shape)
+    shared[...] = a
+    return shared
+
+
+# Loop of shard number shard: handles the parts of its events sent by the
+# handler in order and sends back the records of their handling, one list per
+# part, with the processor time of each. Before an event, it waits until the
+# other shards have handled the events before it on its slices. None stops it,
+# its counters are sent back. An error is sent as its traceback.
+def runShard(handler, shard):
+    handler.recording = True
+    handler.unavailable_ops = []
+    progress = handler.progress
+    waiting = handler.waiting_shard
+    while True:
+        part = handler.parts[shard].get()
+        try:
+            if part is None:
+                handler.records.put(dict([(name, getattr(handler, name))
+                                          for name in SHARD_COUNTERS]))
+                return
+            records = []
+            for position, fields, degraded, waits in part:
+                for other, last in waits:
+                    if progress[other] < last:
+                        handler.waits += 1
+                        handler.waitFor(shard, other, last)
+                st_time = clock()
+                record = handler.handleRecorded(fields, degraded)
+                records.append((position, record, clock() - st_time))
+                progress[shard] = position
+                if (waiting == shard).any():
+                    handler.wakeWaiting(shard, position)
+            handler.records.put(records)
+        except Exception:
+            handler.records.put(traceback.format_exc())
+            return
+
+
+class ShardedEventHandler(RandomDistributeEventHandler):
+    """
+    RandomDistributeEventHandler with the events of the disks, machines and
+    racks handled by shard_count processes. Racks are split into shard_count
+    groups(in getAllDisks() order), every shard handles the events of the
+    units of its racks. Slice and chunk state(the per slice counts and
+    flags) is in shared memory, every shard updates it in place.
+
+    The handler numbers the events of the shards in time order and sends
+    them to their shards in parts of part_size events, without waiting for
+    them to be handled. Every shard handles its events in order, one after
+    the other. An event only waits for another shard if that shard had the
+    last event before it on one of its slices, until that event is handled
+    (see the progress array). So the state of every slice goes through the
+    same changes, in the same order, as with a single handler, and losses
+    are found at the same event, while the events of a shard on its own
+    slices go on with no synchronization. Slices are placed across racks,
+    so most events share slices with the last events of the other shards,
+    which limits how far the shards run ahead of each other(the projected
+    speedup of main() shows how far).
+
+    The shards record what depends on the events of the other shards:
+    changes of the degraded slice counts, unavailable interval updates,
+    recovery bandwidth and lost slice messages. The handler replays the
+    records in event order as they come back. Events of units above the
+    racks, whose slices are on all shards, and disk recoveries whose
+    threshold depends on the number of degraded slices of all shards wait
+    until all shards are done(see synchronize()).
+
+    Needs random streams(see setRandomStreams()), the random module draws
+    of the shards would be different. Eager recovery is not supported.
+    """
+
+    def __init__(self, shard_count, conf=None, part_size=256):
+        RandomDistributeEventHandler.__init__(self, conf)
+        self.shard_count = shard_count
+        self.part_size = part_size
+        # True in the shard processes.
+        self.recording = False
+        # unit id -> (shard, first chunk, end chunk, is disk) of the units
+        # of the racks.
+        self.shards = {}
+        self.processes = []
+        # queues of the parts of the shards, and of their records.
+        self.parts = []
+        self.records = None
+        # per shard, [(position, event fields, degraded slice count or None,
+        # [(shard, position), ...] to wait for), ...] not sent yet.
+        self.part = []
+        self.position = 0
+        # per shard, the position of its last event on every slice, -1 if
+        # none.
+        self.last_positions = []
+        # disk id -> slices of the chunks hit by latent defects since its
+        # last repair, those a scrub may change.
+        self.defects = {}
+        # per shard, position of the last event it has handled, the shard
+        # and position it waits for(-1 if none) and the semaphore it waits
+        # on, in shared memory.
+        self.progress = None
+        self.waiting_shard = None
+        self.waiting_position = None
+        self.wakeups = []
+        # position -> record received but not replayed yet.
+        self.received = {}
+        self.replayed = 0
+        self.synchronizations = 0
+        # events which waited for another shard, counted by the shards.
+        self.waits = 0
+        # if not None, [(shard or None, processor time of the handler,
+        # synchronized, waits), ...] per event and the processor times of
+        # the events of the shards by position, see projectTime().
+        self.timing = None
+        self.costs = {}
+        # a disk recovery depends on the number of degraded slices, see
+        # getRecoveryThreshold().
+        self.threshold_fixed = self.recovery_threshold == self.n - 1 or \
+            not self.conf.lazy_only_available
+
+        # records of the event being handled, in the shards.
+        self.bandwidth_ops = []
+        self.recoveries = []
+        self.messages = []
+
+    def __getstate__(self):
+        raise Exception("A sharded handler can't be saved")
+
+    def start(self, root, total_slices, disk_count, layouts=None):
+        if self.stream_seed is None:
+            raise Exception("Sharded handling needs random_streams")
+        RandomDistributeEventHandler.start(self, root, total_slices,
+                                           disk_count, layouts)
+        for name in SHARED_ARRAYS:
+            setattr(self, name, sharedArray(getattr(self, name)))
+        self.last_positions = [full(total_slices, -1, dtype=int32)
+                               for i in xrange(self.shard_count)]
+        self.progress = sharedArray(full(self.shard_count, -1, dtype=int64))
+        self.waiting_shard = sharedArray(full(self.shard_count, -1,
+                                              dtype=int64))
+        self.waiting_position = sharedArray(full(self.shard_count, -1,
+                                                 dtype=int64))
+        self.wakeups = [Semaphore(0) for i in xrange(self.shard_count)]
+        self.part = [[] for i in xrange(self.shard_count)]
+        self.assignShards(root)
+        self.startShards()
+
+    def getRacks(self, u, racks):
+        for tmp in u.getChildren():
+            if isinstance(tmp, Rack):
+                racks.append(tmp)
+            else:
+                self.getRacks(tmp, racks)
+
+    # chunk range of the disks, which are next to each other in the index.
+    def getChunkRange(self, disks):
+        if disks == []:
+            return 0, 0
+        return self.index.getRange(disks[0])[0], \
+            self.index.getRange(disks[-1])[1]
+
+    def assignShards(self, root):
+        racks = []
+        self.getRacks(root, racks)
+        for i, rack in enumerate(racks):
+            shard = i*self.shard_count/len(racks)
+            rack_disks = []
+            for machine in rack.getChildren():
+                if machine.eager_recovery_enabled:
+                    raise Exception("Eager recovery can't be sharded")
+                disks = machine.getChildren()
+                start, end = self.getChunkRange(disks)
+                self.shards[machine.getID()] = (shard, start, end, False)
+                for disk in disks:
+                    start, end = self.index.getRange(disk)
+                    self.shards[disk.getID()] = (shard, start, end, True)
+                rack_disks += disks
+            start, end = self.getChunkRange(rack_disks)
+            self.shards[rack.getID()] = (shard, start, end, False)
+
+    def startShards(self):
+        self.parts = [Queue() for i in xrange(self.shard_count)]
+        self.records = Queue()
+        for i in xrange(self.shard_count):
+            process = Process(target=runShard, args=(self, i))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def handleEvent(self, e, queue):
+        if self.timing is None:
+            self.dispatch(e, queue)
+            return
+        st_time = clock()
+        synchronizations = self.synchronizations
+        shard, waits = self.dispatch(e, queue)
+        self.timing.append((shard, clock() - st_time,
+                            self.synchronizations != synchronizations, waits))
+
+    # Sends event e to its shard, returns the shard and the events it waits
+    # for, None and [] if the handler handles it.
+    def dispatch(self, e, queue):
+        if e.unit_id not in self.shards:
+            # above the racks, its slices are on all shards.
+            self.synchronize()
+            RandomDistributeEventHandler.handleEvent(self, e, queue)
+            return None, []
+        # neither changes anything.
+        if e.ignore and e.type in (FAILURE, RECOVERED):
+            return None, []
+
+        shard, start, end, is_disk = self.shards[e.unit_id]
+        slices = self.index.slice_ids[start:end]
+        if is_disk:
+            slices = self.getEventSlices(e, slices)
+        degraded = None
+        if is_disk and e.type == RECOVERED and not self.threshold_fixed:
+            self.synchronize()
+            degraded = self.current_slice_degraded
+        waits = self.getWaits(shard, slices)
+        self.part[shard].append((self.position,
+                                 (e.type, e.time, e.unit_id, e.info,
+                                  e.ignore, e.next_recovery_time),
+                                 degraded,
+                                 [(other, last) for other, last in waits
+                                  if last > self.progress[other]]))
+        self.position += 1
+        if self.position % self.part_size == 0:
+            self.send()
+        return shard, waits
+
+    # Slices of the disk event e(of the given slices) its handling may read
+    # or change: the slice hit by a latent defect, known in advance with
+    # random streams, those hit by the latent defects since the last repair
+    # for scrubs, all of them otherwise. Only latent defects of the disk make
+    # chunks defective, lazy recoveries of other disks may only repair them,
+    # so the defective chunks are among those hit.
+    def getEventSlices(self, e, slices):
+        if e.type == LATENT_DEFECT:
+            stream = self.eventStream(e.getUnit(self.units), e.time,
+                                      LATENT_CHUNK)
+            index = stream.randint(0, self.conf.chunks_per_disk-1)
+            slices = slices[index:index+1]
+            self.defects.setdefault(e.unit_id, []).extend(slices.tolist())
+            return slices
+        if e.type in (SCRUB_START, LATENT_RECOVERED, SCRUB_COMPLETE):
+            hit = self.defects.get(e.unit_id, [])
+            if e.type != SCRUB_START:
+                # all defects of the disk are repaired.
+                self.defects[e.unit_id] = []
+            return array(hit, dtype=slices.dtype)
+        return slices
+
+    # [(shard, position), ...] of the last events of the other shards on the
+    # slices of the event of shard at self.position, which is then the last
+    # one on them.
+    def getWaits(self, shard, slices):
+        waits = []
+        for other in xrange(self.shard_count):
+            if other != shard:
+                last = int(self.last_positions[other][slices].max(
+                    initial=-1))
+                if last >= 0:
+                    waits.append((other, last))
+        self.last_positions[shard][slices] = self.position
+        return waits
+
+    # Blocks shard until shard other has handled its event at position last.
+    # A wakeup missed while both check at the same time costs WAIT_TIME.
+    def waitFor(self, shard, other, last):
+        self.waiting_position[shard] = last
+        self.waiting_shard[shard] = other
+        while self.progress[other] < last:
+            self.wakeups[shard].acquire(True, WAIT_TIME)
+        self.waiting_shard[shard] = -1
+
+    # Wakes up the shards waiting for shard, which has handled its event at
+    # position.
+    def wakeWaiting(self, shard, position):
+        for i in xrange(self.shard_count):
+            if self.waiting_shard[i] == shard and \
+                    self.waiting_position[i] <= position:
+                self.waiting_shard[i] = -1
+                self.wakeups[i].release()
+
+    # Sends the parts of the shards. The events they wait for are all sent
+    # by then.
+    def send(self):
+        for shard in xrange(self.shard_count):
+            if self.part[shard]:
+                self.parts[shard].put(self.part[shard])
+                self.part[shard] = []
+        while not self.records.empty():
+            self.receive()
+
+    # Replays the records received from a shard, and all before them.
+    def receive(self):
+        reply = self.records.get()
+        if isinstance(reply, str):
+            raise Exception("A shard failed:\n" + reply)
+        for position, record, cost in reply:
+            self.received[position] = record
+            if self.timing is not None:
+                self.costs[position] = cost
+        while self.replayed in self.received:
+            self.replay(self.received.pop(self.replayed))
+            self.replayed += 1
+
+    # Waits until the shards have handled all events sent to them and
+    # replays their records, the state and counters are then those of a
+    # single handler.
+    def synchronize(self):
+        self.send()
+        while self.replayed < self.position:
+            self.receive()
+        self.synchronizations += 1
+
+    # Handles one event in a shard, returns what the handler replays: the
+    # degraded slice counts before and after it, the series, unavailable,
+    # bandwidth, recovery and message records. degraded is the number of
+    # degraded slices of all shards if the event depends on it.
+    def handleRecorded(self, fields, degraded):
+        e = Event.fromIDs(*fields)
+        if degraded is not None:
+            self.current_slice_degraded = degraded
+        before = (self.current_slice_degraded,
+                  self.current_avail_slice_degraded)
+        self.slices_degraded_list = []
+        self.slices_degraded_avail_list = []
+        del self.unavailable_ops[:]
+        self.bandwidth_ops = []
+        self.recoveries = []
+        self.messages = []
+        RandomDistributeEventHandler.handleEvent(self, e, None)
+        return (before, (self.current_slice_degraded,
+                         self.current_avail_slice_degraded),
+                self.slices_degraded_list, self.slices_degraded_avail_list,
+                list(self.unavailable_ops), self.bandwidth_ops,
+                self.recoveries, self.messages)
+
+    def replay(self, record):
+        before, after, degraded_list, avail_list, unavailable_ops, \
+            bandwidth_ops, recoveries, messages = record
+        for message in messages:
+            info_logger.info(message)
+        log = self.unavailable_durations
+        for slice_index, ts, unavailable in unavailable_ops:
+            if unavailable is None:
+                log.start(slice_index, ts)
+            else:
+                log.end(slice_index, ts, unavailable, self.end_time)
+        for added, need in bandwidth_ops:
+            if added:
+                self.addRecoveryBandwidth(need)
+            else:
+                self.removeRecoveryBandwidth(need)
+
+        offset = self.current_slice_degraded - before[0]
+        self.slices_degraded_list += [(t, value + offset)
+                                      for t, value in degraded_list]
+        self.current_slice_degraded += after[0] - before[0]
+        offset = self.current_avail_slice_degraded - before[1]
+        self.slices_degraded_avail_list += [(t, value + offset)
+                                            for t, value in avail_list]
+        self.current_avail_slice_degraded += after[1] - before[1]
+
+        for start, end, data_recovered in recoveries:
+            self.addBandwidthStat(Recovery(start, end, data_recovered))
+
+    def addRecoveryBandwidth(self, need):
+        if self.recording:
+            self.bandwidth_ops.append((True, need))
+        else:
+            RandomDistributeEventHandler.addRecoveryBandwidth(self, need)
+
+    def removeRecoveryBandwidth(self, need):
+        if self.recording:
+            self.bandwidth_ops.append((False, need))
+        else:
+            RandomDistributeEventHandler.removeRecoveryBandwidth(self, need)
+
+    def addBandwidthStat(self, r):
+        if self.recording:
+            self.recoveries.append((r.start, r.end, r.data_recovered))
+        else:
+            RandomDistributeEventHandler.addBandwidthStat(self, r)
+
+    def logLoss(self, message):
+        if self.recording:
+            self.messages.append(message)
+        else:
+            RandomDistributeEventHandler.logLoss(self, message)
+
+    # Handles the last events and stops the shards, their counters are added
+    # to those of the handler.
+    def end(self):
+        self.synchronize()
+        for part in self.parts:
+            part.put(None)
+        for i in xrange(self.shard_count):
+            reply = self.records.get()
+            if isinstance(reply, str):
+                raise Exception("A shard failed:\n" + reply)
+            for name in SHARD_COUNTERS:
+                setattr(self, name, getattr(self, name) + reply[name])
+        for process in self.processes:
+            process.join()
+        info_logger.info("sharded handling: %d shards, %d synchronizations, "
+                         "%d waits" % (self.shard_count,
+                                       self.synchronizations, self.waits))
+        return RandomDistributeEventHandler.end(self)
+
+    # Wall time the events would have taken with a processor for the handler
+    # and one for every shard, from the processor times of timing. An event
+    # starts once its part is sent and the event before it in its shard and
+    # those it waits for are handled. The handler waits for all shards when
+    # it synchronizes.
+    def projectTime(self):
+        handler = 0.0
+        ends = [0.0]*self.shard_count
+        finish = []
+        unsent = []
+        for shard, cost, synchronized, waits in self.timing:
+            if synchronized:
+                self.projectSend(handler, unsent, ends, finish)
+                handler = max([handler] + ends)
+            handler += cost
+            if shard is not None:
+                unsent.append((shard, waits))
+                if (len(finish) + len(unsent)) % self.part_size == 0:
+                    self.projectSend(handler, unsent, ends, finish)
+        self.projectSend(handler, unsent, ends, finish)
+        return max([handler] + ends)
+
+    # the unsent events of projectTime() are sent at time.
+    def projectSend(self, time, unsent, ends, finish):
+        for shard, waits in unsent:
+            start = max([time, ends[shard]] +
+                        [finish[last] for other, last in waits])
+            ends[shard] = start + self.costs[len(finish)]
+            finish.append(ends[shard])
+        del unsent[:]
+
+
+# Events per second of one iteration, handled by RandomDistributeEventHandler
+# and by ShardedEventHandler with the given shard counts, their speedup, the
+# synchronizations and waits of the shards and the results of each(which are
+# the same). The iteration is generated anew for every handler. The shards
+# only run at the same time with as many cores, the projected speedup is the
+# one with a core per shard and one for the handler(see projectTime()).
+# usage: ShardedEventHandler.py [seed] [shard_count ...]
+def main():
+    from simulator.test.Test import Test
+
+    seed = 1
+    if len(sys.argv) > 1:
+        seed = int(sys.argv[1])
+    shard_counts = [int(arg) for arg in sys.argv[2:]] or [2, 4]
+    test = Test()
+    conf = test.conf
+    conf.random_streams = True
+    conf.event_file = None
+    test.setup()
+
+    print "%d cores" % cpu_count()
+    single = single_time = None
+    for shard_count in [1] + shard_counts:
+        root, xml = test.buildSystem(seed)
+        events = test.generateEvents(root, xml)
+        if shard_count == 1:
+            handler = RandomDistributeEventHandler(conf)
+        else:
+            handler = ShardedEventHandler(shard_count, conf)
+            handler.timing = []
+        handler.setRandomStreams(seed)
+        handler.start(root, test.total_slices, test.total_disks)
+
+        st_time = time()
+        st_clock = clock()
+        handled = 0
+        e = events.removeFirst()
+        while e is not None:
+            handler.handleEvent(e, events)
+            handled += 1
+            e = events.removeFirst()
+        result = handler.end()
+        elapsed = time() - st_time
+        if single is None:
+            single = elapsed
+            single_time = clock() - st_clock
+            projected = single_time
+        else:
+            projected = handler.projectTime()
+        print "%d shards: %.0f events/s, speedup %.2f, projected speedup " \
+            "%.2f, %d synchronizations, %d waits, unavailable %d, " \
+            "undurable %d, unavailable time %f" % \
+            (shard_count, handled/elapsed, single/elapsed,
+             single_time/projected, getattr(handler, "synchronizations", 0),
+             getattr(handler, "waits", 0), result.unavailable_count,
+             result.undurable_count, handler.unavailable_durations.getTotal())
+        # the next system is built without this one in memory.
+        root = xml = events = handler = None
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+from numpy import asarray, where
+
 from simulator.EventGenerator import EventGenerator
 
 
@@ -23,3 +25,12 @@ class Constant(EventGenerator):
             return self.previous_event
 
         return self.previous_event + self.frequency
+
+    # start_times play the role of previous_event, one per item.
+    def generateNextEvents(self, current_times, start_times=None,
+                           streams=None):
+        if start_times is None:
+            start_times = self.previous_event
+        current_times = asarray(current_times, dtype=float)
+        results = asarray(start_times, dtype=float) + self.frequency
+        return where(results < current_times, current_times, results)
@@ -1,3 +1,4 @@
+from numpy import asarray, where, any as np_any
 from numpy.random import randn
 
 from simulator.EventGenerator import EventGenerator
@@ -28,7 +29,8 @@ class GaussianGenerator(EventGenerator):
 
         next_val = 0.0
         while next_val < self.minval:
-            next_val = randn()*self.stddev + self.mean
+            r = randn() if self.stream is None else self.stream.randn()
+            next_val = r*self.stddev + self.mean
 
         if next_val < 0:
             raise Exception("Negative value generated!")
@@ -39,6 +41,37 @@ class GaussianGenerator(EventGenerator):
 
         return self.start_time + next_val
 
+    # Unlike generateNextEvent(), start_times are not moved forward when the
+    # sampled event falls before current time, only the result is clamped.
+    def generateNextEvents(self, current_times, start_times=None,
+                           streams=None):
+        if start_times is None:
+            start_times = self.start_time
+        current_times = asarray(current_times, dtype=float)
+        start_times = asarray(start_times, dtype=float)
+        if np_any(current_times < start_times):
+            raise Exception("current time is less than the start time")
+
+        if streams is None:
+            r = randn(*current_times.shape)
+        else:
+            r = streams.randn()
+        next_vals = r*self.stddev + self.mean
+        rejected = next_vals < self.minval
+        while np_any(rejected):
+            if streams is None:
+                r = randn(rejected.sum())
+            else:
+                r = streams.select(rejected).randn()
+            next_vals[rejected] = r*self.stddev + self.mean
+            rejected = next_vals < self.minval
+
+        if np_any(next_vals < 0):
+            raise Exception("Negative value generated!")
+
+        results = start_times + next_vals
+        return where(results < current_times, current_times, results)
+
     def getName(self):
         return self.name
 
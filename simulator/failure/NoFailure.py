@@ -1,4 +1,4 @@
-from numpy import Inf
+from numpy import Inf, full, shape
 
 from simulator.EventGenerator import EventGenerator
 
@@ -14,5 +14,12 @@ class NoFailure(EventGenerator):
     def getCurrentTime(self):
         return Inf
 
+    def reset(self, current_time):
+        pass
+
     def generateNextEvent(self, current_time):
         return Inf
+
+    def generateNextEvents(self, current_times, start_times=None,
+                           streams=None):
+        return full(shape(current_times), Inf)
@@ -22,8 +22,12 @@ class Piecewise(EventGenerator):
         return 0
 
     def generateNextEvent(self, current_time):
-        index = random()
-        rang = random()
+        if self.stream is None:
+            index = random()
+            rang = random()
+        else:
+            index = self.stream.random()
+            rang = self.stream.random()
 
         for i in xrange(len(Piecewise.values)):
             if index >= Piecewise.intervals[i] and \
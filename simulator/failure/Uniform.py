@@ -1,4 +1,5 @@
-from numpy.random import randint
+from numpy import asarray
+from numpy.random import random_sample
 
 from simulator.EventGenerator import EventGenerator
 
@@ -9,7 +10,7 @@ class Uniform(EventGenerator):
         self.name = name
         self.frequency = float(parameters['lamda'])
 
-    def reset(self):
+    def reset(self, current_time):
         pass
 
     def getName(self):
@@ -19,4 +20,13 @@ class Uniform(EventGenerator):
         return 0
 
     def generateNextEvent(self, current_time):
-        return current_time + float(self.frequency*randint()*1000)/1000.0
+        r = random_sample() if self.stream is None else self.stream.random()
+        return current_time + float(int(self.frequency*r*1000)) / 1000.0
+
+    # start_times are ignored, like the start time of reset().
+    def generateNextEvents(self, current_times, start_times=None,
+                           streams=None):
+        current_times = asarray(current_times, dtype=float)
+        r = random_sample(current_times.shape) if streams is None else \
+            streams.random_sample()
+        return current_times + (self.frequency*r*1000).astype(int)/1000.0
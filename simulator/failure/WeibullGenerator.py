@@ -1,6 +1,9 @@
-from math import exp, log
-from numpy import isnan, isinf
+import sys
+from math import exp, log, log1p as scalar_log1p
+from numpy import isnan, isinf, asarray, power, log1p, any as np_any
+from numpy.random import random_sample
 from random import random
+from time import time
 
 from simulator.EventGenerator import EventGenerator
 
@@ -8,12 +11,24 @@ from simulator.EventGenerator import EventGenerator
 class WeibullGenerator(EventGenerator):
     """
     Weibull Distribution.
+
+    With a bias(optional parameter, default 1) other than 1, times are drawn
+    with the scale lamda/bias instead, i.e. bias > 1 makes events more
+    frequent. The log likelihood ratio of all draws (true density over the
+    biased one) is accumulated, see getLogLikelihoodRatio(), and those of the
+    last call are kept in last_log_likelihood_ratios, for the populations
+    which share the generator among their units.
     """
     def __init__(self, name, parameters):
         self.name = name
         self.gamma = float(parameters['gamma'])
         self.lamda = float(parameters['lamda'])
         self.beta = float(parameters['beta'])
+        self.bias = float(parameters.get('bias', 1.0))
+        if self.bias <= 0:
+            raise Exception("Bias must be positive")
+        self.sampling_lamda = self.lamda/self.bias
+        self.log_likelihood_ratio = 0.0
         self.start_time = 0
 
     def getName(self):
@@ -31,6 +46,18 @@ class WeibullGenerator(EventGenerator):
     def F(self, current_time):
         return 1 - exp(-pow((current_time/self.lamda), self.beta))
 
+    def getLogLikelihoodRatio(self):
+        return self.log_likelihood_ratio
+
+    # log of f(y|X > t)/f'(y|X > t), f is the true density and f' the biased
+    # one, for draws y conditioned on t(both without gamma and start time).
+    def logLikelihoodRatio(self, t, y):
+        return self.beta*log(self.sampling_lamda/self.lamda) - \
+            power(y/self.lamda, self.beta) + \
+            power(y/self.sampling_lamda, self.beta) + \
+            power(t/self.lamda, self.beta) - \
+            power(t/self.sampling_lamda, self.beta)
+
     def generateNextEvent(self, current_time):
         current_time -= self.start_time
         if current_time < 0:
@@ -38,10 +65,17 @@ class WeibullGenerator(EventGenerator):
             print "start_time: ", self.start_time
             raise Exception("Negative current time!")
 
-        r = random()
-        R = (1 - self.F(current_time)) * r + self.F(current_time)
-        result = self.lamda*pow(-log(1.0-R), 1.0/self.beta) + \
-            self.gamma+self.start_time
+        # written as generateNextEvents() does, so a unit draws the same
+        # time on its own and in a population.
+        r = random() if self.stream is None else self.stream.random()
+        lamda = self.sampling_lamda
+        y = lamda*pow(pow(current_time/lamda, self.beta) - scalar_log1p(-r),
+                      1.0/self.beta)
+        result = y + self.gamma+self.start_time
+        if self.bias != 1:
+            ratio = self.logLikelihoodRatio(current_time, y)
+            self.log_likelihood_ratio += ratio
+            self.last_log_likelihood_ratios = ratio
 
         if isinf(result) or isnan(result):
             raise Exception("Generated time is Inf or NaN")
@@ -49,8 +83,63 @@ class WeibullGenerator(EventGenerator):
             raise Exception("Generated time is negative")
         return result
 
+    # Same left-truncated sampling as generateNextEvent(), with
+    # 1 - R = (1 - F(t))*(1 - r) = exp(-(t/lamda)^beta)*(1 - r) written out,
+    # which avoids computing F(t) and stays accurate for small r.
+    def generateNextEvents(self, current_times, start_times=None,
+                           streams=None):
+        if start_times is None:
+            start_times = self.start_time
+        current_times = asarray(current_times, dtype=float)
+        start_times = asarray(start_times, dtype=float)
+        t = current_times - start_times
+        if np_any(t < 0):
+            raise Exception("Negative current time!")
+
+        r = random_sample(t.shape) if streams is None else \
+            streams.random_sample()
+        lamda = self.sampling_lamda
+        y = lamda*power(power(t/lamda, self.beta) - log1p(-r), 1.0/self.beta)
+        result = y + self.gamma + start_times
+        if self.bias != 1:
+            ratios = self.logLikelihoodRatio(t, y)
+            self.log_likelihood_ratio += ratios.sum()
+            self.last_log_likelihood_ratios = ratios
+
+        if np_any(isinf(result)) or np_any(isnan(result)):
+            raise Exception("Generated time is Inf or NaN")
+        if np_any(result < 0):
+            raise Exception("Generated time is negative")
+        return result
+
+
+# Time per sample of generateNextEvent() and generateNextEvents(), batch size
+# is given on the command line.
+def benchmark():
+    size = 1000000
+    if len(sys.argv) > 2:
+        size = int(sys.argv[2])
+    w = WeibullGenerator("wei", {'gamma': 0, 'lamda': 500000, 'beta': 1.12})
+    current_times = random_sample(size)*87600
+
+    st_time = time()
+    for t in current_times:
+        w.generateNextEvent(t)
+    scalar_time = time() - st_time
+
+    st_time = time()
+    w.generateNextEvents(current_times)
+    batch_time = time() - st_time
+
+    print "generateNextEvent: %.3f us/sample" % (scalar_time*1e6/size)
+    print "generateNextEvents: %.3f us/sample" % (batch_time*1e6/size)
+    print "speedup: %.1fx" % (scalar_time/batch_time)
+
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark()
+        return
     w = WeibullGenerator("wei", {'gamma': 0.02, 'lamda': 0.03, 'beta': 1})
     hist = {}
     for i in xrange(1000):
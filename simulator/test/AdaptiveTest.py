@@ -0,0 +1,113 @@
+import sys
+from time import time
+
+from simulator.utils.Log import info_logger
+from simulator.utils.RunningStat import RunningStat
+from simulator.test.Test import Test
+from simulator.test.ParallelTest import iterationSeeds
+
+
+class AdaptiveTest(Test):
+    """
+    Runs Test iterations until the 95% confidence intervals of the mean
+    undurable and unavailable slice counts(the counts averaged by report(),
+    unrounded) are within relative_error of the means, or until the
+    budget(max_iterations, max_hours) is used up.
+
+    metric chooses the counts the stopping rule is applied to: undurable,
+    unavailable or both. With both, a count which has been 0 in every
+    iteration is left out, so a durable configuration stops once its
+    unavailable count has converged. The rule needs at least one count
+    which isn't always 0.
+
+    usage: AdaptiveTest.py max_iterations [relative_error] [max_hours]
+           [master_seed] [metric]
+    relative_error defaults to 0.1, max_hours to no time limit, master_seed
+    to 0, metric to both.
+    """
+    min_iterations = 10
+    z = 1.96
+    metrics = ("undurable", "unavailable", "both")
+
+    def __init__(self, metric="both", conf=None):
+        super(AdaptiveTest, self).__init__(conf)
+        if metric not in AdaptiveTest.metrics:
+            raise Exception("Unknown metric: " + metric)
+        self.metric = metric
+        self.undurable = RunningStat()
+        self.unavailable = RunningStat()
+        # counts which have been non zero in some iteration.
+        self.seen = set()
+
+    def addResult(self, result):
+        unavailable, undurable = result[0], result[1]
+        self.undurable.add(undurable)
+        self.unavailable.add(unavailable)
+        if undurable != 0:
+            self.seen.add("undurable")
+        if unavailable != 0:
+            self.seen.add("unavailable")
+
+    # stats the stopping rule is applied to.
+    def getStoppingStats(self):
+        if self.metric == "undurable":
+            return [self.undurable]
+        if self.metric == "unavailable":
+            return [self.unavailable]
+        return [stat for name, stat in (("undurable", self.undurable),
+                                        ("unavailable", self.unavailable))
+                if name in self.seen]
+
+    def converged(self, relative_error):
+        if self.undurable.getCount() < AdaptiveTest.min_iterations:
+            return False
+        stats = self.getStoppingStats()
+        if stats == []:
+            return False
+        for stat in stats:
+            if stat.getRelativeError(AdaptiveTest.z) > relative_error:
+                return False
+        return True
+
+    def main(self):
+        max_iterations = int(sys.argv[1])
+        relative_error = 0.1
+        if len(sys.argv) > 2:
+            relative_error = float(sys.argv[2])
+        max_seconds = float("inf")
+        if len(sys.argv) > 3:
+            max_seconds = float(sys.argv[3])*3600
+        master_seed = 0
+        if len(sys.argv) > 4:
+            master_seed = int(sys.argv[4])
+
+        self.setup()
+        st_time = time()
+        results = []
+        for seed in iterationSeeds(master_seed, max_iterations):
+            result = self.runIteration(seed)
+            results.append(result)
+            self.addResult(result)
+            if self.converged(relative_error) or \
+                    time() - st_time > max_seconds:
+                break
+
+        info_logger.info("iterations used: %d of %d, converged: %s" %
+                         (len(results), max_iterations,
+                          self.converged(relative_error)))
+        info_logger.info("undurable: " +
+                         self.undurable.toString(AdaptiveTest.z))
+        info_logger.info("unavailable: " +
+                         self.unavailable.toString(AdaptiveTest.z))
+        self.report(results)
+
+
+if __name__ == "__main__":
+    st_time = time()
+    metric = "both"
+    if len(sys.argv) > 5:
+        metric = sys.argv[5]
+    t = AdaptiveTest(metric)
+    t.main()
+    end_time = time()
+    print "the execute time is %.2f minutes" % ((end_time - st_time)/60)
@@ -0,0 +1,399 @@
+import sys
+import random
+import cPickle
+from multiprocessing import Pool, cpu_count
+from time import time
+
+import numpy.random
+from numpy import array, searchsorted, flatnonzero
+
+from simulator.utils.Log import info_logger
+from simulator.utils.IntervalLog import IntervalLog
+from simulator.utils.BandwidthSweep import BandwidthSweep
+from simulator.Event import Event
+from simulator.EventQueue import EventQueue
+from simulator.Checkpoint import Checkpoint
+from simulator.eventHandler.RandomDistributeEventHandler import \
+    RandomDistributeEventHandler
+from simulator.test.Test import Test
+
+# handler statistics of an epoch: counters are summed over the epochs,
+# maxima are taken over them and step series are joined.
+COUNTERS = ("anomalous_available_count", "unavailable_slice_count",
+            "undurable_slice_count", "total_latent_failures", "total_scrubs",
+            "total_scrub_repairs", "total_disk_failures",
+            "total_disk_repairs", "total_machine_failures",
+            "total_machine_repairs", "total_perm_machine_failures",
+            "total_short_temp_machine_failures",
+            "total_long_temp_machine_failures",
+            "total_machine_failures_due_to_rack_failures",
+            "total_eager_machine_repairs", "total_eager_slice_repairs",
+            "total_skipped_latent", "total_incomplete_recovery_attempts",
+            "weighted_unavailable_count")
+MAXIMA = ("max_recovery_bandwidth", "max_bw")
+SERIES = ("slices_degraded_list", "slices_degraded_avail_list")
+# per slice and per chunk state of the handler, the chunks of a slice are
+# those of its row of index.slice_chunks.
+SLICE_ARRAYS = ("available_count", "durable_count", "latent_defect",
+                "known_latent_defect", "lost")
+CHUNK_ARRAYS = ("nonexistent", "defective", "known_defective")
+RECOVERED = Event.EventType.Recovered.value
+FAILURE = Event.EventType.Failure.value
+
+# Epochs of the worker process, set by initWorker().
+worker_epochs = None
+
+
+def initWorker(epochs):
+    global worker_epochs
+    worker_epochs = epochs
+
+
+def runEpoch(task):
+    return worker_epochs.run(*task)
+
+
+# Moves the statistics out of the handler, which goes on from empty ones.
+def takeStats(handler):
+    stats = {}
+    for name in COUNTERS + MAXIMA:
+        stats[name] = getattr(handler, name)
+        setattr(handler, name, 0)
+    for name in SERIES:
+        stats[name] = getattr(handler, name)
+        setattr(handler, name, [])
+    stats["bandwidth_sweep"] = handler.bandwidth_sweep
+    handler.bandwidth_sweep = BandwidthSweep()
+    stats["unavailable_ops"] = handler.unavailable_ops or []
+    handler.unavailable_ops = []
+    return stats
+
+
+# Statistics of the epochs before, with those of the next epoch added.
+# Unavailable intervals are replayed, so they are the same as if all epochs
+# were handled by one handler, those of undurable slices last until
+# total_time.
+def mergeStats(total, stats, total_time):
+    if total is None:
+        total = {"bandwidth_sweep": BandwidthSweep(),
+                 "unavailable_durations": IntervalLog()}
+        for name in COUNTERS + MAXIMA:
+            total[name] = 0
+        for name in SERIES:
+            total[name] = []
+    for name in COUNTERS:
+        total[name] += stats[name]
+    for name in MAXIMA:
+        total[name] = max(total[name], stats[name])
+    for name in SERIES:
+        total[name] += stats[name]
+    total["bandwidth_sweep"].times.extend(stats["bandwidth_sweep"].times)
+    total["bandwidth_sweep"].deltas.extend(stats["bandwidth_sweep"].deltas)
+    log = total["unavailable_durations"]
+    for slice_index, ts, unavailable in stats["unavailable_ops"]:
+        if unavailable is None:
+            log.start(slice_index, ts)
+        else:
+            log.end(slice_index, ts, unavailable, total_time)
+    return total
+
+
+def applyStats(handler, total):
+    for name in COUNTERS + MAXIMA + SERIES + ("bandwidth_sweep",
+                                             "unavailable_durations"):
+        setattr(handler, name, total[name])
+
+
+# degraded and availability degraded slices among slices, see
+# RandomDistributeEventHandler.sliceDegraded().
+def degradedCounts(handler, slices):
+    undurable = handler.n - handler.durable_count[slices] + \
+        handler.latent_defect[slices]
+    unavailable = handler.n - handler.available_count[slices]
+    return int((undurable != 0).sum()), \
+        int(((undurable != 0) | (unavailable != 0)).sum())
+
+
+# Counts of the state a guess can get wrong: lost slices, the chunks left
+# nonexistent or defective by failures before the warmup, and how far the
+# degraded slice counters are from the numbers of degraded slices(lazy
+# recovery doesn't keep them in step).
+def stateCounts(handler):
+    degraded, avail_degraded = degradedCounts(handler, slice(None))
+    return (int(handler.lost.sum()), int(handler.nonexistent.sum()),
+            int(handler.defective.sum()),
+            handler.current_slice_degraded - degraded,
+            handler.current_avail_slice_degraded - avail_degraded)
+
+
+# State of the lost slices of the handler, (slices, slice state, chunk
+# state). A lost slice is neither recovered nor failed again, its state
+# stays as it was lost.
+def lostState(handler):
+    slices = flatnonzero(handler.lost)
+    chunks = handler.index.slice_chunks[slices]
+    return (slices, [getattr(handler, name)[slices] for name in SLICE_ARRAYS],
+            [getattr(handler, name)[chunks] for name in CHUNK_ARRAYS])
+
+
+# Gives the handler the slices lost in lost_states(of lostState(), later
+# ones first), which it doesn't know about.
+def carryLost(handler, lost_states):
+    for slices, slice_rows, chunk_rows in lost_states:
+        new = ~handler.lost[slices]
+        slices = slices[new]
+        degraded, avail_degraded = degradedCounts(handler, slices)
+        for name, rows in zip(SLICE_ARRAYS, slice_rows):
+            getattr(handler, name)[slices] = rows[new]
+        chunks = handler.index.slice_chunks[slices]
+        for name, rows in zip(CHUNK_ARRAYS, chunk_rows):
+            getattr(handler, name)[chunks] = rows[new]
+        now_degraded, now_avail_degraded = degradedCounts(handler, slices)
+        handler.current_slice_degraded += now_degraded - degraded
+        if handler.k != 1:
+            handler.current_avail_slice_degraded += \
+                now_avail_degraded - avail_degraded
+
+
+class Epochs(object):
+    """
+    The events of one iteration(in handling order) split into epochs of
+    the timeline. run() handles the events of one epoch, from a given start
+    state or from a guessed one: a new handler which has handled the events
+    of the warmup hours before the epoch, after it was given the slices
+    lost before(if known, see carryLost()).
+    """
+
+    def __init__(self, test, root, events, epoch_count, warmup, stream_seed):
+        conf = test.conf
+        self.test = test
+        self.root = root
+        self.events = events
+        self.times = array([e.time for e in events], dtype=float)
+        self.bounds = [conf.total_time*float(i)/epoch_count
+                       for i in xrange(epoch_count)] + [float("inf")]
+        self.warmup = warmup
+        self.stream_seed = stream_seed
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def newHandler(self):
+        handler = RandomDistributeEventHandler(self.test.conf)
+        handler.setRandomStreams(self.stream_seed)
+        handler.start(self.root, self.test.total_slices,
+                      self.test.total_disks)
+        return handler
+
+    # Handles the events of [start, end) and those the handler adds before
+    # end(in own), in the order of a single queue. With warmup, recoveries
+    # of units which didn't fail since start are skipped. Returns the number
+    # of events handled.
+    def handle(self, handler, own, start, end, warmup=False):
+        lo, hi = searchsorted(self.times, [start, end])
+        handled = 0
+        seen = set()
+        for j in xrange(lo, hi):
+            e = self.events[j]
+            while own.events and own.events[0][0] < e.time:
+                handler.handleEvent(own.removeFirst(), own)
+                handled += 1
+            if warmup:
+                if e.type == FAILURE:
+                    seen.add(e.unit_id)
+                elif e.type == RECOVERED and e.unit_id not in seen:
+                    continue
+            handler.handleEvent(e, own)
+            handled += 1
+        while own.events and own.events[0][0] < end:
+            handler.handleEvent(own.removeFirst(), own)
+            handled += 1
+        return handled
+
+    # Handles epoch i from state(a pickled end state of epoch i - 1), or
+    # from a guessed state which knows the slices of lost_states, with the
+    # degraded counters that far from the numbers of degraded slices if
+    # degraded(see stateCounts()) isn't None. Returns
+    # (start counts, end counts, statistics, pickled end state, events
+    # handled, error, lost state at the end), see stateCounts() and
+    # lostState(). All but the start counts are None if the run
+    # failed(error is the message), which happens when a guessed state is
+    # inconsistent with the events.
+    def run(self, i, state=None, lost_states=(), degraded=None):
+        start, end = self.bounds[i], self.bounds[i + 1]
+        start_counts = None
+        try:
+            if state is None:
+                handler = self.newHandler()
+                own = EventQueue()
+                carryLost(handler, lost_states)
+                if i > 0:
+                    self.handle(handler, own, max(0, start - self.warmup),
+                                start, True)
+                if degraded is not None:
+                    now, avail_now = degradedCounts(handler, slice(None))
+                    handler.current_slice_degraded = now + degraded[0]
+                    if handler.k != 1:
+                        handler.current_avail_slice_degraded = \
+                            avail_now + degraded[1]
+            else:
+                handler, own = cPickle.loads(state)
+            start_counts = stateCounts(handler)
+            takeStats(handler)
+            handled = self.handle(handler, own, start, end)
+            end_counts = stateCounts(handler)
+            stats = takeStats(handler)
+            state = cPickle.dumps((handler, own),
+                                  cPickle.HIGHEST_PROTOCOL)
+            return start_counts, end_counts, stats, state, handled, None, \
+                lostState(handler)
+        except Exception, e:
+            return start_counts, None, None, None, 0, repr(e), None
+
+
+class EpochTest(Test):
+    """
+    Simulates one long trajectory with all cores, by splitting the timeline
+    into epochs handled in parallel(optimistic time parallel simulation).
+
+    The events are generated once. In the first wave every epoch starts
+    from a guessed state, that of a new handler after the warmup hours
+    before the epoch. Then the epochs are reconciled in order: an epoch is
+    final when the one before it is, and its start state has the counts of
+    the final end state of the one before(lost slices, nonexistent and
+    defective chunks, see stateCounts()). The rest of the state is short
+    lived and rebuilt by the warmup. Every wave runs the epochs which are
+    not final again: from the end state of the epoch before if that one is
+    final, else from a guess which knows the slices lost in the last runs
+    of the epochs before(see carryLost()). So most epochs are final after
+    the second wave, and there are at most epoch count waves. The
+    statistics of the final runs are merged.
+
+    A guess is only checked by its counts. Which chunks are nonexistent or
+    defective, the recovery bandwidth and the failure times of the units
+    are trusted to the warmup, which must be longer than the recoveries.
+    Results are those of the sequential run when it is.
+
+    Needs random_streams, so the draws of the handler only depend on the
+    event they are drawn for. Only single layer systems are supported.
+
+    usage: EpochTest.py epoch_count [processes] [warmup_hours] [seed]
+    processes defaults to the number of cores, warmup_hours to 1000.
+    """
+
+    def __init__(self, epoch_count=1, processes=1, warmup=1000.0, conf=None):
+        super(EpochTest, self).__init__(conf)
+        self.epoch_count = epoch_count
+        self.processes = processes
+        self.warmup = warmup
+
+    def runIteration(self, seed=None, checkpoint=None):
+        conf = self.conf
+        if not conf.random_streams:
+            raise Exception("Epochs need random_streams!")
+        if conf.layer_num != 1 or conf.stream_events:
+            raise Exception("Epochs need a single layer and all events!")
+        if seed is not None:
+            random.seed(seed)
+            numpy.random.seed(seed)
+        stream_seed = seed
+        if stream_seed is None:
+            stream_seed = random.randint(0, 2**31 - 2)
+        root, xml = self.buildSystem(stream_seed)
+        events = list(self.generateEvents(root, xml).iterEvents())
+        conf.printAll()
+        epochs = Epochs(self, root, events, self.epoch_count, self.warmup,
+                        stream_seed)
+
+        results = self.runEpochs(epochs)
+        total = None
+        events_handled = 0
+        for result in results:
+            total = mergeStats(total, result[2], conf.total_time)
+            events_handled += result[4]
+        handler, own = cPickle.loads(results[-1][3])
+        applyStats(handler, total)
+
+        state = Checkpoint(handler.root, xml, stream_seed)
+        state.handler = handler
+        state.events_handled = events_handled
+        self.endLayer(state)
+        return state.un_available_count, state.un_durable_count, \
+            state.events_handled, state.undur_unavail
+
+    # Result of the final run of every epoch, see Epochs.run().
+    def runEpochs(self, epochs):
+        count = len(epochs)
+        results = [None]*count
+        final = [False]*count
+        tasks = [(i, None, (), None) for i in xrange(count)]
+        wave = 0
+        # a new process for every run, forked from the untouched units.
+        pool = Pool(min(self.processes, count), initWorker, (epochs,),
+                    maxtasksperchild=1)
+        try:
+            while tasks != []:
+                wave += 1
+                for task, result in zip(tasks, pool.map(runEpoch, tasks,
+                                                        chunksize=1)):
+                    results[task[0]] = result
+                for i in xrange(count):
+                    if final[i]:
+                        continue
+                    if i > 0 and not (final[i - 1] and
+                                      results[i][0] == results[i - 1][1]):
+                        continue
+                    if results[i][5] is not None:
+                        raise Exception("Epoch " + str(i) + " failed: " +
+                                        results[i][5])
+                    final[i] = True
+                info_logger.info("epoch wave %d: %d epochs run, %d of %d "
+                                 "final" % (wave, len(tasks), sum(final),
+                                            count))
+                tasks = [self.nextTask(i, results, final)
+                         for i in xrange(count) if not final[i]]
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
+    # Task of epoch i for the next wave: the end state of epoch i - 1 if it
+    # is final, else a guess knowing the slices lost in the last runs of
+    # the epochs before. The distance of its degraded counters(see
+    # stateCounts()) is the one at the end of the last final epoch, moved
+    # by the changes in the last runs of the epochs after it.
+    def nextTask(self, i, results, final):
+        if final[i - 1]:
+            return i, results[i - 1][3], (), None
+        lost_states = [results[j][6] for j in xrange(i - 1, -1, -1)
+                       if results[j][6] is not None]
+        last_final = max([j for j in xrange(i) if final[j]])
+        degraded = list(results[last_final][1][3:])
+        for j in xrange(last_final + 1, i):
+            if results[j][1] is None:
+                return i, None, lost_states, None
+            degraded = [count + end - start for count, start, end in
+                        zip(degraded, results[j][0][3:], results[j][1][3:])]
+        return i, None, lost_states, tuple(degraded)
+
+    def main(self):
+        self.epoch_count = int(sys.argv[1])
+        self.processes = cpu_count()
+        if len(sys.argv) > 2:
+            self.processes = int(sys.argv[2])
+        if len(sys.argv) > 3:
+            self.warmup = float(sys.argv[3])
+        seed = None
+        if len(sys.argv) > 4:
+            seed = int(sys.argv[4])
+
+        self.setup()
+        self.report([self.runIteration(seed)])
+
+
+if __name__ == "__main__":
+    st_time = time()
+    t = EpochTest()
+    t.main()
+    end_time = time()
+    print "the execute time is %.2f minutes" % ((end_time - st_time)/60)
@@ -0,0 +1,76 @@
+import sys
+from multiprocessing import Pool, cpu_count
+from time import time
+
+from numpy.random import RandomState
+
+from simulator.test.Test import Test
+
+# Test of the worker process, set by initWorker().
+worker_test = None
+
+
+def initWorker(test):
+    global worker_test
+    worker_test = test
+
+
+# iteration is (index, seed), the index numbers its profile.
+def runIteration(iteration):
+    worker_test.iteration, seed = iteration
+    return worker_test.runIteration(seed)
+
+
+# Seed of every iteration, drawn from master_seed. The results of an
+# iteration only depend on its seed, not on the process running it.
+def iterationSeeds(master_seed, iteration_count):
+    return [int(seed) for seed in
+            RandomState(master_seed).randint(0, 2**31 - 1, iteration_count)]
+
+
+class ParallelTest(Test):
+    """
+    Runs the iterations of Test in a pool of processes.
+
+    usage: ParallelTest.py iteration_count [processes] [master_seed]
+    processes defaults to the number of cores, master_seed to 0.
+
+    Workers log events to event_file followed by the iteration, one file
+    for each iteration.
+    """
+
+    # a single event_file would be written by several workers at once.
+    def getEventFile(self):
+        conf = self.conf
+        if conf.event_file is None:
+            return None
+        return conf.event_file + "-" + str(self.iteration)
+
+    def main(self):
+        iteration_count = int(sys.argv[1])
+        processes = cpu_count()
+        if len(sys.argv) > 2:
+            processes = int(sys.argv[2])
+        master_seed = 0
+        if len(sys.argv) > 3:
+            master_seed = int(sys.argv[3])
+
+        self.setup()
+        seeds = iterationSeeds(master_seed, iteration_count)
+        pool = Pool(min(processes, iteration_count), initWorker, (self,))
+        try:
+            # map keeps the iteration order, whichever process finishes first.
+            results = pool.map(runIteration, list(enumerate(seeds)),
+                               chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        self.report(results)
+
+
+if __name__ == "__main__":
+    st_time = time()
+    t = ParallelTest()
+    t.main()
+    end_time = time()
+    print "the execute time is %.2f minutes" % ((end_time - st_time)/60)
@@ -0,0 +1,228 @@
+import os
+import sys
+import csv
+import random
+from random import Random
+from math import ceil
+from time import time
+
+import numpy.random
+
+from simulator.utils.Log import info_logger
+from simulator.utils.RunningStat import RunningStat
+from simulator.Configuration import Configuration
+from simulator.eventHandler.RandomDistributeEventHandler import \
+    RandomDistributeEventHandler
+from simulator.eventHandler.MultiSchemeEventHandler import \
+    MultiSchemeEventHandler
+from simulator.EventQueue import EventQueue
+from simulator.EventLog import EventLogWriter, EventLogReader
+from simulator.test.Test import Test
+from simulator.test.ParallelTest import iterationSeeds
+
+
+class ReplayTest(Test):
+    """
+    Compares the redundancy schemes of replay_redundancies(in the conf file)
+    on the same events. Every iteration generates the events once, writes
+    them to an event log(see simulator.EventLog) and replays the log to one
+    RandomDistributeEventHandler per scheme. The handlers of one iteration
+    also share their random numbers(seeded with the iteration seed), so the
+    difference between two schemes has much less noise than the difference
+    between two separate runs. With random_streams, the handlers draw from
+    the same streams as the handler of Test.runIteration(seed), so the
+    replay of the scheme of the conf file gives the results of that run.
+
+    With replay_single_pass, the log is read once and the handlers of all
+    schemes are updated from each event, see MultiSchemeEventHandler. Both
+    ways give the same results.
+
+    Racks are sized for the scheme with the largest storage overhead, every
+    scheme keeps the gap between n and recovery_threshold of the conf file
+    unless its options set recovery_threshold. Only single layer systems are
+    supported.
+
+    usage: ReplayTest.py iteration_count [master_seed]
+    """
+
+    def setup(self):
+        conf = self.conf
+        if conf.layer_num != 1 or conf.heterogeneous_redundancy:
+            raise Exception("Replay needs a single layer system!")
+        if conf.replay_redundancies == []:
+            raise Exception("No replay_redundancies given!")
+
+        self.threshold_gap = conf.n - conf.recovery_threshold
+        conf.setRedundancy(max(conf.replay_redundancies,
+                               key=lambda scheme: float(scheme[1])/scheme[2]))
+        Test.setup(self)
+
+    # name of the j-th scheme, with its options.
+    def schemeName(self, j):
+        conf = self.conf
+        name = "_".join([str(item) for item in conf.replay_redundancies[j]])
+        options = conf.replay_options[j]
+        if options:
+            name += "(" + ",".join([key + "=" + value
+                                    for key, value in options]) + ")"
+        return name
+
+    # Configuration of the j-th scheme, for the system built by setup().
+    def schemeConf(self, j):
+        conf = self.conf
+        scheme_conf = Configuration(conf.overrides)
+        scheme_conf.setRedundancy(conf.replay_redundancies[j])
+        scheme_conf.recovery_threshold = scheme_conf.n - self.threshold_gap
+        for key, value in conf.replay_options[j]:
+            scheme_conf.setOption(key, value)
+        scheme_conf.rack_count = conf.rack_count
+        total_storage_overheads = conf.total_active_storage*1024*1024.0 * \
+            scheme_conf.n/scheme_conf.k
+        scheme_conf.total_slices = int(ceil(total_storage_overheads * 1024.0 /
+                                            (conf.chunk_size*scheme_conf.n)))
+        return scheme_conf
+
+    # Returns [(unavailable count, undurable count, events handled,
+    # [undurability, unavailability]), ...], one item for each scheme.
+    def runIteration(self, seed=None):
+        conf = self.conf
+        if seed is None:
+            seed = random.randint(0, 2**31 - 2)
+        random.seed(seed)
+        numpy.random.seed(seed)
+
+        root, xml = self.buildSystem(seed if conf.random_streams else None)
+        events = self.generateEvents(root, xml)
+        log_file = conf.event_file
+        if log_file is None:
+            log_file = "/tmp/replay-events-" + str(os.getpid())
+        writer = EventLogWriter(log_file, "Iteration seed: " + str(seed),
+                                root.getUnits())
+        for e in events.iterEvents():
+            if e.ignore is False:
+                writer.write(e)
+        writer.close()
+        reader = EventLogReader(log_file)
+        info_logger.info("Events generated: %d" % len(reader))
+
+        confs = [self.schemeConf(j)
+                 for j in xrange(len(conf.replay_redundancies))]
+        if conf.replay_single_pass:
+            handled = self.replayAll(confs, seed, root, reader)
+            results = [self.schemeResult(j, confs[j], *item)
+                       for j, item in enumerate(handled)]
+        else:
+            results = [self.schemeResult(j, confs[j],
+                                         *self.replay(confs[j], seed, root,
+                                                      reader))
+                       for j in xrange(len(confs))]
+
+        del reader
+        if conf.event_file is None:
+            os.remove(log_file)
+            os.remove(log_file + ".units")
+        return results
+
+    # (unavailable count, undurable count, events handled, [undurability,
+    # unavailability]) of the j-th scheme.
+    def schemeResult(self, j, scheme_conf, handler, result, events_handled):
+        conf = self.conf
+        info_logger.info(self.schemeName(j) + ": " + result.toString())
+        undurability = (float(result.undurable_estimate) /
+                        len(handler.available_count)) * 100
+        unavail_time = handler.getUnavailableTime()
+        unavailability = (unavail_time / (scheme_conf.total_slices *
+                                          conf.total_time)) * 100
+        return (result.unavailable_estimate, result.undurable_estimate,
+                events_handled, [undurability, unavailability])
+
+    # Handler of one scheme, its random numbers are seeded as described in
+    # the class docstring.
+    def schemeHandler(self, scheme_conf, seed):
+        handler = RandomDistributeEventHandler(scheme_conf, Random(seed))
+        if self.conf.random_streams:
+            handler.setRandomStreams(seed)
+        return handler
+
+    # Replays the log to one scheme, returns (handler, result, events
+    # handled).
+    def replay(self, scheme_conf, seed, root, reader):
+        scheme_conf.printAll()
+        handler = self.schemeHandler(scheme_conf, seed)
+        handler.start(root, scheme_conf.total_slices, self.total_disks)
+
+        events_handled = 0
+        queue = EventQueue()
+        queue.addEventBatch(reader.getBatch())
+        e = queue.removeFirst()
+        while e is not None:
+            handler.handleEvent(e, queue)
+            e = queue.removeFirst()
+            events_handled += 1
+        return handler, handler.end(), events_handled
+
+    # replay() of all schemes in one pass over the log.
+    def replayAll(self, confs, seed, root, reader):
+        for scheme_conf in confs:
+            scheme_conf.printAll()
+        handler = MultiSchemeEventHandler(
+            [self.schemeHandler(scheme_conf, seed) for scheme_conf in confs])
+        handler.start(root,
+                      [scheme_conf.total_slices for scheme_conf in confs],
+                      self.total_disks)
+
+        queue = EventQueue()
+        queue.addEventBatch(reader.getBatch())
+        e = queue.removeFirst()
+        while e is not None:
+            handler.handleEvent(e, queue)
+            e = queue.removeFirst()
+        results = handler.end()
+        return zip(handler.handlers, results, handler.events_handled)
+
+    # Means of every scheme, and of its difference to the first scheme(paired
+    # by iteration).
+    def report(self, results):
+        conf = self.conf
+        for j in xrange(len(conf.replay_redundancies)):
+            unavailable, undurable = RunningStat(), RunningStat()
+            undurable_diff = RunningStat()
+            for rows in results:
+                unavailable.add(rows[j][0])
+                undurable.add(rows[j][1])
+                undurable_diff.add(rows[j][1] - rows[0][1])
+            info_logger.info("%s: unavailable %s" %
+                             (self.schemeName(j), unavailable.toString()))
+            info_logger.info("%s: undurable %s" %
+                             (self.schemeName(j), undurable.toString()))
+            if j > 0:
+                info_logger.info("%s - %s: undurable %s" %
+                                 (self.schemeName(j), self.schemeName(0),
+                                  undurable_diff.toString()))
+
+        if self.res_file is None:
+            return
+        with open(self.res_file, 'w') as fp:
+            writer = csv.writer(fp, lineterminator='\n')
+            for rows in results:
+                for j, row in enumerate(rows):
+                    writer.writerow([self.schemeName(j)] + row[3])
+
+    def main(self):
+        iteration_count = int(sys.argv[1])
+        master_seed = 0
+        if len(sys.argv) > 2:
+            master_seed = int(sys.argv[2])
+
+        self.setup()
+        results = [self.runIteration(seed) for seed in
+                   iterationSeeds(master_seed, iteration_count)]
+        self.report(results)
+
+
+if __name__ == "__main__":
+    st_time = time()
+    t = ReplayTest()
+    t.main()
+    end_time = time()
+    print "the execute time is %.2f minutes" % ((end_time - st_time)/60)
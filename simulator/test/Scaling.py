@@ -15,7 +15,6 @@ from simulator.eventHandler.RandomDistributeEventHandler import \
 from simulator.utils.XMLParser import XMLParser
 from simulator.EventQueue import EventQueue
 from simulator.Event import Event
-from simulator.Result import Result
 
 conf = Configuration()
 
@@ -92,15 +91,15 @@ class Test(object):
             racks_start_times[ts] = racks - last_racks
 
             # give the right rack count to Configuration
-            Configuration.rack_count = racks
-            print "rack count:", Configuration.rack_count
+            conf.rack_count = racks
+            print "rack count:", conf.rack_count
 
-            total_disks = Configuration.rack_count * conf.machines_per_rack * \
+            total_disks = conf.rack_count * conf.machines_per_rack * \
                 conf.disks_per_machine
 
             total_slices = int(ceil(total_storage_overheads * 1024.0 /
                                     (conf.chunk_size*n)))
-            Configuration.total_slices = total_slices
+            conf.total_slices = total_slices
             info_logger.info("total slices=" + str(total_slices) +
                              " disk count=" + str(total_disks) +
                              " total storage=" + str(total_storage_overheads) +
@@ -109,21 +108,27 @@ class Test(object):
 
             iteration_count = int(sys.argv[1])
             for i in xrange(iteration_count):
-                xml = XMLParser(1)
+                xml = XMLParser(1, conf.rack_count)
                 self.units = xml.readFile()
                 root = self.units[0]
-                if Machine.fail_fraction != 0:
+                machines = [unit for unit in root.getUnits()
+                            if isinstance(unit, Machine)]
+                fail_fraction = machines[0].fail_fraction
+                rate = -1
+                if fail_fraction != 0:
                     rate = self.getMachineFailureGeneratorRate(root)
                 if rate != -1 and rate != 0:
                     total_machines = conf.machines_per_rack * \
-                        Configuration.rack_count
+                        conf.rack_count
                     all_machine_failure_per_hour = total_machines/rate
-                    permanent_machines_per_hour = Machine.fail_fraction * \
+                    permanent_machines_per_hour = fail_fraction * \
                         total_machines/(24*30)
-                    Machine.fail_fraction = permanent_machines_per_hour / \
+                    fail_fraction = permanent_machines_per_hour / \
                         all_machine_failure_per_hour
+                    for machine in machines:
+                        machine.setFailFraction(fail_fraction)
 
-                events = EventQueue()
+                events = EventQueue(root.getUnits())
                 total_racks = root.getChildren()[0].getChildren()
                 for j, rack in enumerate(total_racks):
                     period = conf.total_time/scaling_times
@@ -135,10 +140,11 @@ class Test(object):
                     for x, rack_id in enumerate(rack_id_thresholds):
                         if j < rack_id:
                             rack.generateEvents(events, ts - x*period, ts-(x-1)*period, True)
+                for population in xml.getPopulations():
+                    events.addEventBatch(population.generateEvents())
 
-
-                if True:  # conf.event_file is not None:
-                    events.printAll(conf.event_file,
+                if not conf.unit_population:  # conf.event_file is not None:
+                    events.writeLog(conf.event_file,
                                     "Iteration number: " + str(i))
                 # else:
                 conf.printAll()
@@ -157,28 +163,25 @@ class Test(object):
                 result = handler.end()
                 info_logger.info(result.toString())
                 info_logger.info("Events handled: %d" % events_handled)
-                un_available_count += Result.unavailable_count
-                un_durable_count += Result.undurable_count
+                un_available_count += result.unavailable_estimate
+                un_durable_count += result.undurable_estimate
 
             # Record undurability and unavailability in csv files.
-            undurability = (float(handler.undurable_slice_count) /
+            undurability = (float(result.undurable_estimate) /
                             len(handler.available_count)) * 100
-            unavail_time = 0.0
-            unavailables = handler.unavailable_durations.keys()
-            print "number of unavailable slices:", len(unavailables)
-            for item in unavailables:
-                for ts_duration in handler.unavailable_durations[item]:
-                    unavail_time += ts_duration[1] - ts_duration[0]
+            print "number of unavailable slices:", \
+                handler.unavailable_durations.getSliceCount()
+            unavail_time = handler.getUnavailableTime()
             unavailability = (unavail_time/(conf.total_slices*conf.total_time)) * 100
             print "unavailability:", unavailability
-            undur_unavail.append([round(undurability, 5), round(unavailability, 5)])
+            undur_unavail.append([undurability, unavailability])
 
             last_racks = racks
 
         if True:  # conf.event_file is None:
-            info_logger.info("avg unavailable = %.5f" %
+            info_logger.info("avg unavailable = %e" %
                              (float(un_available_count)/iteration_count))
-            info_logger.info("avg undurable = %.5f" %
+            info_logger.info("avg undurable = %e" %
                              (float(un_durable_count)/iteration_count))
 
         with open(res_file, 'w') as fp:
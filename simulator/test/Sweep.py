@@ -0,0 +1,220 @@
+import os
+import sys
+import csv
+import json
+from hashlib import sha1
+from itertools import product
+from multiprocessing import Pool, cpu_count
+from time import time
+
+from simulator.utils.Log import info_logger
+from simulator.utils.RunningStat import RunningStat
+from simulator.utils.XMLParser import XMLParser
+from simulator.Configuration import Configuration
+from simulator.MarkovModel import MarkovModel
+from simulator.test.ParallelTest import iterationSeeds
+from simulator.test.Test import Test
+
+
+# Expands {key: [value, ...], ...} into the list of all {key: value, ...}.
+def grid(options):
+    keys = sorted(options.keys())
+    return [dict(zip(keys, [str(value) for value in values]))
+            for values in product(*[options[key] for key in keys])]
+
+
+# Canonical hash of the effective configuration(conf file and layer xml with
+# the overrides) and of the seed. Options which don't change the results are
+# left out.
+def pointKey(conf_overrides, xml_overrides, seed):
+    conf = Configuration(conf_overrides)
+    xml = XMLParser(1, None, xml_overrides, conf).toString()
+    options = conf.returnAll()
+    for option in ("event_file", "placement_cache", "checkpoint_file",
+                   "checkpoint_interval", "checkpoint_keep",
+                   "handler_shards", "profile_file", "profile_sample",
+                   "profile_iteration", "profile_format"):
+        options.pop(option)
+    key = json.dumps({"conf": options, "xml": xml, "seed": seed},
+                     sort_keys=True)
+    return sha1(key).hexdigest()
+
+
+# Expected undurable count of one iteration with the overrides, from
+# simulator.MarkovModel. None if the configuration can't be modelled, i.e.
+# has generators other than Weibull ones.
+def estimatePoint(conf_overrides, xml_overrides):
+    try:
+        conf = Configuration(conf_overrides)
+        xml = XMLParser(1, None, xml_overrides, conf)
+        return MarkovModel(conf, xml).getUndurable()
+    except Exception, e:
+        info_logger.info("no analytical estimate: " + str(e))
+        return None
+
+
+# One iteration of Test with the overrides, in a worker process. Returns the
+# result of Test.runIteration().
+def runPoint(point):
+    conf_overrides, xml_overrides, seed = point
+    conf = Configuration(conf_overrides)
+    conf.event_file = None
+    test = Test(conf, xml_overrides)
+    test.setup()
+    return test.runIteration(seed)
+
+
+class Sweep(object):
+    """
+    Runs Test over a grid of Configuration overrides(options of pr-sim.conf)
+    and layer xml overrides(see XMLParser.setParameter()), several seeds per
+    grid point, in a pool of processes. Every result is saved in cache_dir,
+    under the hash of the effective configuration and seed, and runs already
+    saved are not run again.
+
+    The sweep file is json, i.e.
+    {"conf": {"recovery_threshold": [12, 13], "lazy_recovery": ["true"]},
+     "xml": {"disk/failureGenerator/lamda": [87600, 43800]},
+     "iterations": 3, "master_seed": 0,
+     "cache_dir": "/root/PR-Sim/sweep"}
+    seeds can be given as a list("seeds") instead of iterations.
+
+    Every grid point is estimated by simulator.MarkovModel first. With
+    "prune": [low, high], points whose expected undurable count is below low
+    (obviously safe) or above high(obviously unsafe) are not simulated.
+
+    usage: Sweep.py sweep_file [processes]
+    """
+
+    def __init__(self, sweep):
+        self.conf_grid = grid(sweep.get("conf", {}))
+        self.xml_grid = grid(sweep.get("xml", {}))
+        if "seeds" in sweep:
+            self.seeds = [int(seed) for seed in sweep["seeds"]]
+        else:
+            self.seeds = iterationSeeds(sweep.get("master_seed", 0),
+                                        sweep.get("iterations", 1))
+        self.cache_dir = sweep.get("cache_dir", "/root/PR-Sim/sweep")
+        self.prune = sweep.get("prune")
+        # analytical estimate of every grid point, set by run().
+        self.estimates = []
+
+    # [(conf overrides, xml overrides), ...]
+    def getPoints(self):
+        return list(product(self.conf_grid, self.xml_grid))
+
+    def cachePath(self, key):
+        return self.cache_dir + os.sep + key + ".json"
+
+    def loadResult(self, key):
+        path = self.cachePath(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as fp:
+            return json.load(fp)["result"]
+
+    def saveResult(self, key, point, result):
+        path = self.cachePath(key)
+        tmp_path = path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({"conf": point[0], "xml": point[1], "seed": point[2],
+                       "result": result}, fp, sort_keys=True)
+        os.rename(tmp_path, path)
+
+    # True if the estimate is outside of the prune range.
+    def isPruned(self, estimate):
+        if self.prune is None or estimate is None:
+            return False
+        low, high = self.prune
+        return estimate < low or estimate > high
+
+    # Returns {(point index, seed): result}, runs the missing ones. Pruned
+    # points have no results.
+    def run(self, processes):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.estimates = [estimatePoint(conf_overrides, xml_overrides)
+                          for conf_overrides, xml_overrides in
+                          self.getPoints()]
+        info_logger.info("sweep: %d points pruned" %
+                         len(filter(self.isPruned, self.estimates)))
+        results = {}
+        missing = []
+        for i, (conf_overrides, xml_overrides) in enumerate(self.getPoints()):
+            if self.isPruned(self.estimates[i]):
+                continue
+            for seed in self.seeds:
+                key = pointKey(conf_overrides, xml_overrides, seed)
+                result = self.loadResult(key)
+                if result is None:
+                    missing.append((i, seed, key,
+                                    (conf_overrides, xml_overrides, seed)))
+                else:
+                    results[(i, seed)] = result
+        info_logger.info("sweep: %d runs cached, %d to run" %
+                         (len(results), len(missing)))
+        if missing == []:
+            return results
+
+        # a new process for every run, so that no state(i.e. class
+        # attributes) is carried from one run to the next.
+        pool = Pool(min(processes, len(missing)), maxtasksperchild=1)
+        try:
+            runs = pool.imap(runPoint, [item[3] for item in missing])
+            # saved as soon as done, an interrupted sweep keeps them.
+            for (i, seed, key, point), result in zip(missing, runs):
+                result = list(result)
+                self.saveResult(key, point, result)
+                results[(i, seed)] = result
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
+    # Means of the unavailable and undurable counts of every grid point,
+    # with its analytical undurable count.
+    def report(self, results, res_file=None):
+        rows = []
+        for i, (conf_overrides, xml_overrides) in enumerate(self.getPoints()):
+            name = json.dumps([conf_overrides, xml_overrides],
+                              sort_keys=True)
+            estimate = self.estimates[i]
+            info_logger.info("%s: analytical undurable %s" % (name, estimate))
+            if self.isPruned(estimate):
+                info_logger.info("%s: pruned" % name)
+                rows.append([name, "", "", "", estimate])
+                continue
+            unavailable, undurable = RunningStat(), RunningStat()
+            for seed in self.seeds:
+                result = results[(i, seed)]
+                unavailable.add(result[0])
+                undurable.add(result[1])
+            info_logger.info("%s: unavailable %s" %
+                             (name, unavailable.toString()))
+            info_logger.info("%s: undurable %s" % (name, undurable.toString()))
+            rows.append([name, unavailable.getMean(), undurable.getMean(),
+                         undurable.getHalfWidth(), estimate])
+
+        if res_file is None:
+            return
+        with open(res_file, "w") as fp:
+            writer = csv.writer(fp, lineterminator='\n')
+            for row in rows:
+                writer.writerow(row)
+
+
+def main():
+    with open(sys.argv[1]) as fp:
+        sweep = Sweep(json.load(fp))
+    processes = cpu_count()
+    if len(sys.argv) > 2:
+        processes = int(sys.argv[2])
+    results = sweep.run(processes)
+    sweep.report(results, sweep.cache_dir + os.sep + "sweep.csv")
+
+
+if __name__ == "__main__":
+    st_time = time()
+    main()
+    end_time = time()
+    print "the execute time is %.2f minutes" % ((end_time - st_time)/60)
@@ -1,31 +1,46 @@
+import os
 import sys
+import random
 import logging
 import logging.config
 import csv
 from time import strftime, time
 from math import ceil
 
+import numpy.random
+
 from simulator.utils.Log import info_logger, error_logger
 from simulator.Configuration import Configuration
 from simulator.unit.Machine import Machine
 from simulator.failure.WeibullGenerator import WeibullGenerator
 from simulator.eventHandler.RandomDistributeEventHandler import \
     RandomDistributeEventHandler
+from simulator.eventHandler.ShardedEventHandler import ShardedEventHandler
 
 from simulator.utils.XMLParser import XMLParser
 from simulator.EventQueue import EventQueue
 from simulator.Event import Event
-from simulator.Result import Result
-
-conf = Configuration()
+from simulator.Checkpoint import Checkpoint
+from simulator.utils.Profiler import Profiler
 
 
 class Test(object):
 
-    def __init__(self):
+    # conf defaults to a Configuration read from the conf file, xml_overrides
+    # are replaced in the layer xml of every iteration(see XMLParser).
+    def __init__(self, conf=None, xml_overrides=None):
+        self.conf = Configuration() if conf is None else conf
+        self.xml_overrides = {} if xml_overrides is None else xml_overrides
         self.logger = logging.getLogger("infoLogger")
         # self.components = ("DataCenter", "Rack", "Machine", "Disk")
         self.units = []
+        # position of main(), saved with the checkpoints.
+        self.iteration = 0
+        self.iteration_count = 1
+        self.results = []
+        self.fork_seeds = []
+        # Profiler of the running iteration, None unless profile_file is set.
+        self.profiler = None
 
     def getMachineFailureGeneratorRate(self, root):
         m = root.getChildren()[0].getChildren()[0].getChildren()[0]
@@ -33,13 +48,15 @@ class Test(object):
             return (m.getFailureGenerator()).getRate()
         return -1
 
-    def main(self):
+    # Works out the size of the system from the configuration, the same for
+    # every iteration.
+    def setup(self):
+        conf = self.conf
         n, k = conf.n, conf.k
         total_active_storage = conf.total_active_storage
         disks_per_machine = conf.disks_per_machine
         machines_per_rack = conf.machines_per_rack
 
-        events_handled = 0
         recovery_threshold = conf.recovery_threshold
         if recovery_threshold == n:
             recovery_threshold -= 1
@@ -66,10 +83,10 @@ class Test(object):
         racks = int(ceil(total_storage_overheads/actual_storage_rack))
 
         # give the right rack count to Configuration
-        Configuration.rack_count = racks
+        conf.rack_count = racks
 
         # small number just for test!!
-        # Configuration.rack_count = 10
+        # conf.rack_count = 10
         # conf.num_chunks_diff_racks = 1
 
         # One rack is a failure domain, make sure data spreading across racks
@@ -77,107 +94,324 @@ class Test(object):
         #     raise Exception("Number of racks too small, adjust num chunks \
         #                      diff racks")
 
-        total_disks = Configuration.rack_count * conf.machines_per_rack * \
+        self.total_disks = conf.rack_count * conf.machines_per_rack * \
             conf.disks_per_machine
 
-        total_slices = int(ceil(total_storage_overheads * 1024.0 /
-                                (conf.chunk_size*n)))
-        Configuration.total_slices = total_slices
-        info_logger.info("total slices=" + str(total_slices) +
-                         " disk count=" + str(total_disks) +
+        self.total_slices = int(ceil(total_storage_overheads * 1024.0 /
+                                     (conf.chunk_size*n)))
+        conf.total_slices = self.total_slices
+        info_logger.info("total slices=" + str(self.total_slices) +
+                         " disk count=" + str(self.total_disks) +
                          " total storage=" + str(total_storage_overheads) +
                          "GB" + " disk size=" +
                          str(conf.chunk_size*conf.chunks_per_disk/1024) + "GB")
 
-        un_available_count = 0
-        un_durable_count = 0
+        self.res_file = None
         if conf.event_file is not None:
             # :(colon) is the reserved characters in Windows filename.
             # so, we could not use "%H:%M:%S" in the following.
             ts = strftime("%Y%m%d.%H.%M.%S")
             conf.event_file += '-' + ts
             info_logger.info("Events output to: " + conf.event_file)
-            res_file = "/root/PR-Sim/log/durability-" + ts
-            info_logger.info("Durabilities output to: " + res_file)
+            self.res_file = "/root/PR-Sim/log/durability-" + ts
+            info_logger.info("Durabilities output to: " + self.res_file)
+
+    # Builds the units from the layer xml, returns (root, xml). Units draw
+    # from random streams keyed by stream_seed if given.
+    def buildSystem(self, stream_seed=None):
+        conf = self.conf
+        xml = XMLParser(1, conf.rack_count, self.xml_overrides, conf)
+        self.units = xml.readFile()
+        root = self.units[0]
+        if stream_seed is not None:
+            root.setRandomStreams(stream_seed)
+            for population in xml.getPopulations():
+                population.setRandomStreams(stream_seed)
+        machines = [unit for unit in root.getUnits()
+                    if isinstance(unit, Machine)]
+        fail_fraction = machines[0].fail_fraction
+        rate = -1
+        if fail_fraction != 0:
+            rate = self.getMachineFailureGeneratorRate(root)
+        if rate != -1 and rate != 0:
+            total_machines = conf.machines_per_rack * conf.rack_count
+            all_machine_failure_per_hour = total_machines/rate
+            permanent_machines_per_hour = fail_fraction * \
+                total_machines/(24*30)
+            fail_fraction = permanent_machines_per_hour / \
+                all_machine_failure_per_hour
+            for machine in machines:
+                machine.setFailFraction(fail_fraction)
+        return root, xml
+
+    # Events of all units from start_time to total_time, in a new
+    # EventQueue.
+    def generateEvents(self, root, xml, start_time=0):
+        conf = self.conf
+        events = EventQueue(root.getUnits())
+        if conf.stream_events:
+            events.addEventSource(root.iterEvents(start_time,
+                                                  conf.total_time, True))
+        else:
+            root.generateEvents(events, start_time, conf.total_time, True)
+            for population in xml.getPopulations():
+                events.addEventBatch(population.generateEvents())
+        return events
+
+    # One Monte-Carlo iteration, random and numpy.random are seeded with seed
+    # if given. A checkpoint(see saveCheckpoint()) is resumed instead if
+    # given. Returns (unavailable count, undurable count, events handled,
+    # [[undurability, unavailability], ...]), one row for each layer.
+    def runIteration(self, seed=None, checkpoint=None):
+        conf = self.conf
+        self.startProfile()
+        if checkpoint is None:
+            if seed is not None:
+                random.seed(seed)
+                numpy.random.seed(seed)
+
+            stream_seed = None
+            if conf.random_streams:
+                stream_seed = seed
+                if stream_seed is None:
+                    stream_seed = random.randint(0, 2**31 - 2)
+            st_time = time()
+            root, xml = self.buildSystem(stream_seed)
+            self.addPhase("build", st_time)
+            checkpoint = Checkpoint(root, xml, stream_seed)
+        state = checkpoint
+
+        layer_num = conf.returnLayerNum()
+        while state.layer <= layer_num:
+            if state.handler is None:
+                self.startLayer(state)
+            self.handleEvents(state)
+            self.endLayer(state)
+        self.endProfile()
+
+        return state.un_available_count, state.un_durable_count, \
+            state.events_handled, state.undur_unavail
+
+    # Generates the events of the layer and starts its handler.
+    def startLayer(self, state):
+        conf = self.conf
+        root = state.root
+        i = state.layer
+        # Yes, all disks are instance of DiskWithScrubbing.
+        st_time = time()
+        events = self.generateEvents(root, state.xml)
+        self.addPhase("generate", st_time)
+
+        event_file = self.getEventFile()
+        if event_file is not None and \
+                not (conf.stream_events or conf.unit_population):
+            events.writeLog(event_file, "Iteration number: " + str(i))
+        # else:
+        conf.printAll()
+        if conf.handler_shards > 1:
+            handler = ShardedEventHandler(conf.handler_shards, conf)
+        else:
+            handler = RandomDistributeEventHandler(conf)
+        if state.stream_seed is not None:
+            handler.setRandomStreams(state.stream_seed)
+        st_time = time()
+        handler.start(root, self.total_slices, self.total_disks)
+        self.addPhase("start", st_time)
+        error_logger.error("Starting simulation ")
+        state.events = events
+        state.handler = handler
+
+                # print slices locations to file for debugging.
+                # with open("locations", "w") as fp:
+                #     for i, s in enumerate(handler.locations):
+                #         msg = str(i)
+                #         for row in s:
+                #             disk = handler.index.disks[row]
+                #             msg += "  " + disk.getFullName()
+                #         msg += "\n"
+                #         fp.write(msg)
 
+    # Generates the events of the running layer anew after the checkpoint of
+    # state, with the random numbers of its fork. The units start over at the
+    # time of the checkpoint, see Checkpoint.forkEvents().
+    def forkEvents(self, state):
+        if state.handler is None:
+            return
+        if state.handler.slice_log_weights is not None:
+            raise Exception("Biased failures can't be forked, the weights "
+                            "of the slices are those of the events before")
+        state.root.restart(state.time)
+        for population in state.xml.getPopulations():
+            population.restart(state.time)
+        state.forkEvents(self.generateEvents(state.root, state.xml,
+                                             state.time))
+        info_logger.info("Events after the checkpoint generated anew: %d" %
+                         state.events.size())
+
+    # Event log of the running iteration, None if events aren't logged.
+    def getEventFile(self):
+        return self.conf.event_file
+
+    # Event handling, a checkpoint is saved after the first event at or after
+    # state.next_time.
+    def handleEvents(self, state):
+        conf = self.conf
+        if conf.checkpoint_file is None or conf.checkpoint_interval <= 0:
+            state.next_time = None
+        elif state.next_time is None:
+            state.next_time = conf.checkpoint_interval
+        events = state.events
+        handler = state.handler
+        next_time = state.next_time
+        removeFirst = events.removeFirst
+        handleEvent = handler.handleEvent
+        if self.profiler is not None:
+            removeFirst, handleEvent = self.profiler.wrap(handler, events)
+        st_time = time()
+        e = removeFirst()
+        while e is not None:
+            handleEvent(e, events)
+            state.events_handled += 1
+            if next_time is not None and e.getTime() >= next_time:
+                self.saveCheckpoint(state, e.getTime())
+                next_time = state.next_time
+            e = removeFirst()
+        self.addPhase("handle", st_time)
+
+    # Checkpoint file names end with the iteration, the seeds of the forks
+    # resumed(each as "s" + seed) and the simulated time, so a fork never
+    # overwrites the checkpoints it was forked from.
+    def saveCheckpoint(self, state, current_time):
+        conf = self.conf
+        while state.next_time <= current_time:
+            state.next_time += conf.checkpoint_interval
+        state.iteration = self.iteration
+        state.iteration_count = self.iteration_count
+        state.results = self.results
+        state.fork_seeds = self.fork_seeds
+        last_file = state.file_name
+        file_name = conf.checkpoint_file + "-" + str(self.iteration) + "-"
+        for seed in self.fork_seeds:
+            file_name += "s" + str(seed) + "-"
+        file_name += str(int(current_time))
+        st_time = time()
+        state.save(file_name, current_time)
+        self.addPhase("checkpoint", st_time)
+        info_logger.info("Checkpoint saved to: " + file_name)
+        if last_file is not None and last_file != file_name and \
+                not conf.checkpoint_keep:
+            os.remove(last_file)
+
+    # Adds up the results of the layer, the next layer starts anew.
+    def endLayer(self, state):
+        conf = self.conf
+        handler = state.handler
+        events_handled = state.events_handled
+        st_time = time()
+        result = handler.end()
+        self.addPhase("end", st_time)
+        info_logger.info(result.toString())
+        info_logger.info("Events handled: %d" % events_handled)
+        # weighted by the likelihood ratios of the slices, which are 1
+        # unless failures are biased.
+        state.un_available_count += result.unavailable_estimate
+        state.un_durable_count += result.undurable_estimate
+
+        # Record undurability and unavailability in csv files, unrounded as
+        # biased estimates can be far below any fixed precision.
+        undurability = (float(result.undurable_estimate) /
+                        len(handler.available_count)) * 100
+        print "number of unavailable slices:", \
+            handler.unavailable_durations.getSliceCount()
+        unavail_time = handler.getUnavailableTime()
+        unavailability = (unavail_time/(conf.total_slices*conf.total_time)) * 100
+        print "unavailability:", unavailability
+        state.undur_unavail.append([undurability, unavailability])
+
+        state.layer += 1
+        state.events = None
+        state.handler = None
+
+    # Profiles the iteration if profile_file is set, see
+    # simulator.utils.Profiler.
+    def startProfile(self):
+        conf = self.conf
+        self.profiler = None
+        if conf.profile_file is None:
+            return
+        self.profiler = Profiler(conf.profile_sample)
+        if self.iteration == conf.profile_iteration:
+            self.profiler.startTrace(conf.profile_format)
+
+    # Time since st_time is added to phase name of the profile.
+    def addPhase(self, name, st_time):
+        if self.profiler is not None:
+            self.profiler.addPhase(name, time() - st_time)
+
+    # Writes the summary of the iteration, and its trace if traced.
+    def endProfile(self):
+        conf = self.conf
+        if self.profiler is None:
+            return
+        file_name = self.profiler.stopTrace(conf.profile_file + "-" +
+                                            str(self.iteration))
+        if file_name is not None:
+            info_logger.info("Profile trace output to: " + file_name)
+        self.profiler.write(conf.profile_file, self.iteration)
+        self.profiler = None
+
+    # Merges the results of runIteration() in iteration order.
+    def report(self, results):
+        iteration_count = len(results)
+        un_available_count = 0
+        un_durable_count = 0
         undur_unavail = []
-        iteration_count = int(sys.argv[1])
-        for i in xrange(iteration_count):
-            xml = XMLParser(1)
-            self.units = xml.readFile()
-            root = self.units[0]
-            if Machine.fail_fraction != 0:
-                rate = self.getMachineFailureGeneratorRate(root)
-            if rate != -1 and rate != 0:
-                total_machines = conf.machines_per_rack * \
-                    Configuration.rack_count
-                all_machine_failure_per_hour = total_machines/rate
-                permanent_machines_per_hour = Machine.fail_fraction * \
-                    total_machines/(24*30)
-                Machine.fail_fraction = permanent_machines_per_hour / \
-                    all_machine_failure_per_hour
-
-            layer_num = conf.returnLayerNum()
-            for i in xrange(1, layer_num + 1):
-                # Yes, all disks are instance of DiskWithScrubbing.
-                events = EventQueue()
-                root.generateEvents(events, 0, conf.total_time, True)
-
-                if True:  # conf.event_file is not None:
-                    events.printAll(conf.event_file,
-                                    "Iteration number: " + str(i))
-                # else:
-                conf.printAll()
-                handler = RandomDistributeEventHandler()
-                handler.start(root, total_slices, total_disks)
-                error_logger.error("Starting simulation ")
-
-                    # print slices locations to file for debugging.
-                    # with open("locations", "w") as fp:
-                    #     for i, s in enumerate(handler.slice_locations):
-                    #         msg = str(i)
-                    #         for disk in s:
-                    #             msg += "  " + disk.getFullName()
-                    #         msg += "\n"
-                    #         fp.write(msg)
-
-                    # Event handling
-                e = events.removeFirst()
-                while e is not None:
-                    handler.handleEvent(e, events)
-                    e = events.removeFirst()
-                    events_handled += 1
-
-                result = handler.end()
-                info_logger.info(result.toString())
-                info_logger.info("Events handled: %d" % events_handled)
-                un_available_count += Result.unavailable_count
-                un_durable_count += Result.undurable_count
-
-                # Record undurability and unavailability in csv files.
-                undurability = (float(handler.undurable_slice_count) /
-                                len(handler.available_count)) * 100
-                unavail_time = 0.0
-                unavailables = handler.unavailable_durations.keys()
-                print "number of unavailable slices:", len(unavailables)
-                for item in unavailables:
-                    for ts_duration in handler.unavailable_durations[item]:
-                        unavail_time += ts_duration[1] - ts_duration[0]
-                unavailability = (unavail_time/(conf.total_slices*conf.total_time)) * 100
-                print "unavailability:", unavailability
-                undur_unavail.append([round(undurability, 5), round(unavailability, 5)])
+        for unavailable, undurable, events_handled, rows in results:
+            un_available_count += unavailable
+            un_durable_count += undurable
+            undur_unavail += rows
 
         if True:  # conf.event_file is None:
-            info_logger.info("avg unavailable = %.5f" %
+            info_logger.info("avg unavailable = %e" %
                              (float(un_available_count)/iteration_count))
-            info_logger.info("avg undurable = %.5f" %
+            info_logger.info("avg undurable = %e" %
                              (float(un_durable_count)/iteration_count))
 
-        with open(res_file, 'w') as fp:
+        if self.res_file is None:
+            return
+        with open(self.res_file, 'w') as fp:
             writer = csv.writer(fp, lineterminator='\n')
             for item in undur_unavail:
                 writer.writerow(item)
 
+    # usage: Test.py iteration_count
+    #        Test.py --resume checkpoint_file [seed]
+    # A resumed run goes on from the checkpoint to the end of its iterations.
+    # With a seed, random numbers after the checkpoint are drawn anew from
+    # it, so several continuations can be forked from one checkpoint. The
+    # events after the checkpoint are generated anew too, see
+    # Checkpoint.fork() and forkEvents().
+    def main(self):
+        self.setup()
+        checkpoint = None
+        if sys.argv[1] == "--resume":
+            checkpoint = Checkpoint.load(sys.argv[2])
+            info_logger.info("Resuming " + checkpoint.toString())
+            if len(sys.argv) > 3:
+                checkpoint.fork(int(sys.argv[3]))
+                self.forkEvents(checkpoint)
+            self.iteration = checkpoint.iteration
+            self.iteration_count = checkpoint.iteration_count
+            self.results = checkpoint.results
+            self.fork_seeds = checkpoint.fork_seeds
+        else:
+            self.iteration_count = int(sys.argv[1])
+
+        while self.iteration < self.iteration_count:
+            self.results.append(self.runIteration(checkpoint=checkpoint))
+            checkpoint = None
+            self.iteration += 1
+        self.report(self.results)
 
 
 if __name__ == "__main__":
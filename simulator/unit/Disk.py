@@ -1,9 +1,19 @@
 from simulator.Unit import Unit
 from numpy import isnan, isinf
 from simulator.Event import Event
+from simulator.EventQueue import EventQueue
+from simulator.utils.RandomStream import RandomStream, streamKey, purposeID
 
 
 class Disk(Unit):
+    # DiskPopulation the disk belongs to, if any. Events of such disks are
+    # generated by the population.
+    population = None
+    latent_error_generator = None
+    # RandomStream of the recoveries of generateMachineRecoveryEvent(), apart
+    # from the stream of the recovery generator as they are drawn when the
+    # machine fails, not in the order of the disk events.
+    recovery_stream = None
 
     def addEventGenerator(self, generator):
         self.latent_error_generator = None
@@ -12,7 +22,46 @@ class Disk(Unit):
         else:
             super(Disk, self).addEventGenerator(generator)
 
+    def getEventGenerators(self):
+        generators = super(Disk, self).getEventGenerators()
+        if self.latent_error_generator is not None:
+            generators.append(self.latent_error_generator)
+        return generators
+
+    # generators of disks of a population are shared, the ratios of the
+    # draws are kept by the population.
+    def getLogLikelihoodRatio(self):
+        if self.population is None:
+            return super(Disk, self).getLogLikelihoodRatio()
+        return self.population.getLogLikelihoodRatio(self)
+
+    # generators of disks of a population are shared, their streams are
+    # kept by the population.
+    def setRandomStreams(self, master_seed):
+        if self.population is None:
+            super(Disk, self).setRandomStreams(master_seed)
+        self.recovery_stream = RandomStream(streamKey(
+            master_seed, self.id, purposeID("machineRecovery")))
+
+    # generateRecoveryEvent() of a disk failed by a permanent machine failure.
+    def generateMachineRecoveryEvent(self, result_events, failure_time,
+                                     end_time):
+        if self.recovery_stream is None:
+            return self.generateRecoveryEvent(result_events, failure_time,
+                                              end_time)
+        stream = self.recovery_generator.stream
+        self.recovery_generator.setRandomStream(self.recovery_stream)
+        try:
+            return self.generateRecoveryEvent(result_events, failure_time,
+                                              end_time)
+        finally:
+            self.recovery_generator.setRandomStream(stream)
+
     def generateEvents(self, result_events, start_time, end_time, reset):
+        if self.population is not None:
+            self.population.addWindow(self, start_time, end_time)
+            return
+
         current_time = start_time
         last_recover_time = start_time
 
@@ -50,6 +99,16 @@ class Disk(Unit):
                                          current_time, self))
             last_recover_time = current_time
 
+    # Streaming counterpart of generateEvents(), the events of one window are
+    # generated together. Note the last recovery is not truncated at end_time.
+    def iterEvents(self, start_time, end_time, reset):
+        if self.population is not None:
+            raise Exception("Disk population can't generate events on demand")
+        window_events = EventQueue()
+        self.generateEvents(window_events, start_time, end_time, reset)
+        for e in window_events.iterEvents():
+            yield e
+
     def generateRecoveryEvent(self, result_events, failure_time, end_time):
         if end_time < 0 or failure_time < 0:
             raise Exception("end time or failure time is negative")
@@ -59,7 +118,8 @@ class Disk(Unit):
             raise Exception("end time = Inf or NaN")
 
         self.recovery_generator.reset(failure_time)
-        recovery_time = self.recovery_generator.generateNextEvent(failure_time)
+        recovery_time = self.recovery_generator.generateNextEvent(
+            failure_time)
         # if recovery falls later than the end time (which is the time of the
         # next failure of the higher-level component we just co-locate the
         # recovery with the failure because the data will remain unavailable
@@ -69,6 +129,10 @@ class Disk(Unit):
         self.last_recovery_time = recovery_time
         if self.last_recovery_time < 0:
             raise Exception("recovery time is negative")
+        if self.population is not None:
+            self.population.addRecovery(self, recovery_time)
+            self.population.addLogLikelihoodRatios(
+                self.recovery_generator, self.population_index)
         result_events.addEvent(Event(Event.EventType.Recovered, recovery_time,
                                      self))
         return recovery_time
@@ -0,0 +1,203 @@
+from numpy import array, concatenate, zeros, full, minimum, float64
+
+from simulator.Event import Event, EventBatch
+from simulator.utils.RandomStream import RandomStreams, purposeID
+
+
+class DiskPopulation(object):
+    """
+    All disks built from one component of the layer, their events are
+    generated together.
+
+    Disks of a population share their event generators, and only record the
+    windows they are asked to generate events for (see Disk.generateEvents())
+    and the recoveries of permanent machine failures. generateEvents()
+    replays what every disk recorded, in order, with the batch calls of the
+    generators, and returns the events as an EventBatch.
+    """
+    WINDOW = 0
+    RECOVERY = 1
+
+    def __init__(self):
+        self.disks = []
+        self.unit_ids = None
+        # generator name -> RandomStreams of the disks, see
+        # setRandomStreams(). None means the generators draw from the random
+        # modules.
+        self.streams = None
+        # log likelihood ratio of the draws of every disk, None until a
+        # biased generator draws, see addLogLikelihoodRatios().
+        self.log_likelihood_ratios = None
+        self.clear()
+
+    def addDisk(self, disk):
+        disk.population = self
+        disk.population_index = len(self.disks)
+        self.disks.append(disk)
+        self.op_counts.append(0)
+
+    # Every disk gets a stream per generator, keyed like those of
+    # Unit.setRandomStreams(), so a disk draws the same numbers in a
+    # population and on its own.
+    def setRandomStreams(self, master_seed):
+        unit_ids = [disk.getID() for disk in self.disks]
+        self.streams = dict([
+            (generator.getName(), RandomStreams.fromUnits(
+                master_seed, unit_ids, purposeID(generator.getName())))
+            for generator in self.disks[0].getEventGenerators()])
+
+    # streams of generator for the disks at indexes, None without streams.
+    def selectStreams(self, generator, indexes):
+        if self.streams is None:
+            return None
+        return self.streams[generator.getName()].select(indexes)
+
+    # generateNextEvents() of generator for the disks at indexes.
+    def draw(self, generator, indexes, current_times, start_times=None):
+        times = generator.generateNextEvents(
+            current_times, start_times, self.selectStreams(generator, indexes))
+        self.addLogLikelihoodRatios(generator, indexes)
+        return times
+
+    # Adds the log likelihood ratios of the last call of generator to those
+    # of the disks at indexes(each disk at most once).
+    def addLogLikelihoodRatios(self, generator, indexes):
+        ratios = generator.last_log_likelihood_ratios
+        if ratios is None:
+            return
+        if self.log_likelihood_ratios is None:
+            self.log_likelihood_ratios = zeros(len(self.disks))
+        self.log_likelihood_ratios[indexes] += ratios
+
+    def getLogLikelihoodRatio(self, disk):
+        if self.log_likelihood_ratios is None:
+            return 0.0
+        return float(self.log_likelihood_ratios[disk.population_index])
+
+    def clear(self):
+        # one item per recorded operation: rank(the number of operations
+        # recorded by the disk before), disk index, kind, two times.
+        self.op_ranks = []
+        self.op_disks = []
+        self.op_kinds = []
+        self.op_times = []
+        self.op_end_times = []
+        self.op_counts = [0] * len(self.disks)
+
+    def record(self, disk, kind, time, end_time):
+        index = disk.population_index
+        self.op_ranks.append(self.op_counts[index])
+        self.op_counts[index] += 1
+        self.op_disks.append(index)
+        self.op_kinds.append(kind)
+        self.op_times.append(time)
+        self.op_end_times.append(end_time)
+
+    def addWindow(self, disk, start_time, end_time):
+        self.record(disk, DiskPopulation.WINDOW, start_time, end_time)
+
+    def addRecovery(self, disk, recovery_time):
+        self.record(disk, DiskPopulation.RECOVERY, recovery_time,
+                    recovery_time)
+
+    # generators are the ones of the first disk, all disks share them. State
+    # of the disks is kept here, not in the disks.
+    def initState(self):
+        prototype = self.disks[0]
+        self.failure_generator = prototype.failure_generator
+        self.recovery_generator = prototype.recovery_generator
+        self.latent_error_generator = prototype.latent_error_generator
+        self.unit_ids = array([disk.getID() for disk in self.disks])
+        self.last_recovery_times = zeros(len(self.disks))
+
+    # see Unit.restart().
+    def restart(self, time):
+        if self.unit_ids is not None:
+            self.last_recovery_times[:] = time
+
+    def clearEvents(self):
+        self.event_times = [zeros(0)]
+        self.event_types = [zeros(0, dtype=int)]
+        self.event_unit_ids = [zeros(0, dtype=int)]
+        self.event_next_recovery_times = [zeros(0)]
+
+    def addEvents(self, e_type, times, indexes, next_recovery_times=None):
+        if next_recovery_times is None:
+            next_recovery_times = zeros(len(times))
+        self.event_times.append(times)
+        self.event_types.append(full(len(times), e_type.value))
+        self.event_unit_ids.append(self.unit_ids[indexes])
+        self.event_next_recovery_times.append(next_recovery_times)
+
+    # Events of everything recorded since the last call. Operations of
+    # one disk are replayed in order, those with the same rank of all disks
+    # together.
+    def generateEvents(self):
+        if self.op_disks == []:
+            return EventBatch([], [], [])
+
+        if self.unit_ids is None:
+            self.initState()
+        self.clearEvents()
+        ranks = array(self.op_ranks)
+        indexes = array(self.op_disks)
+        kinds = array(self.op_kinds)
+        times = array(self.op_times, dtype=float64)
+        end_times = array(self.op_end_times, dtype=float64)
+        for rank in xrange(ranks.max() + 1):
+            recoveries = (ranks == rank) & (kinds == DiskPopulation.RECOVERY)
+            self.last_recovery_times[indexes[recoveries]] = times[recoveries]
+            windows = (ranks == rank) & (kinds == DiskPopulation.WINDOW)
+            self.generateWindows(indexes[windows], times[windows],
+                                 end_times[windows])
+
+        batch = EventBatch(concatenate(self.event_times),
+                           concatenate(self.event_types),
+                           concatenate(self.event_unit_ids),
+                           next_recovery_times=concatenate(
+                               self.event_next_recovery_times))
+        self.clear()
+        return batch
+
+    # Disk.generateEvents() for the windows of disks at indexes.
+    def generateWindows(self, indexes, start_times, end_times):
+        current_times = start_times
+        last_recover_times = start_times
+        while len(indexes):
+            failure_times = self.draw(self.failure_generator, indexes,
+                                      current_times, current_times)
+            failed = failure_times <= end_times
+            if self.latent_error_generator is not None:
+                self.generateLatentErrors(indexes, last_recover_times,
+                                          minimum(failure_times, end_times))
+
+            indexes = indexes[failed]
+            end_times = end_times[failed]
+            failure_times = failure_times[failed]
+            recovery_times = self.draw(self.recovery_generator, indexes,
+                                       failure_times, failure_times)
+            assert (recovery_times > failure_times).all()
+            self.addEvents(Event.EventType.Failure, failure_times, indexes,
+                           recovery_times)
+            self.addEvents(Event.EventType.Recovered, recovery_times, indexes)
+
+            # a recovery later than end_time ends the window of its disk.
+            in_window = recovery_times <= end_times
+            indexes = indexes[in_window]
+            end_times = end_times[in_window]
+            current_times = recovery_times[in_window]
+            last_recover_times = current_times
+
+    def generateLatentErrors(self, indexes, start_times, end_times):
+        current_times = start_times
+        while len(indexes):
+            latent_error_times = self.draw(self.latent_error_generator,
+                                           indexes, current_times,
+                                           start_times)
+            in_window = latent_error_times <= end_times
+            indexes = indexes[in_window]
+            start_times = start_times[in_window]
+            end_times = end_times[in_window]
+            current_times = latent_error_times[in_window]
+            self.addEvents(Event.EventType.LatentDefect, current_times,
+                           indexes)
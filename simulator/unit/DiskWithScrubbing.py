@@ -1,5 +1,6 @@
 from numpy import isnan, isinf, ceil
 from simulator.Event import Event
+from simulator.EventQueue import EventQueue
 from simulator.unit.Disk import Disk
 
 
@@ -9,6 +10,7 @@ class DiskWithScrubbing(Disk):
         super(DiskWithScrubbing, self).__init__(name, parent, parameters)
         self.last_recovery_time = 0.0
         self.last_scrub_start = 0.0
+        self.scrub_generator = None
         # Every 2 weeks = 336 hours scan the whole system.
         self.scan_period = 336
 
@@ -18,6 +20,12 @@ class DiskWithScrubbing(Disk):
     def getLastScrubStart(self):
         return self.last_scrub_start
 
+    def getEventGenerators(self):
+        generators = super(DiskWithScrubbing, self).getEventGenerators()
+        if self.scrub_generator is not None:
+            generators.append(self.scrub_generator)
+        return generators
+
     def addEventGenerator(self, generator):
         if generator.getName() == "latentErrorGenerator":
             self.latent_error_generator = generator
@@ -27,83 +35,117 @@ class DiskWithScrubbing(Disk):
             super(DiskWithScrubbing, self).addEventGenerator(generator)
 
     def generateEvents(self, result_events, start_time, end_time, reset):
+        if self.population is not None:
+            self.population.addWindow(self, start_time, end_time)
+            return
+
+        current_time = self.startGeneration(start_time, end_time)
+        while current_time is not None:
+            current_time = self.generateFailureCycle(
+                result_events, start_time, end_time, current_time)
+
+    # Streaming counterpart of generateEvents(), events are generated one
+    # failure/recovery cycle at a time.
+    def iterEvents(self, start_time, end_time, reset):
+        if self.population is not None:
+            raise Exception("Disk population can't generate events on demand")
+        current_time = self.startGeneration(start_time, end_time)
+        while current_time is not None:
+            cycle_events = EventQueue()
+            current_time = self.generateFailureCycle(
+                cycle_events, start_time, end_time, current_time)
+            for e in cycle_events.iterEvents():
+                yield e
+
+    # state of disks of a population is kept by the population.
+    def restart(self, time):
+        if self.population is None:
+            self.last_recovery_time = time
+            self.latent_error_generator.reset(time)
+
+    def startGeneration(self, start_time, end_time):
         if isnan(start_time) or isinf(start_time):
             raise Exception("start_time = Inf or NAN")
         if isnan(end_time) or isinf(end_time):
             raise Exception("end_time = Inf or NAN")
 
-        current_time = start_time
         if self.children != [] or len(self.children):
             raise Exception("Disk should not have any children")
 
         if start_time == 0:
             self.last_recovery_time = 0
             self.latent_error_generator.reset(0)
+        return start_time
 
-        while True:
-            if self.last_recovery_time < 0:
-                raise Exception("Negative last recover time")
-
-            # The loop below is what makes the difference for avoiding weird
-            # amplification of failures when having machine failures.
-            # The reason is as follows: when generateEvents is called once for
-            # the whole duration of the simulation(as when there are no
-            # machine failures), this loop will never be executed. But when
-            # machine fail, the function is called for the time interval
-            # between machine recovery and second failure. The first time
-            # the disk failure event generated, it may occur after the machine
-            # failure event, so it is discarded when it is called for the next
-            # time interval, the new failure event might be generated, to be
-            # before the current start of the current interval. It's tempting
-            # to round that event to the start of the interval, but then it
-            # occurs concurrently to many disks. So the critical addition is
-            # this loop, which effectively forces the proper generation of the
-            # event, which is consistent with the previously generated one that
-            # was discarded.
-            failure_time = 0
+    # Generates the next failure in [start_time, end_time] with its recovery
+    # and the latent errors before it. Returns the time the next cycle starts
+    # from, or None if no failure happens before end_time.
+    def generateFailureCycle(self, result_events, start_time, end_time,
+                             current_time):
+        if self.last_recovery_time < 0:
+            raise Exception("Negative last recover time")
+
+        # The loop below is what makes the difference for avoiding weird
+        # amplification of failures when having machine failures.
+        # The reason is as follows: when generateEvents is called once for
+        # the whole duration of the simulation(as when there are no
+        # machine failures), this loop will never be executed. But when
+        # machine fail, the function is called for the time interval
+        # between machine recovery and second failure. The first time
+        # the disk failure event generated, it may occur after the machine
+        # failure event, so it is discarded when it is called for the next
+        # time interval, the new failure event might be generated, to be
+        # before the current start of the current interval. It's tempting
+        # to round that event to the start of the interval, but then it
+        # occurs concurrently to many disks. So the critical addition is
+        # this loop, which effectively forces the proper generation of the
+        # event, which is consistent with the previously generated one that
+        # was discarded.
+        failure_time = 0
+        failure_time = self.failure_generator.generateNextEvent(
+            self.last_recovery_time)
+        while failure_time < start_time:
             failure_time = self.failure_generator.generateNextEvent(
                 self.last_recovery_time)
-            while failure_time < start_time:
-                failure_time = self.failure_generator.generateNextEvent(
-                    self.last_recovery_time)
-
-            if failure_time > end_time:
-                self.generateLatentErrors(result_events, current_time,
-                                          end_time)
-                # self.generateScrub(result_events, current_time, end_time)
-                break
 
-            if failure_time < start_time or failure_time > end_time:
-                raise Exception("Wrong time range.")
+        if failure_time > end_time:
+            self.generateLatentErrors(result_events, current_time,
+                                      end_time)
+            # self.generateScrub(result_events, current_time, end_time)
+            return None
 
-            fail_event = Event(Event.EventType.Failure, failure_time, self)
-            result_events.addEvent(fail_event)
+        if failure_time < start_time or failure_time > end_time:
+            raise Exception("Wrong time range.")
 
-            recovery_time = self.generateRecoveryEvent(result_events,
-                                                       failure_time, end_time)
-            if recovery_time < 0:
-                raise Exception("recovery time is negative")
-            fail_event.next_recovery_time = recovery_time
+        fail_event = Event(Event.EventType.Failure, failure_time, self)
+        result_events.addEvent(fail_event)
 
-            # generate latent errors from the current time to the time of the
-            # generated failure.
-            self.generateLatentErrors(result_events, current_time,
-                                      failure_time)
+        recovery_time = self.generateRecoveryEvent(result_events,
+                                                   failure_time, end_time)
+        if recovery_time < 0:
+            raise Exception("recovery time is negative")
+        fail_event.next_recovery_time = recovery_time
+
+        # generate latent errors from the current time to the time of the
+        # generated failure.
+        self.generateLatentErrors(result_events, current_time,
+                                  failure_time)
 
-            # lifetime of a latent error starts when the disk is reconstructed
-            self.latent_error_generator.reset(recovery_time)
+        # lifetime of a latent error starts when the disk is reconstructed
+        self.latent_error_generator.reset(recovery_time)
 
-            # scrubs get generated depending on the scrub frequency, starting
-            # from the previous scrub finish event.
-            # self.generateScrub(result_events, current_time, failure_time)
+        # scrubs get generated depending on the scrub frequency, starting
+        # from the previous scrub finish event.
+        # self.generateScrub(result_events, current_time, failure_time)
 
-            # scrub generator is reset on the next recovery from the disk error
-            # self.scrub_generator.reset(self.last_recovery_time)
+        # scrub generator is reset on the next recovery from the disk error
+        # self.scrub_generator.reset(self.last_recovery_time)
 
-            # move the clocks, next iteration starts from the next recovery
-            current_time = self.last_recovery_time
-            if current_time < 0:
-                raise Exception("current recovery time is negative")
+        # move the clocks, next iteration starts from the next recovery
+        current_time = self.last_recovery_time
+        if current_time < 0:
+            raise Exception("current recovery time is negative")
+        return current_time
 
     def generateRecoveryEvent(self, result_events, failure_time, end_time):
         if end_time < 0 or failure_time < 0:
@@ -124,6 +166,10 @@ class DiskWithScrubbing(Disk):
         self.last_recovery_time = recovery_time
         if self.last_recovery_time < 0:
             raise Exception("recovery time is negative")
+        if self.population is not None:
+            self.population.addRecovery(self, recovery_time)
+            self.population.addLogLikelihoodRatios(
+                self.recovery_generator, self.population_index)
         result_events.addEvent(Event(Event.EventType.Recovered, recovery_time,
                                      self))
         return recovery_time
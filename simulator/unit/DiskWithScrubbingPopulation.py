@@ -0,0 +1,150 @@
+import sys
+from time import time
+
+from numpy import ceil, minimum, isinf, any as np_any
+
+from simulator.Event import Event
+from simulator.EventQueue import EventQueue
+from simulator.Unit import Unit
+from simulator.unit.DiskPopulation import DiskPopulation
+from simulator.unit.DiskWithScrubbing import DiskWithScrubbing
+from simulator.failure.WeibullGenerator import WeibullGenerator
+
+
+class DiskWithScrubbingPopulation(DiskPopulation):
+    """
+    Population of DiskWithScrubbing, see DiskWithScrubbing.generateEvents()
+    for the events of one window.
+    """
+
+    def initState(self):
+        super(DiskWithScrubbingPopulation, self).initState()
+        self.scan_period = self.disks[0].scan_period
+        # start times of the latent error generator, reset when disks
+        # recover.
+        self.latent_start_times = self.last_recovery_times.copy()
+
+    def restart(self, time):
+        super(DiskWithScrubbingPopulation, self).restart(time)
+        if self.unit_ids is not None:
+            self.latent_start_times[:] = time
+
+    def generateWindows(self, indexes, start_times, end_times):
+        restarted = indexes[start_times == 0]
+        self.last_recovery_times[restarted] = 0
+        self.latent_start_times[restarted] = 0
+
+        current_times = start_times
+        while len(indexes):
+            last_recovery_times = self.last_recovery_times[indexes]
+            failure_times = self.draw(self.failure_generator, indexes,
+                                      last_recovery_times)
+            early = failure_times < start_times
+            while np_any(early):
+                failure_times[early] = self.draw(self.failure_generator,
+                                                 indexes[early],
+                                                 last_recovery_times[early])
+                early = failure_times < start_times
+
+            done = failure_times > end_times
+            self.generateLatentErrors(indexes[done], current_times[done],
+                                      end_times[done])
+
+            failed = ~done
+            indexes = indexes[failed]
+            start_times = start_times[failed]
+            end_times = end_times[failed]
+            current_times = current_times[failed]
+            failure_times = failure_times[failed]
+            recovery_times = minimum(
+                self.draw(self.recovery_generator, indexes, failure_times,
+                          failure_times),
+                end_times)
+            if np_any(recovery_times < 0):
+                raise Exception("recovery time is negative")
+            self.last_recovery_times[indexes] = recovery_times
+            self.addEvents(Event.EventType.Failure, failure_times, indexes,
+                           recovery_times)
+            self.addEvents(Event.EventType.Recovered, recovery_times, indexes)
+
+            self.generateLatentErrors(indexes, current_times, failure_times)
+            self.latent_start_times[indexes] = recovery_times
+            current_times = recovery_times
+
+    def generateLatentErrors(self, indexes, start_times, end_times):
+        current_times = start_times
+        while len(indexes):
+            latent_error_times = self.draw(self.latent_error_generator,
+                                           indexes, current_times,
+                                           self.latent_start_times[indexes])
+            in_window = ~isinf(latent_error_times) & \
+                (latent_error_times <= end_times)
+            indexes = indexes[in_window]
+            end_times = end_times[in_window]
+            current_times = latent_error_times[in_window]
+            self.addEvents(Event.EventType.LatentDefect, current_times,
+                           indexes)
+            latent_recovery_times = minimum(
+                ceil(current_times/self.scan_period)*self.scan_period,
+                end_times)
+            self.addEvents(Event.EventType.LatentRecovered,
+                           latent_recovery_times, indexes)
+
+
+# Time to build and to generate the events of disks(count is given on the
+# command line) one by one and as a population, with the generators of
+# conf/layer_1.xml.
+def main():
+    def readGenerators():
+        return [WeibullGenerator("failureGenerator",
+                                 {'gamma': 0, 'lamda': 16257.8, 'beta': 1.3}),
+                WeibullGenerator("recoveryGenerator",
+                                 {'gamma': 6, 'lamda': 168, 'beta': 2}),
+                WeibullGenerator("latentErrorGenerator",
+                                 {'gamma': 0, 'lamda': 9259, 'beta': 1}),
+                WeibullGenerator("scrubGenerator",
+                                 {'gamma': 6, 'lamda': 336, 'beta': 3})]
+
+    disk_count = 200000
+    if len(sys.argv) > 1:
+        disk_count = int(sys.argv[1])
+    total_time = 87600
+
+    st_time = time()
+    root = Unit("root", None, {})
+    disks = []
+    for i in xrange(disk_count):
+        disk = DiskWithScrubbing("disk" + str(i), root, {})
+        for generator in readGenerators():
+            disk.addEventGenerator(generator)
+        disks.append(disk)
+    build_time = time() - st_time
+    st_time = time()
+    events = EventQueue()
+    for disk in disks:
+        disk.generateEvents(events, 0, total_time, True)
+    generate_time = time() - st_time
+    print "one by one: build %.2fs, %d events generated in %.2fs" % \
+        (build_time, events.size(), generate_time)
+
+    st_time = time()
+    population = DiskWithScrubbingPopulation()
+    generators = readGenerators()
+    root = Unit("root", None, {})
+    for i in xrange(disk_count):
+        disk = DiskWithScrubbing("disk" + str(i), root, {})
+        for generator in generators:
+            disk.addEventGenerator(generator)
+        population.addDisk(disk)
+    build_time = time() - st_time
+    st_time = time()
+    for disk in population.disks:
+        disk.generateEvents(None, 0, total_time, True)
+    batch = population.generateEvents()
+    generate_time = time() - st_time
+    print "population: build %.2fs, %d events generated in %.2fs" % \
+        (build_time, len(batch), generate_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,27 @@ from random import random
 
 from simulator.Unit import Unit
 from simulator.Event import Event
+from simulator.EventQueue import EventQueue
 from simulator.failure.Trace import Trace
+from simulator.utils.RandomStream import RandomStream, streamKey, purposeID
 
 
 class Machine(Unit):
-    id_counter = 0
-    fail_fraction = 0.0
+    # RandomStream of the permanent failure draws, the random module if None.
+    stream = None
 
     def __init__(self, name, parent, parameters):
-        self.my_id = Machine.id_counter
-        Machine.id_counter += 1
+        # index of the machine in its topology, given by XMLParser.
+        self.my_id = -1
         super(Machine, self).__init__(name, parent, parameters)
 
         # amount of time after which a machine failure is treated as permanent,
         # and eager disk recovery is begun, if eager_recovery_enabled is True.
         self.fail_timeout = -1
         if self.fail_timeout == -1:
-            # Fraction of machine failures that are permanent.
-            Machine.fail_fraction = float(parameters.get("fail_fraction", 0.008))
+            # Fraction of machine failures that are permanent, see
+            # setFailFraction().
+            self.fail_fraction = float(parameters.get("fail_fraction", 0.008))
             self.fail_timeout = float(parameters.get("fail_timeout", 0.25))
             # If True, machine failure and recovery events will be generated
             # but ignored.
@@ -27,6 +30,16 @@ class Machine(Unit):
             self.eager_recovery_enabled = bool(parameters.get(
                 "eager_recovery_enabled"))
 
+    def setRandomStreams(self, master_seed):
+        super(Machine, self).setRandomStreams(master_seed)
+        self.stream = RandomStream(streamKey(master_seed, self.id,
+                                             purposeID("fail_fraction")))
+
+    # fail_fraction of the xml is per month, Test.buildSystem() gives the
+    # machines the fraction scaled to their failure rate.
+    def setFailFraction(self, fail_fraction):
+        self.fail_fraction = fail_fraction
+
     def getFailureGenerator(self):
         return self.failure_generator
 
@@ -69,72 +82,126 @@ class Machine(Unit):
                 u.generateEvents(result_events, last_recover_time,
                                  current_time, True)
 
-            if isinstance(self.recovery_generator, Trace):
-                self.recovery_generator.setCurrentEventType(False)
-            self.recovery_generator.reset(current_time)
-            recovery_time = self.recovery_generator.generateNextEvent(
+            recovery_time = self.generateFailureEvents(
+                result_events, failure_time, end_time)
+
+            current_time = recovery_time
+            last_recover_time = current_time
+            if current_time >= end_time - (1E-5):
+                break
+
+    # See Unit.iterWindowEvents(). Children events of a window are all
+    # generated before the failure of the machine is processed, as a
+    # permanent failure resets the recovery state of the disks. Recoveries of
+    # disks are cut at the failure of the machine, Unit.iterEvents() puts
+    # them after it.
+    def iterWindowEvents(self, start_time, end_time, reset):
+        current_time = start_time
+        last_recover_time = start_time
+
+        if isinstance(self.failure_generator, Trace):
+            self.failure_generator.setCurrentMachine(self.my_id)
+        if isinstance(self.recovery_generator, Trace):
+            self.recovery_generator.setCurrentMachine(self.my_id)
+
+        while True:
+            if reset:
+                self.failure_generator.reset(current_time)
+
+            if isinstance(self.failure_generator, Trace):
+                self.failure_generator.setCurrentEventType(True)
+
+            failure_time = self.failure_generator.generateNextEvent(
                 current_time)
-            assert (recovery_time > failure_time)
-            if recovery_time > end_time - (1E-5):
-                recovery_time = end_time - (1E-5)
-
-            r = random()
-            if not self.fast_forward:  # we will process failures
-                if r < Machine.fail_fraction:
-                    # failure type: tempAndShort=1, tempAndLong=2, permanent=3
-                    failure_type = 3
-
-                    # generate disk failures
-                    max_recovery_time = recovery_time
-                    for u in self.children:
-                        # ensure machine fails before disk
-                        disk_fail_time = failure_time + 1E-5
-                        disk_fail_event = Event(Event.EventType.Failure,
-                                                disk_fail_time, u)
-                        result_events.addEvent(disk_fail_event)
-                        disk_recovery_time = u.generateRecoveryEvent(
-                            result_events, disk_fail_time, end_time-(1E-5))
-                        disk_fail_event.next_recovery_time = disk_recovery_time
-                        # machine recovery must coincide with last disk recovery
-                        if disk_recovery_time > max_recovery_time:
-                            max_recovery_time = disk_recovery_time
-                    recovery_time = max_recovery_time + (1E-5)
-                else:
-                    if recovery_time - failure_time <= self.fail_timeout:
-                        # transient failure and come back very soon
-                        failure_type = 1
-                    else:
-                        # transient failure, but last long.
-                        failure_type = 2
-                        if self.eager_recovery_enabled:
-                            eager_recovery_start_time = failure_time + \
-                                                        self.fail_timeout
-                            eager_recovery_start_event = Event(
-                                Event.EventType.EagerRecoveryStart,
-                                eager_recovery_start_time, self)
-                            eager_recovery_start_event.next_recovery_time = \
-                                recovery_time
-                            result_events.addEvent(eager_recovery_start_event)
-                            # Ensure machine recovery happens after last eager
-                            # recovery installment
-                            recovery_time += 1E-5
+            current_time = failure_time
+            if current_time > end_time:
+                for e in self.iterChildrenEvents(last_recover_time, end_time):
+                    yield e
+                break
 
             if isinstance(self.failure_generator, Trace):
                 self.failure_generator.eventAccepted()
 
-            if self.fast_forward:
-                result_events.addEvent(Event(Event.EventType.Failure,
-                                             failure_time, self, True))
-                result_events.addEvent(Event(Event.EventType.Recovered,
-                                             recovery_time, self, True))
-            else:
-                result_events.addEvent(Event(Event.EventType.Failure,
-                                             failure_time, self, failure_type))
-                result_events.addEvent(Event(Event.EventType.Recovered,
-                                             recovery_time, self,
-                                             failure_type))
+            for e in self.iterChildrenEvents(last_recover_time, current_time):
+                yield e
+
+            own_events = EventQueue()
+            recovery_time = self.generateFailureEvents(
+                own_events, failure_time, end_time)
+            for e in own_events.iterEvents():
+                yield e
 
             current_time = recovery_time
             last_recover_time = current_time
             if current_time >= end_time - (1E-5):
                 break
+
+    # failure and recovery events of the machine failing at failure_time,
+    # returns the recovery time.
+    def generateFailureEvents(self, result_events, failure_time, end_time):
+        if isinstance(self.recovery_generator, Trace):
+            self.recovery_generator.setCurrentEventType(False)
+        self.recovery_generator.reset(failure_time)
+        recovery_time = self.recovery_generator.generateNextEvent(
+            failure_time)
+        assert (recovery_time > failure_time)
+        if recovery_time > end_time - (1E-5):
+            recovery_time = end_time - (1E-5)
+
+        r = random() if self.stream is None else self.stream.random()
+        if not self.fast_forward:  # we will process failures
+            if r < self.fail_fraction:
+                # failure type: tempAndShort=1, tempAndLong=2, permanent=3
+                failure_type = 3
+
+                # generate disk failures
+                max_recovery_time = recovery_time
+                for u in self.children:
+                    # ensure machine fails before disk
+                    disk_fail_time = failure_time + 1E-5
+                    disk_fail_event = Event(Event.EventType.Failure,
+                                            disk_fail_time, u)
+                    result_events.addEvent(disk_fail_event)
+                    disk_recovery_time = u.generateMachineRecoveryEvent(
+                        result_events, disk_fail_time, end_time-(1E-5))
+                    disk_fail_event.next_recovery_time = disk_recovery_time
+                    # machine recovery must coincide with last disk recovery
+                    if disk_recovery_time > max_recovery_time:
+                        max_recovery_time = disk_recovery_time
+                recovery_time = max_recovery_time + (1E-5)
+            else:
+                if recovery_time - failure_time <= self.fail_timeout:
+                    # transient failure and come back very soon
+                    failure_type = 1
+                else:
+                    # transient failure, but last long.
+                    failure_type = 2
+                    if self.eager_recovery_enabled:
+                        eager_recovery_start_time = failure_time + \
+                                                    self.fail_timeout
+                        eager_recovery_start_event = Event(
+                            Event.EventType.EagerRecoveryStart,
+                            eager_recovery_start_time, self)
+                        eager_recovery_start_event.next_recovery_time = \
+                            recovery_time
+                        result_events.addEvent(eager_recovery_start_event)
+                        # Ensure machine recovery happens after last eager
+                        # recovery installment
+                        recovery_time += 1E-5
+
+        if isinstance(self.failure_generator, Trace):
+            self.failure_generator.eventAccepted()
+
+        if self.fast_forward:
+            result_events.addEvent(Event(Event.EventType.Failure,
+                                         failure_time, self, True))
+            result_events.addEvent(Event(Event.EventType.Recovered,
+                                         recovery_time, self, True))
+        else:
+            result_events.addEvent(Event(Event.EventType.Failure,
+                                         failure_time, self, failure_type))
+            result_events.addEvent(Event(Event.EventType.Recovered,
+                                         recovery_time, self,
+                                         failure_type))
+
+        return recovery_time
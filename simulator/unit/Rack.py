@@ -1,5 +1,6 @@
 from simulator.Unit import Unit
 from simulator.Event import Event
+from simulator.EventQueue import mergeEvents
 
 
 class Rack(Unit):
@@ -49,9 +50,46 @@ class Rack(Unit):
             if current_time > end_time:
                 break
             if self.fast_forward:
-                result_events.addEvent(Event(Event.EventType.Recoverd,
+                result_events.addEvent(Event(Event.EventType.Recovered,
                                        current_time, self, ignore=True))
             else:
                 result_events.addEvent(Event(Event.EventType.Recovered,
                                        current_time, self))
             last_recover_time = current_time
+
+    def iterWindowEvents(self, start_time, end_time, reset):
+        current_time = start_time
+        last_recover_time = start_time
+
+        while True:
+            if reset:
+                self.failure_generator.reset(current_time)
+            failure_time = self.failure_generator.generateNextEvent(
+                current_time)
+            current_time = failure_time
+            if current_time > end_time:
+                for e in self.iterChildrenEvents(last_recover_time, end_time):
+                    yield e
+                break
+            fail_event = Event(Event.EventType.Failure, current_time, self)
+            if self.fast_forward:
+                fail_event.ignore = True
+            own_events = [fail_event]
+
+            self.recovery_generator.reset(current_time)
+            recovery_time = self.recovery_generator.generateNextEvent(
+                current_time)
+            assert (recovery_time > failure_time)
+            current_time = recovery_time
+            fail_event.next_recovery_time = recovery_time
+            if current_time <= end_time:
+                own_events.append(Event(Event.EventType.Recovered,
+                                        current_time, self,
+                                        ignore=self.fast_forward))
+
+            for e in mergeEvents([iter(own_events), self.iterChildrenEvents(
+                    last_recover_time, failure_time)]):
+                yield e
+            if current_time > end_time:
+                break
+            last_recover_time = current_time
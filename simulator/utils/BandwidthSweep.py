@@ -0,0 +1,81 @@
+from array import array
+
+from numpy import asarray, concatenate, argsort, cumsum, flatnonzero, \
+    minimum, diff, searchsorted, append
+
+
+# Sweep line over bandwidth deltas: sorts the (time, delta) pairs once(stable,
+# so pairs of one time keep their order) and returns the unique times with
+# the total bandwidth after each of them. A total between -1 and 0 is a
+# rounding error and set to 0, a lower one is an error.
+def sweep(times, deltas):
+    times = asarray(times, dtype=float)
+    deltas = asarray(deltas, dtype=float)
+    order = argsort(times, kind="mergesort")
+    times = times[order]
+    deltas = deltas[order]
+    # last pair of every time.
+    ends = flatnonzero(append(diff(times) != 0, True))
+
+    totals = cumsum(deltas)
+    values = totals[ends]
+    while True:
+        negative = flatnonzero(values < 0)
+        if len(negative) == 0:
+            break
+        i = negative[0]
+        if values[i] <= -1:
+            raise Exception("Negative bandwidth count")
+        # restart the sum from 0 after the rounded time.
+        start = ends[i] + 1
+        totals[ends[i]] = 0.0
+        totals[start:] = cumsum(deltas[start:])
+        values = totals[ends]
+    return times[ends], values
+
+
+# Time weighted statistics of a step series(value 0 before the first time),
+# over [0, total_time]: (peak, average, [percentiles]).
+def stepStats(times, values, total_time, percentiles=(50, 95, 99)):
+    times = minimum(concatenate([[0.0], times, [total_time]]), total_time)
+    values = concatenate([[0.0], values])
+    durations = diff(times)
+    average = (values*durations).sum()/total_time
+
+    order = argsort(values, kind="mergesort")
+    covered = cumsum(durations[order])
+    levels = []
+    for p in percentiles:
+        i = searchsorted(covered, covered[-1]*p/100.0)
+        levels.append(values[order][min(i, len(order) - 1)])
+    return values.max(), average, levels
+
+
+class BandwidthSweep(object):
+    """
+    Recovery bandwidth over time. Every recovery adds its bandwidth at its
+    start and removes it at its end, only these two deltas are kept(in
+    compact arrays), not the Recovery objects.
+    """
+
+    def __init__(self):
+        self.times = array('d')
+        self.deltas = array('d')
+
+    def add(self, start, end, bandwidth):
+        self.times.append(start)
+        self.deltas.append(bandwidth)
+        self.times.append(end)
+        self.deltas.append(-bandwidth)
+
+    def size(self):
+        return len(self.times)/2
+
+    # [(time, total bandwidth), ...] at every start or end time.
+    def getSeries(self):
+        times, values = sweep(self.times, self.deltas)
+        return zip(times, values)
+
+    def getStats(self, total_time, percentiles=(50, 95, 99)):
+        times, values = sweep(self.times, self.deltas)
+        return stepStats(times, values, total_time, percentiles)
@@ -0,0 +1,107 @@
+from array import array
+
+from numpy import frombuffer, isnan, unique, percentile, bincount
+
+
+class IntervalLog(object):
+    """
+    Append only log of [start, end] intervals of slices, in three columns
+    (slice id, start, end). An open interval has a nan end. The last
+    interval of every slice is indexed, so it can be closed or extended in
+    O(1).
+    """
+
+    def __init__(self):
+        self.slice_ids = array('l')
+        self.starts = array('d')
+        self.ends = array('d')
+        # slice id -> row of its last interval.
+        self.last = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    # row of the last interval of slice_index, None if it has none.
+    def getLast(self, slice_index):
+        return self.last.get(slice_index)
+
+    def isOpen(self, row):
+        return self.ends[row] != self.ends[row]
+
+    def add(self, slice_index, start, end=float("nan")):
+        row = len(self.starts)
+        self.slice_ids.append(slice_index)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.last[slice_index] = row
+        return row
+
+    def setEnd(self, row, end):
+        self.ends[row] = end
+
+    # whether the interval at row is open or ends after ts, i.e. the slice is
+    # already counted unavailable at ts(a lost slice is until end_time).
+    def covers(self, row, ts):
+        return self.isOpen(row) or self.ends[row] > ts
+
+    # A slice becomes unavailable at ts, an interval is opened unless one
+    # covers ts already.
+    def start(self, slice_index, ts):
+        row = self.last.get(slice_index)
+        if row is None or not self.covers(row, ts):
+            self.add(slice_index, ts)
+
+    # A slice becomes available at ts, or undurable(unavailable is True, the
+    # interval then lasts until end_time). An interval covering ts is
+    # extended rather than a second one added, so the intervals of a slice
+    # never overlap and its total is at most end_time.
+    def end(self, slice_index, ts, unavailable, end_time):
+        row = self.last.get(slice_index)
+        if row is None:
+            self.add(slice_index, ts, end_time)
+        elif unavailable:
+            if self.covers(row, ts):
+                self.setEnd(row, end_time)
+            else:
+                self.add(slice_index, ts, end_time)
+        else:
+            self.setEnd(row, ts)
+
+    # (slice id, start) of every open interval, sorted.
+    def getOpen(self):
+        return sorted([(slice_index, self.starts[row])
+                       for slice_index, row in self.last.iteritems()
+                       if self.isOpen(row)])
+
+    # number of slices with at least one interval.
+    def getSliceCount(self):
+        return len(self.last)
+
+    def getColumns(self):
+        return frombuffer(self.slice_ids,
+                          dtype="i%d" % self.slice_ids.itemsize), \
+            frombuffer(self.starts), frombuffer(self.ends)
+
+    def getDurations(self):
+        slice_ids, starts, ends = self.getColumns()
+        if isnan(ends).any():
+            raise Exception("Interval still open")
+        return ends - starts
+
+    def getTotal(self):
+        if len(self) == 0:
+            return 0.0
+        return float(self.getDurations().sum())
+
+    # total duration of every slice with intervals, (slice ids, totals).
+    def getSliceTotals(self):
+        slice_ids = self.getColumns()[0]
+        ids, rows = unique(slice_ids, return_inverse=True)
+        return ids, bincount(rows, self.getDurations(), minlength=len(ids))
+
+    # percentiles of the interval durations and of the per slice totals.
+    def getPercentiles(self, percentiles=(50, 90, 99)):
+        if len(self) == 0:
+            return [0.0]*len(percentiles), [0.0]*len(percentiles)
+        return list(percentile(self.getDurations(), percentiles)), \
+            list(percentile(self.getSliceTotals()[1], percentiles))
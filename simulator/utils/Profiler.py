@@ -0,0 +1,200 @@
+import sys
+import json
+import signal
+import cProfile
+from collections import OrderedDict
+from time import time
+
+from simulator.Event import Event
+
+
+class StackSampler(object):
+    """
+    Samples the Python stack every interval seconds of CPU time(SIGPROF),
+    the samples are written as folded stacks("frame;frame;... count" lines),
+    the input of flamegraph.pl and of most flame graph viewers.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = {}
+
+    def sample(self, signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append("%s:%s" % (code.co_filename.split("/")[-1],
+                                    code.co_name))
+            frame = frame.f_back
+        stack = ";".join(reversed(names))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def enable(self):
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def dump_stats(self, file_name):
+        with open(file_name, "w") as fp:
+            for stack, count in sorted(self.stacks.items()):
+                fp.write("%s %d\n" % (stack, count))
+
+
+class Profiler(object):
+    """
+    Wall times of the phases of a Test iteration(system build, event
+    generation, handler start, event handling, handler end, checkpoints)
+    and of the handling of its events, by event type and unit class, i.e.
+    "Failure/Machine".
+
+    The first events(first of them) of every kind are timed, then every
+    sample-th one of that kind, so rare kinds(i.e. rack failures) are timed
+    too. The queue removals are sampled the same way. The times of all events of a
+    kind are estimated from those of its timed ones, so profiling can be
+    left on. toJSON() gives the summary of the iteration.
+
+    One iteration can also be traced as a whole: by cProfile(a .prof file,
+    see pstats) or by a StackSampler(a .folded file).
+    """
+
+    def __init__(self, sample=64, first=16):
+        self.sample = sample
+        self.first = first
+        self.phases = OrderedDict()
+        # kind -> [count, timed count, timed seconds, seconds of the first
+        # ones]
+        self.kinds = {}
+        self.queue = [0, 0, 0.0, 0.0]
+        self.trace = None
+
+    def addPhase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    # whether the count-th event of a kind is timed.
+    def timed(self, count):
+        return count <= self.first or count % self.sample == 0
+
+    def addTime(self, stat, seconds):
+        stat[1] += 1
+        stat[2] += seconds
+        if stat[0] <= self.first:
+            stat[3] += seconds
+
+    # (removeFirst(), handleEvent(e, queue)) of the queue and handler, which
+    # count and time the events.
+    def wrap(self, handler, queue):
+        def removeFirst():
+            stat = self.queue
+            stat[0] += 1
+            if not self.timed(stat[0]):
+                return queue.removeFirst()
+            st_time = time()
+            e = queue.removeFirst()
+            self.addTime(stat, time() - st_time)
+            return e
+
+        units = handler.units
+
+        def handleEvent(e, queue):
+            kind = (e.type, units[e.unit_id].__class__.__name__
+                    if e.unit_id >= 0 else None)
+            stat = self.kinds.get(kind)
+            if stat is None:
+                stat = self.kinds[kind] = [0, 0, 0.0, 0.0]
+            stat[0] += 1
+            if not self.timed(stat[0]):
+                handler.handleEvent(e, queue)
+                return
+            st_time = time()
+            handler.handleEvent(e, queue)
+            self.addTime(stat, time() - st_time)
+
+        return removeFirst, handleEvent
+
+    # Traces everything until stopTrace(), format is "cprofile" or "folded".
+    def startTrace(self, format_name):
+        if format_name == "cprofile":
+            self.trace = cProfile.Profile()
+        elif format_name == "folded":
+            self.trace = StackSampler()
+        else:
+            raise Exception("Unknown profile format: " + format_name)
+        self.trace_format = format_name
+        self.trace.enable()
+
+    # Writes the trace to file_name, with the extension of its format.
+    # Returns the file name, None if no trace was started.
+    def stopTrace(self, file_name):
+        if self.trace is None:
+            return None
+        self.trace.disable()
+        if self.trace_format == "cprofile":
+            file_name += ".prof"
+        else:
+            file_name += ".folded"
+        self.trace.dump_stats(file_name)
+        self.trace = None
+        return file_name
+
+    # seconds of all events of a kind: the first ones are all timed, those
+    # of the others are estimated from their timed ones(from the first ones
+    # if none of them is timed yet).
+    def estimate(self, stat):
+        count, timed, seconds, first_seconds = stat
+        first = min(count, self.first)
+        if timed == 0:
+            return 0.0
+        if timed == first:
+            return seconds*count/timed
+        return first_seconds + \
+            (seconds - first_seconds)*(count - first)/(timed - first)
+
+    def toJSON(self, iteration):
+        kinds = OrderedDict()
+        for (type_id, unit_class), stat in sorted(self.kinds.items()):
+            name = Event.types[type_id].name
+            if unit_class is not None:
+                name += "/" + unit_class
+            kinds[name] = OrderedDict([("count", stat[0]),
+                                       ("timed", stat[1]),
+                                       ("seconds", self.estimate(stat))])
+        return OrderedDict([
+            ("iteration", iteration), ("sample", self.sample),
+            ("first", self.first),
+            ("phases", self.phases),
+            ("queue", OrderedDict([("count", self.queue[0]),
+                                   ("timed", self.queue[1]),
+                                   ("seconds", self.estimate(self.queue))])),
+            ("events", kinds)])
+
+    # Appends the summary of the iteration to file_name, one json object per
+    # line.
+    def write(self, file_name, iteration):
+        with open(file_name, "a") as fp:
+            fp.write(json.dumps(self.toJSON(iteration)) + "\n")
+
+
+# Table of the summaries written by Profiler.write(), the events by total
+# time. usage: Profiler.py profile_file
+def main():
+    with open(sys.argv[1]) as fp:
+        for line in fp:
+            summary = json.loads(line, object_pairs_hook=OrderedDict)
+            print "iteration %d, first %d and every %d events of a kind " \
+                "timed" % (summary["iteration"], summary.get("first", 0),
+                           summary["sample"])
+            for name, seconds in summary["phases"].items():
+                print "  %-40s %10.3fs" % (name, seconds)
+            rows = summary["events"].items() + [("queue", summary["queue"])]
+            rows.sort(key=lambda row: -row[1]["seconds"])
+            for name, stat in rows:
+                print "  %-40s %10.3fs %10d events %8.1fus/event" % \
+                    (name, stat["seconds"], stat["count"],
+                     stat["seconds"]*1e6/max(stat["count"], 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import sys
+import struct
+from math import log, sqrt, cos, pi
+from random import random
+from time import time
+from zlib import crc32
+
+from numpy import array, zeros, arange, uint64, float64, log1p, \
+    sqrt as np_sqrt, cos as np_cos
+
+MASK = 2**64 - 1
+GOLDEN = 0x9e3779b97f4a7c15
+M1 = 0xbf58476d1ce4e5b9
+M2 = 0x94d049bb133111eb
+# 53 bit integers to floats in [0, 1).
+SCALE = 1.0/2**53
+
+
+# SplitMix64 output function, a bijection of 64 bit integers.
+def mix64(z):
+    z = ((z ^ (z >> 30))*M1) & MASK
+    z = ((z ^ (z >> 27))*M2) & MASK
+    return z ^ (z >> 31)
+
+
+# 64 bit key of a stream from integers, i.e. (master seed, unit id,
+# purpose).
+def streamKey(*values):
+    key = 0
+    for value in values:
+        key = mix64(((key ^ (value & MASK)) + GOLDEN) & MASK)
+    return key
+
+
+# purpose of a name, i.e. of a generator name.
+def purposeID(name):
+    return crc32(name) & 0xffffffff
+
+
+# integer of the bits of a float time, to key a stream by an event time.
+def timeKey(time):
+    return struct.unpack("<Q", struct.pack("<d", time))[0]
+
+
+class RandomStream(object):
+    """
+    Counter based random numbers(SplitMix64): the i-th number of a stream is
+    mix64(key + i*GOLDEN), it only depends on the key and on i, not on the
+    numbers drawn from other streams before. With one stream per unit and
+    purpose(streamKey(master seed, unit id, purpose)), the events of a unit
+    are the same whatever the order units are generated in, or the process
+    generating them.
+
+    Has the random() and randint() methods of the random module, so it can
+    replace it.
+    """
+    __slots__ = ("key", "counter")
+
+    def __init__(self, key, counter=0):
+        self.key = key
+        self.counter = counter
+
+    def next64(self):
+        self.counter += 1
+        return mix64((self.key + self.counter*GOLDEN) & MASK)
+
+    # uniform in [0, 1).
+    def random(self):
+        return (self.next64() >> 11)*SCALE
+
+    # uniform integer in [a, b].
+    def randint(self, a, b):
+        return a + int(self.random()*(b - a + 1))
+
+    # standard normal(Box-Muller).
+    def randn(self):
+        u = self.random()
+        return sqrt(-2.0*log(1.0 - u))*cos(2*pi*self.random())
+
+
+class RandomStreams(object):
+    """
+    RandomStream of many units at once, i.e. the disks of a population, keys
+    and counters are arrays with one item per unit. Every draw gives one
+    number to each unit of the view, and select() makes a view of some of
+    them. Numbers are the same as those of RandomStream.
+    """
+
+    def __init__(self, keys, counters=None, indexes=None):
+        self.keys = array(keys, dtype=uint64)
+        if counters is None:
+            counters = zeros(len(keys), dtype=uint64)
+        self.counters = counters
+        if indexes is None:
+            indexes = arange(len(keys))
+        self.indexes = indexes
+
+    @classmethod
+    def fromUnits(cls, master_seed, unit_ids, purpose):
+        return cls([streamKey(master_seed, unit_id, purpose)
+                    for unit_id in unit_ids])
+
+    def __len__(self):
+        return len(self.indexes)
+
+    # view of the streams at rows(a mask or positions) of this view.
+    def select(self, rows):
+        view = RandomStreams.__new__(RandomStreams)
+        view.keys = self.keys
+        view.counters = self.counters
+        view.indexes = self.indexes[rows]
+        return view
+
+    def next64(self):
+        self.counters[self.indexes] += uint64(1)
+        z = self.keys[self.indexes] + self.counters[self.indexes] * \
+            uint64(GOLDEN)
+        z = (z ^ (z >> uint64(30)))*uint64(M1)
+        z = (z ^ (z >> uint64(27)))*uint64(M2)
+        return z ^ (z >> uint64(31))
+
+    def random_sample(self):
+        return (self.next64() >> uint64(11)).astype(float64)*SCALE
+
+    def randn(self):
+        u = self.random_sample()
+        return np_sqrt(-2.0*log1p(-u))*np_cos(2*pi*self.random_sample())
+
+    # scalar stream of the i-th unit of the view, its draws are kept by
+    # setStream().
+    def getStream(self, i):
+        index = self.indexes[i]
+        return RandomStream(int(self.keys[index]), int(self.counters[index]))
+
+    def setStream(self, i, stream):
+        self.counters[self.indexes[i]] = stream.counter
+
+
+# Draw rate of RandomStream and RandomStreams against the random module, and
+# check that both give the same numbers. Draw count is given on the command
+# line.
+def main():
+    size = 1000000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+
+    st_time = time()
+    for i in xrange(size):
+        random()
+    print "random(): %.0f draws/s" % (size/(time() - st_time))
+
+    stream = RandomStream(streamKey(1, 2, purposeID("failureGenerator")))
+    st_time = time()
+    values = [stream.random() for i in xrange(size)]
+    print "RandomStream.random(): %.0f draws/s" % (size/(time() - st_time))
+
+    streams = RandomStreams.fromUnits(1, [2]*1000,
+                                      purposeID("failureGenerator"))
+    st_time = time()
+    for i in xrange(size/1000):
+        batch = streams.random_sample()
+    print "RandomStreams.random_sample(): %.0f draws/s" % \
+        (size/(time() - st_time))
+    print "same numbers:", batch[0] == values[size/1000 - 1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+from math import sqrt
+
+
+class RunningStat(object):
+    """
+    Running mean and variance of a sample (Welford's algorithm), values are
+    added one at a time and not kept.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # sum of squared differences from the mean.
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(value - self.mean)
+
+    def getCount(self):
+        return self.count
+
+    def getMean(self):
+        return self.mean
+
+    # sample variance, 0 for less than two values.
+    def getVariance(self):
+        if self.count < 2:
+            return 0.0
+        return self.m2/(self.count - 1)
+
+    def getStddev(self):
+        return sqrt(self.getVariance())
+
+    # half width of the normal confidence interval of the mean, z = 1.96 is
+    # the 95% interval.
+    def getHalfWidth(self, z=1.96):
+        if self.count < 2:
+            return float("inf")
+        return z*self.getStddev()/sqrt(self.count)
+
+    def getConfidenceInterval(self, z=1.96):
+        half_width = self.getHalfWidth(z)
+        return self.mean - half_width, self.mean + half_width
+
+    # half width relative to the mean, inf while the mean is 0 (e.g. no data
+    # loss seen yet).
+    def getRelativeError(self, z=1.96):
+        if self.mean == 0:
+            return float("inf")
+        return self.getHalfWidth(z)/abs(self.mean)
+
+    def toString(self, z=1.96):
+        low, high = self.getConfidenceInterval(z)
+        return "mean=%e stddev=%e ci=[%e, %e] n=%d" % \
+            (self.mean, self.getStddev(), low, high, self.count)
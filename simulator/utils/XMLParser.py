@@ -1,5 +1,6 @@
 import os
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
 
 from simulator.unit.Layer import Layer
 from simulator.unit.DataCenter import DataCenter
@@ -7,6 +8,9 @@ from simulator.unit.Rack import Rack
 from simulator.unit.Machine import Machine
 from simulator.unit.Disk import Disk
 from simulator.unit.DiskWithScrubbing import DiskWithScrubbing
+from simulator.unit.DiskPopulation import DiskPopulation
+from simulator.unit.DiskWithScrubbingPopulation import \
+    DiskWithScrubbingPopulation
 
 from simulator.failure.WeibullGenerator import WeibullGenerator
 from simulator.failure.Constant import Constant
@@ -21,11 +25,25 @@ from simulator.Configuration import Configuration, CONF_PATH
 
 class XMLParser(object):
 
-    def __init__(self, layer_id):
+    # rack_count is the number of racks to build, conf.rack_count if not
+    # given. overrides are parameters of the layer xml replaced, a path of
+    # component and eventGenerator names ending with a tag, i.e.
+    # {"disk/failureGenerator/lamda": "87600"}, see setParameter(). conf
+    # defaults to a Configuration read from the conf file.
+    def __init__(self, layer_id, rack_count=None, overrides=None, conf=None):
         layer_path = CONF_PATH + os.sep + "layer_" + str(layer_id) + ".xml"
         self.tree = ET.parse(layer_path)
         self.root = self.tree.getroot()
-        self.conf = Configuration()
+        self.overrides = {} if overrides is None else overrides
+        for path, value in self.overrides.items():
+            self.setParameter(path, value)
+        self.conf = Configuration() if conf is None else conf
+        if rack_count is None:
+            rack_count = self.conf.rack_count
+        self.rack_count = rack_count
+        self.populations = OrderedDict()
+        self.shared_generators = {}
+        self.machine_count = 0
 
     def _component_class(self, class_name):
         name = class_name.split(".")[-1]
@@ -46,6 +64,22 @@ class XMLParser(object):
         else:
             raise Exception("Invalid component class name")
 
+    # population of the units of the component, None if the units are not
+    # generated as a population.
+    def _population(self, component, unit_class):
+        if not self.conf.unit_population:
+            return None
+        if unit_class is DiskWithScrubbing:
+            population_class = DiskWithScrubbingPopulation
+        elif unit_class is Disk:
+            population_class = DiskPopulation
+        else:
+            return None
+
+        if component not in self.populations:
+            self.populations[component] = population_class()
+        return self.populations[component]
+
     def _event_class(self, class_name):
         name = class_name.split(".")[-1]
         name.strip()
@@ -66,9 +100,60 @@ class XMLParser(object):
         else:
             raise Exception("Invalid event class name")
 
+    # node of the path "name/...", every name is the first component or
+    # eventGenerator of that name below the previous one(at any depth).
+    def findNode(self, path):
+        names = path.split("/")
+        node = self.root
+        for name in names:
+            found = None
+            for child in node.iter():
+                if child is not node and \
+                        child.tag in ("component", "eventGenerator") and \
+                        child.findtext("name") == name:
+                    found = child
+                    break
+            if found is None:
+                raise Exception("No component or generator " + name +
+                                " in " + path)
+            node = found
+        return node
+
+    # Sets the text of a tag of the xml. path is "name/.../tag", see
+    # findNode(), i.e. "machine/fail_fraction".
+    def setParameter(self, path, value):
+        names = path.split("/")
+        node = self.findNode("/".join(names[:-1])) if len(names) > 1 \
+            else self.root
+        tag = node.find(names[-1])
+        if tag is None:
+            raise Exception("No tag " + names[-1] + " in " + path)
+        tag.text = str(value)
+
+    # {tag: text} of the parameters of the component or eventGenerator at
+    # path, i.e. "disk/failureGenerator".
+    def getParameters(self, path):
+        node = self.findNode(path)
+        return dict([(child.tag, child.text) for child in node
+                     if child.tag not in ("component", "eventGenerator")])
+
+    # the xml, with the overrides.
+    def toString(self):
+        return ET.tostring(self.root)
+
     def readFile(self):
+        # machine ids start from 0 in every topology, unit ids do as every
+        # topology has a unit table of its own.
+        self.machine_count = 0
+        self.populations = OrderedDict()
+        self.shared_generators = {}
         return self.readComponent(self.root, None)
 
+    # Disk populations of the last readFile(), events of their disks are
+    # returned by population.generateEvents() after the units generated theirs.
+    def getPopulations(self):
+        return self.populations.values()
+
     def readComponent(self, node, parent):
         # self.i += 1
         # print "*"*50
@@ -101,7 +186,7 @@ class XMLParser(object):
             raise Exception("no class name for " + node.tag)
 
         if name.lower() == "rack":
-            count = Configuration.rack_count
+            count = self.rack_count
         elif name.lower() == "machine":
             count = self.conf.machines_per_rack
         elif name.lower() == "disk":
@@ -111,20 +196,31 @@ class XMLParser(object):
         else:
             pass
 
+        unit_class = self._component_class(class_name)
+        population = self._population(component, unit_class)
         units = []
         for i in xrange(count):
             # print "class_name:" + class_name
-            unit_class = self._component_class(class_name)
             units.append(unit_class(name+str(i), parent, attributes))
+            if unit_class is Machine:
+                units[i].my_id = self.machine_count
+                self.machine_count += 1
             # layer is logic, has not failure and recovery events
             if name.lower() != "layer":
-                e_generators = component.iterfind("eventGenerator")
-                # if name.lower() == "disk":
-                #     print "e generators:", e_generators
-                if e_generators is not None:
-                    for event in e_generators:
-                        units[i].addEventGenerator(
-                            self.readEventGenerator(event))
+                if population is not None:
+                    # units of a population share their generators.
+                    for generator in self.readSharedGenerators(component):
+                        units[i].addEventGenerator(generator)
+                else:
+                    e_generators = component.iterfind("eventGenerator")
+                    # if name.lower() == "disk":
+                    #     print "e generators:", e_generators
+                    if e_generators is not None:
+                        for event in e_generators:
+                            units[i].addEventGenerator(
+                                self.readEventGenerator(event))
+            if population is not None:
+                population.addDisk(units[i])
 
         if component is not None:
             next_component = component.find("component")
@@ -135,6 +231,14 @@ class XMLParser(object):
                         units[i].addChild(children[j])
         return units
 
+    # generators of the component, read once.
+    def readSharedGenerators(self, component):
+        if component not in self.shared_generators:
+            self.shared_generators[component] = [
+                self.readEventGenerator(event)
+                for event in component.iterfind("eventGenerator")]
+        return self.shared_generators[component]
+
     def readEventGenerator(self, node):
         name = None
         class_name = None
@@ -161,7 +265,7 @@ if __name__ == "__main__":
     xml = XMLParser(1)
     units = xml.readFile()
     # readComponent(xml.root, None)
-    print units[0].unit_count
+    print len(units[0].getUnits())
     print units[0].getChildren()[0].failure_generator.lamda
     print units[0].failure_generator
     print units[0].getChildren()[0].getChildren()[0].getChildren()[0].getChildren()[0].getParent()